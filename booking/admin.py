@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Event, Booking, Coach, Day, TemplateEvent, ExcludedDate
+from .models import Event, Booking, Coach, Day, TemplateEvent, ExcludedDate, Job
 
 # Register your models here.
 admin.site.register(Event)
@@ -8,3 +8,4 @@ admin.site.register(Coach)
 admin.site.register(Day)
 admin.site.register(TemplateEvent)
 admin.site.register(ExcludedDate)
+admin.site.register(Job)
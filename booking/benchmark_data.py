@@ -0,0 +1,128 @@
+"""
+Synthetic multi-tenant data for benchmarking. Everything is bulk inserted
+with a seeded random generator, so the same arguments always build the
+same dataset. Signals are skipped, so denormalized columns (booked_count,
+company, token balances, user profiles, leaderboards, personal records)
+are filled in directly.
+"""
+import random
+from datetime import time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from booking.models import Booking, Day, Event, TemplateEvent
+from company.models import Coach, Company, Token, TokenBalance, UserProfile, Venue
+from logbook.leaderboard import rebuild_leaderboard
+from logbook.models import Exercise, Score
+from logbook.records import rebuild_personal_records
+
+BENCHMARK_PASSWORD = 'benchmark'
+BATCH_SIZE = 5000
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+EXERCISES = ["Back Squat", "Deadlift", "Bench Press", "Clean", "Snatch", "Strict Press"]
+
+
+def seed_benchmark_data(companies=5, coaches=3, clients=100, venues=2, classes_per_day=8,
+                        days_back=30, days_ahead=30, fill_rate=0.6, tokens_per_client=10,
+                        scores_per_client=20, seed=42, prefix='bench'):
+    """Build the dataset and return a dict of row counts per model."""
+    rng = random.Random(seed)
+    password = make_password(BENCHMARK_PASSWORD)
+    today = timezone.localdate()
+
+    with transaction.atomic():
+        days = {d.id: d for d in Day.objects.all()}
+        for day_id, name in enumerate(DAY_NAMES, start=1):
+            if day_id not in days:
+                days[day_id] = Day.objects.create(id=day_id, day=name)
+        exercises = list(Exercise.objects.filter(name__in=EXERCISES)) or Exercise.objects.bulk_create(
+            [Exercise(name=name) for name in EXERCISES]
+        )
+
+        per_company = 1 + coaches + clients  # manager, coaches, clients
+        users = User.objects.bulk_create([
+            User(username=f'{prefix}-{c}-{n}', email=f'{prefix}-{c}-{n}@example.com', password=password)
+            for c in range(companies) for n in range(per_company)
+        ], batch_size=BATCH_SIZE)
+        company_rows = Company.objects.bulk_create([
+            Company(name=f'{prefix} Gym {c}', manager=users[c * per_company], auto_updates=True)
+            for c in range(companies)
+        ])
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, company=company_rows[index // per_company])
+            for index, user in enumerate(users)
+        ], batch_size=BATCH_SIZE)
+
+        coach_rows, venue_rows, members = [], [], []
+        for c, company in enumerate(company_rows):
+            company_users = users[c * per_company:(c + 1) * per_company]
+            coach_rows.extend(Coach(coach=u, company=company) for u in company_users[:1 + coaches])
+            venue_rows.extend(Venue(name=f'Hall {v}', company=company) for v in range(venues))
+            members.append(company_users[1 + coaches:])
+        coach_rows = Coach.objects.bulk_create(coach_rows)
+        venue_rows = Venue.objects.bulk_create(venue_rows)
+        coaches_by_company = [coach_rows[c * (1 + coaches):(c + 1) * (1 + coaches)] for c in range(companies)]
+        venues_by_company = [venue_rows[c * venues:(c + 1) * venues] for c in range(companies)]
+
+        templates = []
+        for c in range(companies):
+            for day_id in days:
+                for slot in range(classes_per_day):
+                    templates.append(TemplateEvent(
+                        coach=rng.choice(coaches_by_company[c]), venue=rng.choice(venues_by_company[c]),
+                        event_name=f'Class {slot}', description='Benchmark class', day_of_week=days[day_id],
+                        start_time=time(6 + slot, 0), end_time=time(6 + slot, 45), capacity=16,
+                    ))
+        TemplateEvent.objects.bulk_create(templates, batch_size=BATCH_SIZE)
+
+        events = []
+        for c, company in enumerate(company_rows):
+            for offset in range(-days_back, days_ahead):
+                day = today + timedelta(days=offset)
+                for slot in range(classes_per_day):
+                    events.append(Event(
+                        coach=rng.choice(coaches_by_company[c]), company=company,
+                        venue=rng.choice(venues_by_company[c]), event_name=f'Class {slot}',
+                        description='Benchmark class', date_of_event=day,
+                        start_time=time(6 + slot, 0), end_time=time(6 + slot, 45),
+                        capacity=16, status=1 if offset < 0 else 0,
+                    ))
+
+        bookings = []
+        per_company_events = (days_back + days_ahead) * classes_per_day
+        for c in range(companies):
+            for event in events[c * per_company_events:(c + 1) * per_company_events]:
+                attendees = rng.sample(members[c], min(len(members[c]), int(event.capacity * fill_rate)))
+                event.booked_count = len(attendees)
+                bookings.extend(Booking(event=event, user=u, company_id=company_rows[c].pk, event_date=event.date_of_event) for u in attendees)
+        Event.objects.bulk_create(events, batch_size=BATCH_SIZE)
+        bookings = Booking.objects.bulk_create(bookings, batch_size=BATCH_SIZE)
+
+        tokens = [
+            Token(user=b.user, company_id=b.company_id, used=True, booking=b) for b in bookings
+        ]
+        balances = []
+        for c, company in enumerate(company_rows):
+            for member in members[c]:
+                tokens.extend(Token(user=member, company=company) for _ in range(tokens_per_client))
+                balances.append(TokenBalance(user=member, company=company, balance=tokens_per_client))
+        Token.objects.bulk_create(tokens, batch_size=BATCH_SIZE)
+        TokenBalance.objects.bulk_create(balances, batch_size=BATCH_SIZE)
+
+        scores = Score.objects.bulk_create([
+            Score(user=member, exercise=rng.choice(exercises), reps=rng.randint(1, 10),
+                  weight=round(rng.uniform(20, 200), 1))
+            for company_members in members for member in company_members
+            for _ in range(scores_per_client)
+        ], batch_size=BATCH_SIZE)
+        for company in company_rows:
+            rebuild_leaderboard(company=company)
+        rebuild_personal_records(users=users)
+
+    return {
+        'companies': len(company_rows), 'users': len(users), 'templates': len(templates),
+        'events': len(events), 'bookings': len(bookings), 'tokens': len(tokens), 'scores': len(scores),
+    }
@@ -1,8 +1,9 @@
 from django import forms
 from .models import Event, TemplateEvent, Day
+from .utils import duplication_dates
 from django.forms import DateField
 from django.forms.widgets import DateInput, CheckboxSelectMultiple
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from company.models import Venue, Coach
 import logging
 from django.db import connection
@@ -189,4 +190,49 @@ class DuplicateTemplateDayForm(forms.Form):
 
 class BulkDeleteEventsForm(forms.Form):
     start_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
-    end_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
\ No newline at end of file
+    end_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+
+class DuplicateDayForm(forms.Form):
+    MODES = (
+        ('dates', 'On the dates I pick'),
+        ('range', 'Every day in a date range'),
+        ('weekly', 'On this weekday every few weeks'),
+    )
+    mode = forms.ChoiceField(choices=MODES, required=False, widget=forms.RadioSelect, initial='dates')
+    start_date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    end_date = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    every_weeks = forms.IntegerField(required=False, min_value=1, max_value=52, initial=1, label="Every N weeks")
+    until = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}), label="Until")
+
+    def __init__(self, *args, source_date, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.source_date = source_date
+        # Comma-separated list filled in by formScript.js
+        self.fields['dates-sent'] = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        mode = cleaned_data.get('mode') or 'dates'
+        try:
+            if mode == 'dates':
+                try:
+                    dates = [
+                        datetime.strptime(day.strip(), "%Y-%m-%d").date()
+                        for day in cleaned_data.get('dates-sent', '').split(',') if day.strip()
+                    ]
+                except ValueError:
+                    raise ValueError("Dates must be in YYYY-MM-DD format.")
+                dates = duplication_dates(self.source_date, dates=dates)
+            elif mode == 'range':
+                dates = duplication_dates(
+                    self.source_date, start=cleaned_data.get('start_date'), end=cleaned_data.get('end_date')
+                )
+            else:
+                dates = duplication_dates(
+                    self.source_date, every_weeks=cleaned_data.get('every_weeks') or 1,
+                    until=cleaned_data.get('until')
+                )
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+        cleaned_data['target_dates'] = dates
+        return cleaned_data
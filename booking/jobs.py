@@ -0,0 +1,124 @@
+import logging
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Event, Job
+from .utils import duplicate_day, duplication_message, generate_schedule_for_next_30_days, started_events_q
+from company.models import Coach
+
+logger = logging.getLogger(__name__)
+
+# Retry delay doubles with every failed attempt: 30s, 60s, 120s...
+RETRY_BACKOFF_SECONDS = 30
+# A running job becomes claimable again after this long, in case its worker died mid-run
+JOB_LEASE = timedelta(minutes=30)
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register a function as the handler for a job kind."""
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue_job(kind, company, user=None, **payload):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    return Job.objects.create(kind=kind, company=company, created_by=user, payload=payload)
+
+
+def claim_next_job(now=None):
+    """
+    Mark the next due job as running and return it, or None when the queue
+    is empty. skip_locked lets several workers poll the same table. Jobs
+    left running past JOB_LEASE are taken back, since their worker died;
+    the handler's transaction rolled back with it, so running it again is
+    safe.
+    """
+    now = now or timezone.now()
+    due = Q(status='queued', run_after__lte=now) | Q(status='running', started_at__lte=now - JOB_LEASE)
+    with transaction.atomic():
+        while True:
+            job = Job.objects.select_for_update(skip_locked=True).filter(due).order_by('run_after', 'id').first()
+            if job is None:
+                return None
+            if job.status == 'running' and job.attempts >= job.max_attempts:
+                logger.error(f"Job {job.pk} ({job.kind}) abandoned by its worker on the last attempt")
+                job.status = 'failed'
+                job.error = f"Worker stopped during attempt {job.attempts}."
+                job.finished_at = now
+                job.save(update_fields=['status', 'error', 'finished_at'])
+                continue
+            job.status = 'running'
+            job.attempts += 1
+            job.started_at = now
+            job.save(update_fields=['status', 'attempts', 'started_at'])
+            return job
+
+
+def run_job(job):
+    """Run a claimed job, recording the result or scheduling a retry."""
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+        with transaction.atomic():
+            job.result = handler(job) or ''
+        job.status = 'succeeded'
+        job.error = ''
+    except Exception as e:
+        logger.exception(f"Job {job.pk} ({job.kind}) failed on attempt {job.attempts}")
+        job.error = f"{type(e).__name__}: {e}"
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+    if job.is_finished():
+        job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'run_after', 'finished_at'])
+    return job
+
+
+def run_pending_jobs(limit=None):
+    """Run due jobs until the queue is empty or limit is reached. Returns the number run."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+@job_handler('generate_schedule')
+def generate_schedule_job(job):
+    created = generate_schedule_for_next_30_days(job.company)
+    return f"{created} events created for the next 30 days."
+
+
+@job_handler('delete_events')
+def delete_events_job(job):
+    start = datetime.strptime(job.payload['start_date'], "%Y-%m-%d").date()
+    end = datetime.strptime(job.payload['end_date'], "%Y-%m-%d").date()
+    _, deleted_by_model = Event.objects.filter(
+        company=job.company,
+        date_of_event__range=(start, end),
+    ).exclude(started_events_q()).delete()  # Future events only
+    deleted = deleted_by_model.get(Event._meta.label, 0)
+    return f"{deleted} future event(s) deleted."
+
+
+@job_handler('duplicate_day')
+def duplicate_day_job(job):
+    coach = Coach.objects.get(pk=job.payload['coach_id'], company=job.company)
+    source_date = datetime.strptime(job.payload['source_date'], "%Y-%m-%d").date()
+    dates = [datetime.strptime(day, "%Y-%m-%d").date() for day in job.payload['dates']]
+    return duplication_message(duplicate_day(coach, source_date, dates), source_date)
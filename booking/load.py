@@ -0,0 +1,54 @@
+"""
+Concurrent booking load, shared by BookingServiceLoadTest and the
+benchmark_booking_load command. Each target runs on its own thread and
+database connection, and all of them are released together, so the row
+locks in book_event_for_user are actually contended.
+"""
+import threading
+import time
+
+from django.db import connections
+
+from .models import Booking
+from .services import BookingError, book_event_for_user
+
+
+def run_concurrently(targets):
+    """Run every callable at once. Returns the BookingError messages raised and the wall time."""
+    barrier = threading.Barrier(len(targets))
+    errors = []
+
+    def worker(target):
+        try:
+            barrier.wait()
+            target()
+        except BookingError as e:
+            errors.append(str(e))
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in targets]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors, time.perf_counter() - started
+
+
+def book_concurrently(event, members):
+    """
+    Have every member book the event at the same moment. Returns the
+    attempts, bookings made, wall time, bookings/sec and how many seats
+    were booked beyond the event's capacity (which must be zero).
+    """
+    errors, elapsed = run_concurrently([lambda m=m: book_event_for_user(m, event.pk) for m in members])
+    booked = Booking.objects.filter(event=event).count()
+    return {
+        'attempts': len(members),
+        'booked': booked,
+        'errors': errors,
+        'elapsed': elapsed,
+        'bookings_per_sec': booked / elapsed if elapsed else 0.0,
+        'overbooked': max(0, booked - event.capacity),
+    }
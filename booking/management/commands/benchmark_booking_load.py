@@ -0,0 +1,67 @@
+from datetime import date, time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from booking.load import book_concurrently
+from booking.models import Event
+from company.models import Coach, Company, Token, Venue
+
+
+class Command(BaseCommand):
+    help = (
+        "Fires parallel booking requests at one class per round, as BookingServiceLoadTest does, and "
+        "reports bookings/sec. Fails if any class is overbooked. The seeded rows are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=50, help="Members booking at the same moment")
+        parser.add_argument('--capacity', type=int, default=10, help="Seats in each class")
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--prefix', default='loadbench', help="Username and company name prefix")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Booking load needs PostgreSQL row locking.")
+        threads, capacity, rounds = options['threads'], options['capacity'], options['rounds']
+        if threads < 1 or capacity < 1 or rounds < 1:
+            raise CommandError("--threads, --capacity and --rounds must be positive")
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f"Users named {prefix}-* already exist; pick another --prefix.")
+
+        # Committed rather than rolled back: every thread books over its own connection
+        manager = User.objects.create_user(username=f'{prefix}-manager')
+        try:
+            company = Company.objects.create(name=f'{prefix} Gym', manager=manager)
+            coach = Coach.objects.create(coach=manager, company=company)
+            venue = Venue.objects.create(name='Hall', company=company)
+            members = User.objects.bulk_create([User(username=f'{prefix}-{n}') for n in range(threads)])
+            Token.objects.bulk_create([Token(user=m, company=company) for m in members for _ in range(rounds)])
+
+            results = []
+            for n in range(rounds):
+                start = time(6 + n % 14, 0)
+                event = Event.objects.create(
+                    event_name=f'Load {n}', description='Load', coach=coach, venue=venue, capacity=capacity,
+                    date_of_event=date.today() + timedelta(days=1 + n // 14), start_time=start,
+                    end_time=time(start.hour, 45), status=0,
+                )
+                result = book_concurrently(event, members)
+                results.append(result)
+                self.stdout.write(
+                    f"Round {n + 1}: {result['booked']}/{result['attempts']} booked in {result['elapsed']:.3f}s "
+                    f"({result['bookings_per_sec']:.1f} bookings/sec), {result['overbooked']} overbooked"
+                )
+        finally:
+            User.objects.filter(username__startswith=f'{prefix}-').delete()
+
+        booked = sum(result['booked'] for result in results)
+        elapsed = sum(result['elapsed'] for result in results)
+        overbooked = sum(result['overbooked'] for result in results)
+        if overbooked:
+            raise CommandError(f"{overbooked} seats were booked beyond capacity.")
+        self.stdout.write(self.style.SUCCESS(
+            f"{booked} bookings from {threads * rounds} attempts at {booked / elapsed:.1f} bookings/sec, none overbooked."
+        ))
@@ -0,0 +1,92 @@
+import time
+from datetime import date, time as clock, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from booking.models import Booking, Event
+from company.models import Coach, Company, Venue
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Times tenant listings through the coach join against the denormalized company column "
+        "on a seeded dataset. Nothing is kept in the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=100_000, help="Bookings to seed (use 1000000 for the full run)")
+        parser.add_argument('--companies', type=int, default=50, help="Companies the bookings are spread over")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per query")
+
+    def seed(self, bookings, companies):
+        users = User.objects.bulk_create(
+            [User(username=f'tenant-bench-{n}') for n in range(companies * 20)], batch_size=5000
+        )
+        company_rows = Company.objects.bulk_create(
+            [Company(name=f'Tenant Bench {n}', manager=users[n * 20]) for n in range(companies)]
+        )
+        coaches = Coach.objects.bulk_create([Coach(coach=users[n * 20], company=c) for n, c in enumerate(company_rows)])
+        venues = Venue.objects.bulk_create([Venue(name='Hall', company=c) for c in company_rows])
+
+        # 20 seats per class, so bookings / 20 events in total
+        events_per_company = max(1, bookings // 20 // companies)
+        start = date.today()
+        events = Event.objects.bulk_create([
+            Event(
+                coach=coach, company_id=coach.company_id, venue=venue, event_name='Class',
+                description='Benchmark', date_of_event=start + timedelta(days=n // 10),
+                start_time=clock(6 + n % 10), end_time=clock(7 + n % 10), capacity=20, status=0
+            )
+            for coach, venue in zip(coaches, venues)
+            for n in range(events_per_company)
+        ], batch_size=5000)
+
+        batch = []
+        for index, event in enumerate(events):
+            members = users[(index % companies) * 20:(index % companies) * 20 + 20]
+            batch.extend(Booking(event=event, user=u, company_id=event.company_id, event_date=event.date_of_event) for u in members)
+            if len(batch) >= 20_000:
+                Booking.objects.bulk_create(batch)
+                batch = []
+        Booking.objects.bulk_create(batch)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        return company_rows[len(company_rows) // 2], start
+
+    def best_of(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset.all())
+            timings.append(time.perf_counter() - started)
+        return min(timings) * 1000
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        try:
+            with transaction.atomic():
+                started = time.perf_counter()
+                company, day = self.seed(options['bookings'], options['companies'])
+                self.stdout.write(f"Seeded {Booking.objects.count()} bookings in {time.perf_counter() - started:.1f}s")
+
+                cases = [
+                    ("timetable", Event.objects.filter(coach__company=company, date_of_event=day),
+                     Event.objects.filter(company=company, date_of_event=day)),
+                    ("bookings", Booking.objects.filter(event__coach__company=company),
+                     Booking.objects.filter(company=company)),
+                ]
+                for name, joined, local in cases:
+                    self.stdout.write(
+                        f"{name:<10} via coach join: {self.best_of(joined, repeat):8.1f} ms   "
+                        f"via company column: {self.best_of(local, repeat):8.1f} ms"
+                    )
+                raise Rollback
+        except Rollback:
+            pass
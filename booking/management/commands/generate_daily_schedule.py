@@ -1,21 +1,115 @@
-from django.core.management.base import BaseCommand
-from django.utils.timezone import now
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import timedelta
-from company.models import Company 
-from booking.utils import generate_schedule_for_date 
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils.timezone import now
+from company.models import Company
+from booking.utils import materialize_schedule
+
+HORIZON_DAYS = 30
+
+
+def _result(company_id, error=None, seconds=0.0):
+    return {'company_id': company_id, 'name': None, 'created': 0, 'skipped': 0, 'clashes': 0,
+            'error': error, 'seconds': seconds}
+
+
+def generate_for_company(company_id, dates):
+    """
+    Materialize one company's schedule. Runs in a pool worker, so it
+    reports failures in its result instead of raising.
+    """
+    started = time.perf_counter()
+    result = _result(company_id)
+    try:
+        company = Company.objects.get(pk=company_id)
+        result['name'] = company.name
+        summary = materialize_schedule(company, dates)
+        result['created'] = summary['created']
+        result['skipped'] = summary['skipped']
+        result['clashes'] = summary['clashes']
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def _generate_in_worker(company_id, dates):
+    try:
+        return generate_for_company(company_id, dates)
+    finally:
+        connections.close_all()
+
+
+def _init_worker():
+    # Each worker opens its own database connections
+    django.setup()
+    connections.close_all()
+
 
 class Command(BaseCommand):
     help = "Generates schedule 30 days in advance for companies with auto-update enabled."
 
-    def handle(self, *args, **kwargs):
-        target_date = now().date() + timedelta(days=30)
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help="Number of processes to split companies across (default: 1, no pool)."
+        )
+        parser.add_argument(
+            '--days', type=int, default=1,
+            help=f"Number of days to fill, ending {HORIZON_DAYS} days from today (default: 1)."
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        days = options['days']
+        if workers < 1:
+            raise CommandError("--workers must be at least 1")
+        if not 1 <= days <= HORIZON_DAYS + 1:
+            raise CommandError(f"--days must be between 1 and {HORIZON_DAYS + 1}")
+
+        horizon = now().date() + timedelta(days=HORIZON_DAYS)
+        dates = [horizon - timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+        company_ids = list(Company.objects.filter(auto_updates=True).values_list('pk', flat=True))
 
-        companies = Company.objects.filter(auto_updates=True)
+        started = time.perf_counter()
+        if workers == 1 or len(company_ids) <= 1:
+            results = [generate_for_company(company_id, dates) for company_id in company_ids]
+        else:
+            # Don't hand the parent's open connections to forked workers
+            connections.close_all()
+            results = []
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                futures = {pool.submit(_generate_in_worker, company_id, dates): company_id for company_id in company_ids}
+                for future in as_completed(futures):
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        # The worker itself died (e.g. BrokenProcessPool after an OOM kill)
+                        results.append(_result(
+                            futures[future], f"{type(e).__name__}: {e}", time.perf_counter() - started
+                        ))
+        elapsed = time.perf_counter() - started
 
+        results.sort(key=lambda r: r['company_id'])
+        failures = [r for r in results if r['error']]
         total_created = 0
-        for company in companies:
-            created = generate_schedule_for_date(company, target_date)
-            total_created += created
-            self.stdout.write(f"{company.name}: {created} events created")
+        for r in results:
+            label = r['name'] or f"Company {r['company_id']}"
+            if r['error']:
+                self.stderr.write(f"{label}: FAILED after {r['seconds']:.2f}s - {r['error']}")
+                continue
+            total_created += r['created']
+            self.stdout.write(
+                f"{label}: {r['created']} events created, {r['skipped']} skipped, {r['clashes']} clashing ({r['seconds']:.2f}s)"
+            )
 
-        self.stdout.write(self.style.SUCCESS(f"Total events created: {total_created}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Total events created: {total_created} across {len(results) - len(failures)} "
+            f"companies in {elapsed:.2f}s ({dates[0]} to {dates[-1]}, {workers} workers)"
+        ))
+        if failures:
+            raise CommandError(f"{len(failures)} of {len(results)} companies failed")
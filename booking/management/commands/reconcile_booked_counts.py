@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from booking.utils import reconcile_booked_counts
+
+class Command(BaseCommand):
+    help = "Recalculates Event.booked_count from the bookings table and repairs any drift."
+
+    def handle(self, *args, **kwargs):
+        repaired = reconcile_booked_counts()
+        self.stdout.write(self.style.SUCCESS(f"{repaired} events repaired"))
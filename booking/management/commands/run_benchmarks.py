@@ -0,0 +1,152 @@
+import json
+import subprocess
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from booking.benchmark_data import seed_benchmark_data
+from booking.models import Event
+from booking.utils import generate_schedule_for_next_30_days
+from company.models import Company
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds synthetic data at several sizes and times the hot views and services, reporting "
+        "p50/p95 and query counts. All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='50,200,800',
+                            help="Comma separated clients per company to benchmark at (default: 50,200,800)")
+        parser.add_argument('--companies', type=int, default=3)
+        parser.add_argument('--iterations', type=int, default=20, help="Timed runs per target")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help="Write the results as JSON to this file")
+        parser.add_argument('--compare', help="Earlier results JSON to print p50 changes against")
+
+    def targets(self, company):
+        """(name, callable) pairs. Each callable runs one request or service call."""
+        manager = company.manager
+        member = company.userprofile_set.exclude(user=manager).exclude(
+            user__coach__isnull=False
+        ).select_related('user').first().user
+        today = timezone.localdate()
+        event = Event.objects.filter(company=company, date_of_event=today + timedelta(days=1)).exclude(
+            event_booking__user=member
+        ).first()
+
+        member_client, manager_client = Client(), Client()
+        member_client.force_login(member)
+        manager_client.force_login(manager)
+
+        targets = [
+            ('home', lambda: member_client.get(reverse('home'))),
+            ('event_search', lambda: member_client.get(reverse('event_search', args=[today.isoformat()]))),
+        ]
+        if event:  # every class can already hold the member at very small sizes
+            targets.append(('book_event', lambda: member_client.post(reverse('book_event', args=[event.pk]))))
+        return targets + [
+            ('view_bookings', lambda: manager_client.get(reverse('view_bookings'))),
+            ('view_clients', lambda: manager_client.get(reverse('view_clients'))),
+            ('generate_schedule_for_next_30_days', lambda: generate_schedule_for_next_30_days(company)),
+        ]
+
+    def measure(self, target, iterations):
+        timings, queries = [], 0
+        for run in range(iterations + 1):  # the first run warms caches and isn't counted
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    target()
+                    elapsed = time.perf_counter() - started
+                # Undo whatever the target wrote so every run sees the same data
+                transaction.set_rollback(True)
+            if run:
+                timings.append(elapsed * 1000)
+                queries = len(captured.captured_queries)
+        return {
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'queries': queries,
+        }
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError("--sizes must be a comma separated list of integers")
+        previous = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f).get('sizes', {})
+
+        results = {'commit': git_commit(), 'created_at': timezone.now().isoformat(), 'sizes': {}}
+        # Allows the test client's host and keeps email in memory. Under the
+        # test runner the environment is already set up and is left alone.
+        try:
+            setup_test_environment()
+            owns_environment = True
+        except RuntimeError:
+            owns_environment = False
+        try:
+            for size in sizes:
+                try:
+                    with transaction.atomic():
+                        rows = seed_benchmark_data(
+                            companies=options['companies'], clients=size, seed=options['seed'],
+                            prefix=f'runbench{size}',
+                        )
+                        company = Company.objects.filter(name=f'runbench{size} Gym 0').get()
+                        measured = {
+                            name: self.measure(target, options['iterations'])
+                            for name, target in self.targets(company)
+                        }
+                        raise Rollback
+                except Rollback:
+                    pass
+                results['sizes'][str(size)] = {'rows': rows, 'targets': measured}
+                self.report(size, rows, measured, previous.get(str(size), {}).get('targets', {}))
+        finally:
+            if owns_environment:
+                teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def report(self, size, rows, measured, previous):
+        self.stdout.write(f"\n{size} clients/company: {rows['bookings']} bookings, {rows['events']} events")
+        for name, result in measured.items():
+            line = (f"  {name:<36} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+                    f"{result['queries']:4d} queries")
+            if name in previous:
+                before = previous[name]['p50_ms']
+                change = (result['p50_ms'] - before) / before * 100 if before else 0
+                line += f"  ({change:+.0f}% p50, was {previous[name]['queries']} queries)"
+            self.stdout.write(line)
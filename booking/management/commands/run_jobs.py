@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from booking.jobs import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs (schedule generation, bulk deletes, day duplication)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Drain the jobs that are currently due and exit instead of polling."
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=2.0,
+            help="Seconds to wait between polls when the queue is empty (default: 2)."
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            started = time.perf_counter()
+            run_job(job)
+            processed += 1
+            line = f"Job {job.pk} {job.kind}: {job.status} in {time.perf_counter() - started:.2f}s"
+            if job.status == 'succeeded':
+                self.stdout.write(f"{line} - {job.result}")
+            else:
+                self.stderr.write(f"{line} - {job.error}")
+
+        self.stdout.write(self.style.SUCCESS(f"{processed} jobs processed"))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from booking.utils import expire_started_events
+
+class Command(BaseCommand):
+    help = "Marks every event that has started as Past. Run this on a short schedule (e.g. every 10 minutes)."
+
+    def handle(self, *args, **kwargs):
+        moved = expire_started_events()
+        self.stdout.write(self.style.SUCCESS(f"{moved} events marked as past"))
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.17 on 2026-10-17 10:02
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_booked_count(apps, schema_editor):
+    Event = apps.get_model('booking', 'Event')
+    Booking = apps.get_model('booking', 'Booking')
+    counts = Booking.objects.filter(event=OuterRef('pk')).order_by().values('event').annotate(
+        total=Count('pk')).values('total')
+    Event.objects.update(booked_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0009_event_coach_no_show'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='booked_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_booked_count, migrations.RunPython.noop),
+    ]
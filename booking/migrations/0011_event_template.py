@@ -0,0 +1,23 @@
+# Generated by Django 4.2.17 on 2026-10-17 23:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0010_event_booked_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='template',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='generated_events', to='booking.templateevent'),
+        ),
+        migrations.AddConstraint(
+            model_name='event',
+            constraint=models.UniqueConstraint(condition=models.Q(('template__isnull', False)), fields=('template', 'date_of_event'), name='unique_template_event_per_day'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.17 on 2026-10-17 23:39
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def remove_duplicate_bookings(apps, schema_editor):
+    """
+    Keep the first booking per (event, user) so the unique constraint can
+    be added. Tokens spent on the extra bookings go back to the user.
+    """
+    Booking = apps.get_model('booking', 'Booking')
+    Event = apps.get_model('booking', 'Event')
+    Token = apps.get_model('company', 'Token')
+    TokenBalance = apps.get_model('company', 'TokenBalance')
+    TokenLedgerEntry = apps.get_model('company', 'TokenLedgerEntry')
+
+    duplicates = Booking.objects.values('event_id', 'user_id').annotate(
+        first_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+
+    for dup in duplicates:
+        extra = Booking.objects.filter(
+            event_id=dup['event_id'], user_id=dup['user_id']
+        ).exclude(id=dup['first_id'])
+        for token in Token.objects.filter(booking__in=extra, used=True, refunded=False):
+            token.used = False
+            token.booking = None
+            token.save(update_fields=['used', 'booking'])
+            TokenLedgerEntry.objects.create(
+                user_id=token.user_id, company_id=token.company_id, delta=1,
+                reason='release', token=token
+            )
+            updated = TokenBalance.objects.filter(user_id=token.user_id, company_id=token.company_id).update(
+                balance=F('balance') + 1
+            )
+            if not updated:
+                TokenBalance.objects.create(user_id=token.user_id, company_id=token.company_id, balance=1)
+        extra.delete()
+        Event.objects.filter(id=dup['event_id'], booked_count__gte=dup['total'] - 1).update(
+            booked_count=F('booked_count') - (dup['total'] - 1)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0012_job'),
+        ('company', '0021_token_ledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_bookings, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'event'], name='booking_user_event_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['coach', 'date_of_event', 'start_time'], name='event_coach_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['date_of_event', 'start_time'], name='event_date_start_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(fields=('event', 'user'), name='unique_booking_per_user'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_company(apps, schema_editor):
+    Event = apps.get_model('booking', 'Event')
+    Booking = apps.get_model('booking', 'Booking')
+    Coach = apps.get_model('company', 'Coach')
+
+    Event.objects.update(
+        company_id=Subquery(Coach.objects.filter(pk=OuterRef('coach_id')).values('company_id')[:1])
+    )
+    Booking.objects.update(
+        company_id=Subquery(Event.objects.filter(pk=OuterRef('event_id')).values('company_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0023_hot_path_indexes'),
+        ('booking', '0013_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='company',
+            field=models.ForeignKey(
+                null=True, on_delete=django.db.models.deletion.CASCADE,
+                related_name='events', to='company.company'
+            ),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='company',
+            field=models.ForeignKey(
+                null=True, on_delete=django.db.models.deletion.CASCADE,
+                related_name='bookings', to='company.company'
+            ),
+        ),
+        migrations.RunPython(backfill_company, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='event',
+            name='company',
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='events', to='company.company'
+            ),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='company',
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='bookings', to='company.company'
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name='event',
+            name='event_coach_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['company', 'date_of_event', 'start_time'], name='event_company_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['company', 'event'], name='booking_company_event_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.17 on 2026-10-18 00:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0014_event_booking_company'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['venue', 'date_of_event', 'start_time'], name='event_venue_date_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_event_date(apps, schema_editor):
+    Event = apps.get_model('booking', 'Event')
+    Booking = apps.get_model('booking', 'Booking')
+
+    Booking.objects.update(
+        event_date=Subquery(Event.objects.filter(pk=OuterRef('event_id')).values('date_of_event')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0015_event_venue_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='event_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(backfill_event_date, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='booking',
+            name='event_date',
+            field=models.DateField(),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['company', 'event_date', 'id'], name='booking_company_date_idx'),
+        ),
+    ]
@@ -1,19 +1,50 @@
 from django.db import models
+from django.db.models import BooleanField, Exists, ExpressionWrapper, F, OuterRef, Q
 from django.contrib.auth.models import User
-from company.models import Coach, Venue
+from django.utils import timezone
+from company.models import Coach, Company, Venue
 
 STATUS = ((0, 'Active'), (1, 'Expired'))
 EVENT_STATUS = ((0, 'Future'), (1, 'Past'))
+JOB_STATUS = (
+    ('queued', 'Queued'),
+    ('running', 'Running'),
+    ('succeeded', 'Succeeded'),
+    ('failed', 'Failed'),
+)
 
 # Create your models here.
 
 
+class EventQuerySet(models.QuerySet):
+    def timetable(self, user):
+        """
+        Events annotated with everything the day timetable renders, so the
+        page needs no per-event queries.
+        """
+        return self.select_related('coach__coach', 'venue').annotate(
+            user_booked=Exists(
+                Booking.objects.filter(event=OuterRef('pk'), user=user)
+            ),
+            coach_username=F('coach__coach__username'),
+            venue_name=F('venue__name'),
+        ).annotate(
+            full=ExpressionWrapper(
+                Q(booked_count__gte=F('capacity')), output_field=BooleanField()
+            ),
+        )
+
+
 # Event model - to store the events created by the coaches
 class Event(models.Model):
     id = models.AutoField(primary_key=True, unique=True)
     coach = models.ForeignKey(
         Coach, on_delete=models.CASCADE, related_name="coach_on_booking"
     )
+    # Copied from the coach on save so tenant listings filter without a join
+    company = models.ForeignKey(
+        Company, on_delete=models.CASCADE, related_name="events"
+    )
     event_name = models.CharField(max_length=200)
     description = models.TextField()
     date_of_event = models.DateField()
@@ -26,20 +57,54 @@ class Event(models.Model):
     end_time = models.TimeField()
     status = models.IntegerField(choices=EVENT_STATUS)
     coach_no_show = models.BooleanField(default=False)
+    # Kept in step with event_booking by the Booking signals
+    booked_count = models.PositiveIntegerField(default=0)
+    # Set when the event was materialized from a schedule template
+    template = models.ForeignKey(
+        'TemplateEvent', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name="generated_events"
+    )
 
+    objects = EventQuerySet.as_manager()
 
     def number_of_bookings(self):
-        return self.event_booking.count()
+        return self.booked_count
 
     def is_full(self):
-        return self.number_of_bookings() >= self.capacity
+        return self.booked_count >= self.capacity
 
     def is_user_booked(self, user):
         return self.event_booking.filter(user=user).exists()
 
+    def has_started(self, now=None):
+        # Worked out from the clock so read paths never need to write status;
+        # expire_started_events() catches the stored status up periodically.
+        if self.status == 1:
+            return True
+        now = timezone.localtime(now)
+        return (self.date_of_event, self.start_time) <= (now.date(), now.time())
+
     def __str__(self):
         return f"{self.event_name}: {self.date_of_event} @ {self.start_time}"
 
+    class Meta:
+        constraints = [
+            # Backs the idempotency of schedule generation
+            models.UniqueConstraint(
+                fields=['template', 'date_of_event'],
+                condition=Q(template__isnull=False),
+                name='unique_template_event_per_day',
+            ),
+        ]
+        indexes = [
+            # Company timetable: one day in time order
+            models.Index(fields=['company', 'date_of_event', 'start_time'], name='event_company_date_idx'),
+            # Overlap checks and cross-coach day listings
+            models.Index(fields=['date_of_event', 'start_time'], name='event_date_start_idx'),
+            # Venue double-booking checks over a range of days
+            models.Index(fields=['venue', 'date_of_event', 'start_time'], name='event_venue_date_idx'),
+        ]
+
 
 # Booking model - to store the bookings made by the users
 class Booking(models.Model):
@@ -50,6 +115,13 @@ class Booking(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="user_booking"
     )
+    # Copied from the event on save
+    company = models.ForeignKey(
+        Company, on_delete=models.CASCADE, related_name="bookings"
+    )
+    # Copied from the event on save and kept in step by the Event signals,
+    # so the company's booking history pages on an index
+    event_date = models.DateField()
     created_on = models.DateTimeField(auto_now_add=True)
     status = models.IntegerField(choices=STATUS, default=0)
 
@@ -58,6 +130,17 @@ class Booking(models.Model):
 
     class Meta:
         ordering = ["status"]
+        constraints = [
+            # Also serves the (event, user) "already booked" lookup
+            models.UniqueConstraint(fields=['event', 'user'], name='unique_booking_per_user'),
+        ]
+        indexes = [
+            # A user's bookings joined to events for the overlap check
+            models.Index(fields=['user', 'event'], name='booking_user_event_idx'),
+            models.Index(fields=['company', 'event'], name='booking_company_event_idx'),
+            # Company booking history, newest first, seeking on (event date, id)
+            models.Index(fields=['company', 'event_date', 'id'], name='booking_company_date_idx'),
+        ]
 
 class Day(models.Model):
     id = models.AutoField(primary_key=True, unique=True)
@@ -91,3 +174,38 @@ class ExcludedDate(models.Model):
     def __str__(self):
         return f"Excluded: {self.date} by {self.coach}"
 
+
+
+class Job(models.Model):
+    """
+    A unit of background work picked up by the run_jobs worker.
+    Handlers are looked up by kind in booking.jobs.
+    """
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="jobs")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=JOB_STATUS, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_queue_idx'),
+        ]
+
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    def __str__(self):
+        return f"{self.get_kind_display()} ({self.status})"
+
+    def get_kind_display(self):
+        return self.kind.replace('_', ' ').capitalize()
@@ -0,0 +1,119 @@
+"""
+Overlap detection for events.
+
+Candidate events (usually unsaved) are checked against each other and
+against the events already stored for the same coach, venue or booked
+user. The stored events are fetched with one range query for the whole
+batch; the intervals are then grouped per resource and day and swept in
+start order, so a batch of hundreds of events costs one query and an
+n log n sort rather than a query per event.
+"""
+import heapq
+from collections import defaultdict
+from typing import NamedTuple
+
+from django.db.models import Q
+
+from .models import Event
+
+EVENT_FIELDS = ('id', 'event_name', 'coach_id', 'venue_id', 'date_of_event', 'start_time', 'end_time')
+
+
+class Clash(NamedTuple):
+    resource: str  # 'coach', 'venue' or 'user'
+    event: Event  # the candidate that clashes
+    other: Event  # an existing event, or another candidate
+
+    def __str__(self):
+        if self.resource == 'coach':
+            return f"The coach is already running {self.other} at that time."
+        if self.resource == 'venue':
+            return f"The venue is already in use for {self.other} at that time."
+        return f"You are already booked onto {self.other} at that time."
+
+
+def _sweep(intervals):
+    """
+    Yield (candidate, other) for every overlapping pair in one resource's
+    day that involves at least one candidate. intervals are
+    (start, end, is_candidate, event) tuples; touching intervals don't clash.
+    """
+    intervals.sort(key=lambda interval: (interval[0], interval[1]))
+    active = []  # heap of (end, position) for intervals still running
+    for position, (start, end, is_candidate, event) in enumerate(intervals):
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+        for _, earlier in active:
+            other_start, _, other_is_candidate, other = intervals[earlier]
+            if other_start >= end:
+                continue  # zero-length interval at the same start time
+            if is_candidate:
+                yield event, other
+            elif other_is_candidate:
+                yield other, event
+        heapq.heappush(active, (end, position))
+
+
+def _group(candidates, existing, resources):
+    groups = defaultdict(list)
+    for is_candidate, events in ((True, candidates), (False, existing)):
+        for event in events:
+            for resource, key in resources(event):
+                groups[(resource, key, event.date_of_event)].append(
+                    (event.start_time, event.end_time, is_candidate, event)
+                )
+    clashes = []
+    for (resource, _, _), intervals in groups.items():
+        if any(interval[2] for interval in intervals):
+            clashes.extend(Clash(resource, event, other) for event, other in _sweep(intervals))
+    return clashes
+
+
+def _date_range(candidates):
+    dates = [event.date_of_event for event in candidates]
+    return min(dates), max(dates)
+
+
+def find_event_clashes(candidates):
+    """
+    Return a Clash for every candidate that would double-book its coach or
+    venue, whether against a stored event or another candidate. Candidates
+    that are already saved (being edited) are not compared with their
+    stored selves.
+    """
+    candidates = list(candidates)
+    if not candidates:
+        return []
+    existing = Event.objects.filter(
+        Q(coach_id__in={event.coach_id for event in candidates})
+        | Q(venue_id__in={event.venue_id for event in candidates}),
+        date_of_event__range=_date_range(candidates),
+    ).exclude(pk__in=[event.pk for event in candidates if event.pk]).only(*EVENT_FIELDS)
+
+    def resources(event):
+        return (('coach', event.coach_id), ('venue', event.venue_id))
+    return _group(candidates, existing, resources)
+
+
+def find_booking_clashes(user, candidates):
+    """Return a Clash for every candidate event that overlaps one of the user's bookings."""
+    candidates = list(candidates)
+    if not candidates:
+        return []
+    existing = Event.objects.filter(
+        event_booking__user=user,
+        date_of_event__range=_date_range(candidates),
+    ).exclude(pk__in=[event.pk for event in candidates if event.pk]).only(*EVENT_FIELDS)
+    return _group(candidates, existing, lambda event: (('user', user.pk),))
+
+
+def without_clashes(candidates):
+    """
+    Split candidates into those that can be created and the clashes that
+    rule the rest out. A candidate that clashes only with a candidate
+    already turned away is still rejected, which keeps the result stable.
+    """
+    candidates = list(candidates)
+    clashes = find_event_clashes(candidates)
+    rejected = {id(clash.event) for clash in clashes}
+    return [event for event in candidates if id(event) not in rejected], clashes
@@ -0,0 +1,70 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from .models import Event, Booking
+from .overlaps import find_booking_clashes
+from company.models import Token
+
+
+class BookingError(Exception):
+    """Raised when a booking can't be made or cancelled. The message is shown to the user."""
+
+
+def book_event_for_user(user, event_id):
+    """
+    Reserve a seat on the event and spend one of the user's tokens in a
+    single transaction.
+
+    The event row is locked so concurrent bookings for the same class are
+    counted one at a time, and the user row is locked so parallel requests
+    from the same user can't spend one token twice or book overlapping
+    classes. On backends without SELECT ... FOR UPDATE (SQLite) the locks
+    are no-ops.
+    """
+    with transaction.atomic():
+        event = Event.objects.select_for_update(of=('self',)).select_related('venue', 'coach').get(pk=event_id)
+        User.objects.select_for_update().filter(pk=user.pk).exists()
+
+        if event.has_started():
+            raise BookingError("You can't book after the class has started.")
+
+        if event.is_full():
+            raise BookingError("Event is full")
+
+        if event.is_user_booked(user):
+            raise BookingError("You have already booked this event")
+
+        if find_booking_clashes(user, [event]):
+            raise BookingError("You cannot book overlapping events")
+
+        token = Token.objects.select_for_update(skip_locked=True).filter(
+            user=user, used=False, company_id=event.company_id
+        ).first()
+        if not token:
+            raise BookingError("You don't have any available tokens")
+
+        booking = Booking.objects.create(event=event, user=user)
+        token.used = True
+        token.booking = booking
+        token.save(update_fields=['used', 'booking'])
+
+    return booking
+
+
+def cancel_booking_for_user(user, event):
+    """
+    Cancel the user's booking and hand back the token that paid for it.
+    Returns True if a token was returned.
+    """
+    with transaction.atomic():
+        booking = Booking.objects.select_for_update().filter(event=event, user=user).first()
+        if not booking:
+            raise BookingError("You do not have a booking for this event")
+
+        token = Token.objects.select_for_update().filter(user=user, booking=booking, used=True).first()
+        if token:
+            token.used = False
+            token.booking = None
+            token.save(update_fields=['used', 'booking'])
+        booking.delete()
+
+    return token is not None
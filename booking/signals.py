@@ -1,7 +1,42 @@
-from django.db.models.signals import pre_delete
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.db.models.signals import pre_delete, pre_save, post_save
 from django.dispatch import receiver
-from .models import Booking
+from .models import Booking, Event
 from company.models import Token  # Adjust path if needed
+from utils.email import send_custom_email
+
+@receiver(pre_save, sender=Event)
+def set_event_company(sender, instance, **kwargs):
+    if instance.company_id is None and instance.coach_id:
+        instance.company_id = instance.coach.company_id
+
+
+@receiver(pre_save, sender=Booking)
+def set_booking_company(sender, instance, **kwargs):
+    if instance.event_id and (instance.company_id is None or instance.event_date is None):
+        instance.company_id = instance.event.company_id
+        instance.event_date = instance.event.date_of_event
+
+
+@receiver(post_save, sender=Event)
+def sync_booking_event_date(sender, instance, created, **kwargs):
+    if not created:
+        Booking.objects.filter(event=instance).exclude(event_date=instance.date_of_event).update(
+            event_date=instance.date_of_event
+        )
+
+
+@receiver(post_save, sender=Booking)
+def increment_booked_count(sender, instance, created, **kwargs):
+    if created:
+        Event.objects.filter(pk=instance.event_id).update(booked_count=F('booked_count') + 1)
+
+
+@receiver(pre_delete, sender=Booking)
+def decrement_booked_count(sender, instance, **kwargs):
+    Event.objects.filter(pk=instance.event_id, booked_count__gt=0).update(booked_count=F('booked_count') - 1)
+
 
 @receiver(pre_delete, sender=Booking)
 def release_token_on_booking_delete(sender, instance, **kwargs):
@@ -11,9 +46,8 @@ def release_token_on_booking_delete(sender, instance, **kwargs):
     if not token:
         return
 
-    # add the event status update here
-
-    if event.status == 0:
+    # Seats on classes that haven't started yet go back to the user
+    if not event.has_started():
         token.used = False
         token.booking = None
         token.save()
@@ -21,10 +55,6 @@ def release_token_on_booking_delete(sender, instance, **kwargs):
         token.booking = None
         token.save()
 
-from django.contrib.auth.models import User
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from utils.email import send_custom_email
 
 @receiver(post_save, sender=User)
 def send_welcome_email(sender, instance, created, **kwargs):
@@ -0,0 +1,132 @@
+import unittest
+from datetime import date, time, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+
+from booking.models import Booking, Event
+from booking.overlaps import EVENT_FIELDS
+from company.models import Coach, Company, RefundRequest, Token, Venue
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "EXPLAIN plans are checked on PostgreSQL")
+class HotPathIndexTest(TestCase):
+    """
+    Seeds a multi-tenant dataset and checks the planner uses an index for
+    each hot query instead of a sequential scan of the big table.
+    """
+    companies = 20
+    users_per_company = 100
+    days = 60
+    classes_per_day = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([
+            User(username=f'idx{n}') for n in range(cls.companies * cls.users_per_company)
+        ])
+        managers = users[::cls.users_per_company]
+        companies = Company.objects.bulk_create([
+            Company(name=f'Index Gym {n}', manager=manager) for n, manager in enumerate(managers)
+        ])
+        coaches = Coach.objects.bulk_create([Coach(coach=m, company=c) for m, c in zip(managers, companies)])
+        venues = Venue.objects.bulk_create([Venue(name='Hall', company=c) for c in companies])
+
+        start = date.today()
+        events = Event.objects.bulk_create([
+            Event(
+                coach=coach, company=coach.company, venue=venue, event_name='Class', description='Desc',
+                date_of_event=start + timedelta(days=d), start_time=time(6 + h, 0),
+                end_time=time(6 + h, 45), capacity=20, status=0
+            )
+            for coach, venue in zip(coaches, venues)
+            for d in range(cls.days)
+            for h in range(cls.classes_per_day)
+        ], batch_size=2000)
+
+        per_company = cls.days * cls.classes_per_day
+        bookings = []
+        for c in range(cls.companies):
+            company_events = events[c * per_company:(c + 1) * per_company]
+            company_users = users[c * cls.users_per_company:(c + 1) * cls.users_per_company]
+            for i, user in enumerate(company_users):
+                for event in company_events[i % 10::50]:
+                    bookings.append(Booking(event=event, user=user, company_id=event.company_id, event_date=event.date_of_event))
+        bookings = Booking.objects.bulk_create(bookings, batch_size=5000)
+
+        tokens = Token.objects.bulk_create([
+            Token(user=b.user, company_id=b.company_id, used=True, booking=b) for b in bookings
+        ] + [
+            Token(user=user, company=companies[n // cls.users_per_company])
+            for n, user in enumerate(users)
+        ], batch_size=5000)
+        RefundRequest.objects.bulk_create([
+            RefundRequest(user=t.user, token=t, status='Denied') for t in tokens[::5]
+        ], batch_size=5000)
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        cls.company = companies[3]
+        cls.user = users[3 * cls.users_per_company + 7]
+        cls.booking = Booking.objects.filter(user=cls.user).select_related('event').first()
+        cls.event = cls.booking.event
+
+    def assertNoSeqScan(self, queryset, table):
+        plan = queryset.explain()
+        self.assertNotIn(f"Seq Scan on {table}", plan, msg=plan)
+
+    def test_company_timetable(self):
+        self.assertNoSeqScan(
+            Event.objects.filter(company=self.company, date_of_event=self.event.date_of_event)
+            .order_by('start_time'),
+            'booking_event'
+        )
+
+    def test_company_bookings(self):
+        self.assertNoSeqScan(Booking.objects.filter(company=self.company), 'booking_booking')
+
+    def test_company_booking_history_page(self):
+        self.assertNoSeqScan(
+            Booking.objects.filter(company=self.company, event_date__lt=self.event.date_of_event)
+            .order_by('-event_date', '-pk')[:50],
+            'booking_booking'
+        )
+
+    def test_already_booked_lookup(self):
+        self.assertNoSeqScan(Booking.objects.filter(user=self.user, event=self.event), 'booking_booking')
+
+    def test_booking_clash_lookup(self):
+        # The stored-event query find_booking_clashes runs for a batch of candidates
+        self.assertNoSeqScan(
+            Event.objects.filter(
+                event_booking__user=self.user,
+                date_of_event__range=(self.event.date_of_event, self.event.date_of_event + timedelta(days=7)),
+            ).only(*EVENT_FIELDS),
+            'booking_booking'
+        )
+
+    def test_venue_clash_lookup(self):
+        self.assertNoSeqScan(
+            Event.objects.filter(
+                venue_id=self.event.venue_id,
+                date_of_event__range=(self.event.date_of_event, self.event.date_of_event + timedelta(days=7)),
+            ),
+            'booking_event'
+        )
+
+    def test_spendable_token_lookup(self):
+        self.assertNoSeqScan(
+            Token.objects.filter(user=self.user, company=self.company, used=False),
+            'company_token'
+        )
+
+    def test_token_for_booking_lookup(self):
+        self.assertNoSeqScan(Token.objects.filter(booking=self.booking, used=True), 'company_token')
+
+    def test_company_refund_queue(self):
+        self.assertNoSeqScan(
+            RefundRequest.objects.filter(token__company=self.company, status='Pending'),
+            'company_refundrequest'
+        )
@@ -0,0 +1,150 @@
+from datetime import date, time, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from booking.jobs import enqueue_job, run_pending_jobs
+from booking.models import Booking, Day, Event, TemplateEvent
+from booking.overlaps import find_booking_clashes, find_event_clashes, without_clashes
+from booking.utils import materialize_schedule
+from company.models import Coach, Company, Venue
+
+
+class OverlapTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='coach', password='pass1234')
+        self.company = Company.objects.create(name='Overlap Gym', manager=self.user)
+        self.coach = Coach.objects.create(coach=self.user, company=self.company)
+        other_user = User.objects.create_user(username='coach2', password='pass1234')
+        self.other_coach = Coach.objects.create(coach=other_user, company=self.company)
+        self.venue = Venue.objects.create(name='Hall', company=self.company)
+        self.other_venue = Venue.objects.create(name='Studio', company=self.company)
+        self.day = date.today() + timedelta(days=1)
+
+    def event(self, start, end, coach=None, venue=None, day=None, save=False):
+        event = Event(
+            coach=coach or self.coach, company=self.company, venue=venue or self.venue,
+            event_name=f'Class {start:%H%M}', description='Desc', date_of_event=day or self.day,
+            start_time=start, end_time=end, capacity=10, status=0,
+        )
+        if save:
+            event.save()
+        return event
+
+    def test_coach_and_venue_clashes(self):
+        existing = self.event(time(9), time(10), save=True)
+
+        clashes = find_event_clashes([self.event(time(9, 30), time(10, 30))])
+        self.assertEqual(sorted(clash.resource for clash in clashes), ['coach', 'venue'])
+        self.assertEqual({clash.other.pk for clash in clashes}, {existing.pk})
+
+        other_coach = self.event(time(9, 30), time(10, 30), coach=self.other_coach)
+        self.assertEqual([clash.resource for clash in find_event_clashes([other_coach])], ['venue'])
+        elsewhere = self.event(time(9, 30), time(10, 30), coach=self.other_coach, venue=self.other_venue)
+        self.assertEqual(find_event_clashes([elsewhere]), [])
+
+    def test_back_to_back_and_other_days_are_free(self):
+        self.event(time(9), time(10), save=True)
+        candidates = [
+            self.event(time(10), time(11)),
+            self.event(time(8), time(9)),
+            self.event(time(9), time(10), day=self.day + timedelta(days=1)),
+        ]
+        self.assertEqual(find_event_clashes(candidates), [])
+
+    def test_candidates_clash_with_each_other(self):
+        first, second, third = self.event(time(9), time(11)), self.event(time(10), time(12)), self.event(time(12), time(13))
+
+        kept, clashes = without_clashes([first, second, third])
+
+        self.assertEqual(kept, [first, third])
+        self.assertEqual(
+            [tuple(clash) for clash in clashes], [('coach', second, first), ('venue', second, first)]
+        )
+
+    def test_edited_event_does_not_clash_with_itself(self):
+        event = self.event(time(9), time(10), save=True)
+        event.end_time = time(10, 30)
+        self.assertEqual(find_event_clashes([event]), [])
+
+    def test_one_query_for_hundreds_of_candidates(self):
+        for hour in range(6, 20):
+            self.event(time(hour), time(hour, 30), save=True)
+        candidates = [
+            self.event(time(hour, 30), time(hour + 1), day=self.day + timedelta(days=offset))
+            for offset in range(30) for hour in range(6, 20)
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            clashes = find_event_clashes(candidates)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(clashes, [])
+
+    def test_booking_clashes_only_involve_the_users_bookings(self):
+        member = User.objects.create_user(username='member', password='pass1234')
+        booked = self.event(time(9), time(10), save=True)
+        Booking.objects.create(event=booked, user=member)
+        unbooked = self.event(time(11), time(12), save=True)
+
+        overlapping = self.event(time(9, 30), time(10, 30), coach=self.other_coach, venue=self.other_venue, save=True)
+        clashes = find_booking_clashes(member, [overlapping, unbooked])
+        self.assertEqual([(clash.event, clash.other) for clash in clashes], [(overlapping, booked)])
+        self.assertIn("already booked onto", str(clashes[0]))
+
+    def test_create_multi_event_rejects_double_booking(self):
+        self.event(time(10, 30), time(11), venue=self.other_venue, save=True)
+        self.client.login(username='coach', password='pass1234')
+
+        response = self.client.post(reverse('create_multi_event'), {
+            'date_of_event': self.day.isoformat(), 'venue': self.venue.pk, 'start_time': '09:00',
+            'end_time': '10:00', 'frequency': 3, 'gap': 0, 'event_name': 'Block', 'description': 'Desc',
+            'capacity': 10, 'status': 0, 'coach': self.coach.pk,
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "The coach is already running")
+        self.assertEqual(Event.objects.count(), 1)
+
+    def test_create_event_rejects_venue_clash(self):
+        self.event(time(9), time(10), coach=self.other_coach, save=True)
+        self.client.login(username='coach', password='pass1234')
+
+        response = self.client.post(reverse('create_event'), {
+            'coach': self.coach.pk, 'event_name': 'Spin', 'description': 'Desc',
+            'date_of_event': self.day.isoformat(), 'venue': self.venue.pk, 'capacity': 10,
+            'start_time': '09:45', 'end_time': '10:45', 'status': 0,
+        })
+
+        self.assertContains(response, "The venue is already in use")
+        self.assertEqual(Event.objects.count(), 1)
+
+    def test_duplicate_job_skips_clashing_copies(self):
+        source = self.event(time(9), time(10), save=True)
+        self.event(time(11), time(12), save=True)
+        target = self.day + timedelta(days=1)
+        self.event(time(9, 30), time(10, 30), coach=self.other_coach, day=target, save=True)
+
+        job = enqueue_job('duplicate_day', self.company, self.user, coach_id=self.coach.pk,
+                          source_date=source.date_of_event.isoformat(), dates=[target.isoformat()])
+        run_pending_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
+        self.assertIn("1 skipped because the coach or venue was already booked", job.result)
+        self.assertEqual(Event.objects.filter(date_of_event=target, coach=self.coach).count(), 1)
+
+    def test_materialize_skips_clashing_templates(self):
+        day = Day.objects.create(id=self.day.weekday() + 1, day=self.day.strftime('%A'))
+        for coach, start in ((self.coach, time(9)), (self.other_coach, time(9, 30))):
+            TemplateEvent.objects.create(
+                coach=coach, venue=self.venue, event_name='Template', description='Desc',
+                day_of_week=day, start_time=start, end_time=time(start.hour + 1, start.minute), capacity=10
+            )
+
+        summary = materialize_schedule(self.company, [self.day])
+
+        self.assertEqual((summary['created'], summary['clashes']), (1, 1))
+        self.assertEqual(Event.objects.get().coach, self.coach)
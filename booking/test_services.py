@@ -0,0 +1,133 @@
+import logging
+import unittest
+from datetime import date, time, timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from booking.load import book_concurrently, run_concurrently
+from booking.models import Booking, Event
+from booking.services import BookingError, book_event_for_user, cancel_booking_for_user
+from company.models import Coach, Company, Token, Venue
+
+logger = logging.getLogger(__name__)
+
+
+def make_event(coach, venue, capacity, start=time(10, 0), end=time(11, 0)):
+    return Event.objects.create(
+        event_name="Service Class",
+        date_of_event=date.today() + timedelta(days=1),
+        coach=coach,
+        status=0,
+        description='Desc',
+        venue=venue,
+        start_time=start,
+        end_time=end,
+        capacity=capacity
+    )
+
+
+class BookingServiceTest(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(username='manager', password='pass1234')
+        self.company = Company.objects.create(name='Service Gym', manager=self.manager)
+        self.coach = Coach.objects.create(coach=self.manager, company=self.company)
+        self.venue = Venue.objects.create(name='Service Venue', company=self.company)
+        self.member = User.objects.create_user(username='member', password='pass1234')
+        self.event = make_event(self.coach, self.venue, capacity=1)
+
+    def test_booking_spends_exactly_one_token(self):
+        Token.objects.create(user=self.member, company=self.company)
+        Token.objects.create(user=self.member, company=self.company)
+
+        booking = book_event_for_user(self.member, self.event.pk)
+
+        self.assertEqual(Token.objects.filter(user=self.member, used=True, booking=booking).count(), 1)
+        self.assertEqual(Token.objects.filter(user=self.member, used=False).count(), 1)
+
+    def test_full_event_rejected_and_token_kept(self):
+        other = User.objects.create_user(username='other', password='pass1234')
+        Booking.objects.create(event=self.event, user=other)
+        token = Token.objects.create(user=self.member, company=self.company)
+
+        with self.assertRaisesMessage(BookingError, "Event is full"):
+            book_event_for_user(self.member, self.event.pk)
+
+        token.refresh_from_db()
+        self.assertFalse(token.used)
+
+    def test_cancel_returns_token(self):
+        Token.objects.create(user=self.member, company=self.company)
+        book_event_for_user(self.member, self.event.pk)
+
+        self.assertTrue(cancel_booking_for_user(self.member, self.event))
+        self.assertFalse(Booking.objects.filter(event=self.event).exists())
+        self.assertEqual(Token.objects.filter(user=self.member, used=False).count(), 1)
+
+    def test_cancel_without_booking(self):
+        with self.assertRaisesMessage(BookingError, "You do not have a booking for this event"):
+            cancel_booking_for_user(self.member, self.event)
+
+    @unittest.skipIf(connection.vendor == 'postgresql', "Checks the refusal on other databases")
+    def test_load_benchmark_needs_postgres(self):
+        with self.assertRaisesMessage(CommandError, "needs PostgreSQL"):
+            call_command('benchmark_booking_load', stdout=StringIO())
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Row locking needs PostgreSQL")
+class BookingServiceLoadTest(TransactionTestCase):
+    """
+    Fires parallel booking requests at one class and checks nobody is
+    overbooked and no token is spent twice. The booking rate is logged;
+    benchmark_booking_load reports it for a real run.
+    """
+    threads = 50
+    capacity = 10
+
+    def setUp(self):
+        manager = User.objects.create_user(username='loadmanager', password='pass1234')
+        self.company = Company.objects.create(name='Load Gym', manager=manager)
+        self.coach = Coach.objects.create(coach=manager, company=self.company)
+        self.venue = Venue.objects.create(name='Load Venue', company=self.company)
+
+    def test_parallel_bookings_never_overbook(self):
+        event = make_event(self.coach, self.venue, capacity=self.capacity)
+        members = []
+        for i in range(self.threads):
+            member = User.objects.create_user(username=f'loaduser{i}', password='pass1234')
+            Token.objects.create(user=member, company=self.company)
+            members.append(member)
+
+        result = book_concurrently(event, members)
+
+        self.assertEqual((result['booked'], result['overbooked']), (self.capacity, 0))
+        self.assertEqual(Token.objects.filter(used=True).count(), self.capacity)
+        self.assertEqual(result['errors'].count("Event is full"), self.threads - self.capacity)
+        logger.info("%d parallel booking attempts in %.3fs (%.1f bookings/sec)",
+                    result['attempts'], result['elapsed'], result['bookings_per_sec'])
+
+    def test_same_token_never_spent_twice(self):
+        member = User.objects.create_user(username='spender', password='pass1234')
+        Token.objects.create(user=member, company=self.company)
+        events = [
+            make_event(self.coach, self.venue, capacity=5, start=time(h, 0), end=time(h, 30))
+            for h in range(6, 16)
+        ]
+
+        run_concurrently([lambda e=e: book_event_for_user(member, e.pk) for e in events])
+
+        self.assertEqual(Booking.objects.filter(user=member).count(), 1)
+        self.assertEqual(Token.objects.filter(user=member, used=True).count(), 1)
+
+    def test_benchmark_command_reports_rate_and_cleans_up(self):
+        out = StringIO()
+        call_command('benchmark_booking_load', threads=12, capacity=4, rounds=2, stdout=out)
+
+        self.assertIn("8 bookings from 24 attempts", out.getvalue())
+        self.assertIn("none overbooked", out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith='loadbench-').exists())
+        self.assertFalse(Company.objects.filter(name='loadbench Gym').exists())
@@ -0,0 +1,470 @@
+import unittest
+
+from django.test import TestCase, TransactionTestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from unittest.mock import patch
+from django.contrib.auth.models import User
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+from io import StringIO
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+from company.models import Company, Venue, Coach, Token
+from booking.jobs import enqueue_job, run_pending_jobs
+from booking.load import run_concurrently
+from booking.management.commands.generate_daily_schedule import generate_for_company
+from booking.overlaps import without_clashes
+from booking.models import Event, Booking, Day, TemplateEvent
+from booking.utils import (
+    duplicate_day, duplication_dates, expire_started_events, materialize_schedule, reconcile_booked_counts,
+    MAX_DUPLICATE_DATES,
+)
+
+
+class EventStatusTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='statususer', password='pass1234')
+        self.company = Company.objects.create(name='Status Gym', manager=self.user)
+        self.venue = Venue.objects.create(name='Status Venue', company=self.company)
+        self.coach = Coach.objects.create(coach=self.user, company=self.company)
+        self.now = timezone.make_aware(datetime(2030, 1, 15, 12, 0))
+
+    def make_event(self, day, start):
+        return Event.objects.create(
+            event_name='Status Event',
+            date_of_event=day,
+            coach=self.coach,
+            status=0,
+            description='Desc',
+            venue=self.venue,
+            start_time=start,
+            end_time=time(23, 0),
+            capacity=10
+        )
+
+    def test_expire_moves_only_started_events(self):
+        today = self.now.date()
+        yesterday = self.make_event(today - timedelta(days=1), time(18, 0))
+        this_morning = self.make_event(today, time(9, 0))
+        this_evening = self.make_event(today, time(18, 0))
+        tomorrow = self.make_event(today + timedelta(days=1), time(9, 0))
+
+        self.assertEqual(expire_started_events(self.now), 2)
+
+        for event, status in [(yesterday, 1), (this_morning, 1), (this_evening, 0), (tomorrow, 0)]:
+            event.refresh_from_db()
+            self.assertEqual(event.status, status)
+
+        # Nothing left to move on a second tick
+        self.assertEqual(expire_started_events(self.now), 0)
+
+    def test_has_started_reads_the_clock_without_writing(self):
+        event = self.make_event(self.now.date(), time(9, 0))
+        with self.assertNumQueries(0):
+            self.assertTrue(event.has_started(self.now))
+        event.refresh_from_db()
+        self.assertEqual(event.status, 0)
+
+        later = self.make_event(self.now.date(), time(13, 0))
+        self.assertFalse(later.has_started(self.now))
+
+    def test_deleting_a_booking_on_a_started_class_keeps_the_token_spent(self):
+        member = User.objects.create_user(username='statusmember', password='pass1234')
+        started = self.make_event(timezone.localdate() - timedelta(days=1), time(9, 0))  # still stored as Future
+        upcoming = self.make_event(timezone.localdate() + timedelta(days=1), time(9, 0))
+        for event in (started, upcoming):
+            booking = Booking.objects.create(event=event, user=member)
+            Token.objects.create(user=member, company=self.company, used=True, booking=booking)
+
+        Booking.objects.filter(user=member).delete()
+
+        self.assertEqual(Token.objects.filter(user=member, used=True).count(), 1)
+        self.assertEqual(Token.objects.filter(user=member, used=False).count(), 1)
+
+    def test_delete_events_job_leaves_started_events(self):
+        today = timezone.localdate()
+        started = self.make_event(today - timedelta(days=1), time(9, 0))  # still stored as Future
+        upcoming = self.make_event(today + timedelta(days=1), time(9, 0))
+        enqueue_job('delete_events', self.company, self.user, start_date=(today - timedelta(days=2)).isoformat(),
+                    end_date=(today + timedelta(days=2)).isoformat())
+
+        run_pending_jobs()
+
+        self.assertTrue(Event.objects.filter(pk=started.pk).exists())
+        self.assertFalse(Event.objects.filter(pk=upcoming.pk).exists())
+
+    def test_update_event_statuses_command_reports_count(self):
+        self.make_event(timezone.localdate() - timedelta(days=1), time(9, 0))
+        out = StringIO()
+        call_command('update_event_statuses', stdout=out)
+        self.assertIn("1 events marked as past", out.getvalue())
+
+
+class BookedCountTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='countuser', password='pass1234')
+        self.company = Company.objects.create(name='Count Gym', manager=self.user)
+        self.venue = Venue.objects.create(name='Count Venue', company=self.company)
+        self.coach = Coach.objects.create(coach=self.user, company=self.company)
+        self.event = Event.objects.create(
+            event_name='Count Event',
+            date_of_event=timezone.localdate() + timedelta(days=1),
+            coach=self.coach,
+            status=0,
+            description='Desc',
+            venue=self.venue,
+            start_time=time(9, 0),
+            end_time=time(10, 0),
+            capacity=2
+        )
+
+    def test_booked_count_follows_bookings(self):
+        booking = Booking.objects.create(event=self.event, user=self.user)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.booked_count, 1)
+
+        booking.delete()
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.booked_count, 0)
+
+    def test_reconcile_repairs_drift(self):
+        Booking.objects.create(event=self.event, user=self.user)
+        Event.objects.filter(pk=self.event.pk).update(booked_count=5)
+
+        out = StringIO()
+        call_command('reconcile_booked_counts', stdout=out)
+        self.assertIn("1 events repaired", out.getvalue())
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.booked_count, 1)
+        self.assertEqual(reconcile_booked_counts(), 0)
+
+
+class MaterializeScheduleTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='scheduser', password='pass1234')
+        self.company = Company.objects.create(name='Schedule Gym', manager=self.user)
+        self.venue = Venue.objects.create(name='Schedule Venue', company=self.company)
+        self.coach = Coach.objects.create(coach=self.user, company=self.company)
+        names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+        self.days = [Day.objects.create(id=i + 1, day=name) for i, name in enumerate(names)]
+        self.dates = [timezone.localdate() + timedelta(days=offset) for offset in range(14)]
+
+    def add_templates(self, per_day):
+        for day in self.days:
+            for hour in range(per_day):
+                TemplateEvent.objects.create(
+                    coach=self.coach, venue=self.venue, event_name=f'Class {hour}',
+                    description='Desc', day_of_week=day, start_time=time(6 + hour, 0),
+                    end_time=time(6 + hour, 45), capacity=10
+                )
+
+    def test_creates_each_template_once_per_matching_date(self):
+        self.add_templates(per_day=2)
+        summary = materialize_schedule(self.company, self.dates)
+
+        self.assertEqual(summary['created'], 28)
+        self.assertEqual(summary['skipped'], 0)
+        monday = next(d for d in self.dates if d.weekday() == 0)
+        self.assertEqual(Event.objects.filter(date_of_event=monday, template__day_of_week_id=1).count(), 2)
+
+    def test_rerun_skips_existing_events(self):
+        self.add_templates(per_day=2)
+        materialize_schedule(self.company, self.dates)
+        summary = materialize_schedule(self.company, self.dates)
+
+        self.assertEqual(summary['created'], 0)
+        self.assertEqual(summary['skipped'], 28)
+        self.assertEqual(Event.objects.count(), 28)
+
+    def test_rows_inserted_by_a_concurrent_run_are_not_counted(self):
+        self.add_templates(per_day=2)
+        monday = next(d for d in self.dates if d.weekday() == 0)
+        template = TemplateEvent.objects.filter(day_of_week_id=1).first()
+
+        def concurrent_insert(events):
+            # Another run creates one of the slots after this run checked the window
+            result = without_clashes(events)
+            Event.objects.create(
+                coach=self.coach, venue=self.venue, template=template, event_name='Other run',
+                description='Desc', date_of_event=monday, start_time=template.start_time,
+                end_time=template.end_time, capacity=10, status=0
+            )
+            return result
+
+        with patch('booking.utils.without_clashes', side_effect=concurrent_insert):
+            summary = materialize_schedule(self.company, self.dates)
+
+        self.assertEqual((summary['created'], summary['skipped']), (27, 1))
+        self.assertEqual(Event.objects.count(), 28)
+
+    def test_inactive_templates_ignored(self):
+        self.add_templates(per_day=1)
+        TemplateEvent.objects.update(active=False)
+        self.assertEqual(materialize_schedule(self.company, self.dates)['created'], 0)
+
+    def test_query_count_does_not_grow_with_templates(self):
+        self.add_templates(per_day=1)
+        with CaptureQueriesContext(connection) as small:
+            materialize_schedule(self.company, self.dates)
+        Event.objects.all().delete()
+        self.add_templates(per_day=5)
+        with CaptureQueriesContext(connection) as large:
+            materialize_schedule(self.company, self.dates)
+        self.assertEqual(len(small), len(large))
+
+
+class DuplicateDayTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='dupcoach', password='pass1234')
+        self.company = Company.objects.create(name='Duplicate Gym', manager=self.user)
+        self.venue = Venue.objects.create(name='Duplicate Venue', company=self.company)
+        self.coach = Coach.objects.create(coach=self.user, company=self.company)
+        self.source = timezone.localdate() + timedelta(days=1)
+        for hour in range(6, 10):
+            Event.objects.create(
+                coach=self.coach, venue=self.venue, event_name=f'Class {hour}', description='Desc',
+                date_of_event=self.source, start_time=time(hour, 0), end_time=time(hour, 45),
+                capacity=10, status=0
+            )
+
+    def test_range_and_weekly_dates(self):
+        self.assertEqual(
+            duplication_dates(self.source, start=self.source, end=self.source + timedelta(days=3)),
+            [self.source + timedelta(days=n) for n in (1, 2, 3)]
+        )
+        self.assertEqual(
+            duplication_dates(self.source, every_weeks=2, until=self.source + timedelta(weeks=5)),
+            [self.source + timedelta(weeks=2), self.source + timedelta(weeks=4)]
+        )
+        with self.assertRaises(ValueError):
+            duplication_dates(self.source, every_weeks=1, until=self.source)
+        with self.assertRaises(ValueError):
+            duplication_dates(self.source, start=self.source, end=self.source + timedelta(days=MAX_DUPLICATE_DATES + 1))
+
+    def test_copies_once_and_reruns_skip(self):
+        dates = duplication_dates(self.source, every_weeks=1, until=self.source + timedelta(weeks=10))
+
+        summary = duplicate_day(self.coach, self.source, dates)
+        self.assertEqual((summary['created'], summary['skipped']), (40, 0))
+        self.assertEqual(Event.objects.filter(company=self.company).count(), 44)
+
+        summary = duplicate_day(self.coach, self.source, dates)
+        self.assertEqual((summary['created'], summary['skipped']), (0, 40))
+
+    def test_query_count_does_not_grow_with_dates(self):
+        with CaptureQueriesContext(connection) as small:
+            duplicate_day(self.coach, self.source, [self.source + timedelta(days=1)])
+        with CaptureQueriesContext(connection) as large:
+            duplicate_day(self.coach, self.source, [self.source + timedelta(days=n) for n in range(2, 200)])
+        # Inserts are batched (smaller batches on SQLite); the reads must stay constant
+        def reads(queries):
+            return [q for q in queries.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(len(reads(small)), len(reads(large)))
+        self.assertEqual(Event.objects.count(), 4 * 200)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Row locking needs PostgreSQL")
+class ConcurrentDuplicateDayTest(TransactionTestCase):
+    def test_overlapping_copies_insert_each_event_once(self):
+        user = User.objects.create_user(username='racecoach', password='pass1234')
+        company = Company.objects.create(name='Race Gym', manager=user)
+        venue = Venue.objects.create(name='Race Venue', company=company)
+        coach = Coach.objects.create(coach=user, company=company)
+        source = timezone.localdate() + timedelta(days=1)
+        for hour in range(6, 10):
+            Event.objects.create(
+                coach=coach, venue=venue, event_name=f'Class {hour}', description='Desc',
+                date_of_event=source, start_time=time(hour, 0), end_time=time(hour, 45),
+                capacity=10, status=0
+            )
+        dates = [source + timedelta(days=n) for n in range(1, 8)]
+
+        run_concurrently([lambda: duplicate_day(coach, source, dates) for _ in range(4)])
+
+        self.assertEqual(Event.objects.filter(coach=coach, date_of_event__in=dates).count(), 28)
+
+
+class GenerateDailyScheduleCommandTest(TestCase):
+    def setUp(self):
+        names = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+        days = [Day.objects.create(id=i + 1, day=name) for i, name in enumerate(names)]
+        self.companies = []
+        for n in range(2):
+            user = User.objects.create_user(username=f'auto{n}', password='pass1234')
+            company = Company.objects.create(name=f'Auto Gym {n}', manager=user, auto_updates=True)
+            coach = Coach.objects.create(coach=user, company=company)
+            venue = Venue.objects.create(name=f'Auto Venue {n}', company=company)
+            for day in days:
+                TemplateEvent.objects.create(
+                    coach=coach, venue=venue, event_name='Auto Class', description='Desc',
+                    day_of_week=day, start_time=time(7, 0), end_time=time(8, 0), capacity=10
+                )
+            self.companies.append(company)
+
+    def test_fills_requested_days_for_each_company(self):
+        out = StringIO()
+        call_command('generate_daily_schedule', days=7, stdout=out)
+
+        self.assertEqual(Event.objects.count(), 14)
+        self.assertIn("Auto Gym 0: 7 events created, 0 skipped", out.getvalue())
+        self.assertIn("Total events created: 14 across 2 companies", out.getvalue())
+
+    def test_one_failing_company_does_not_stop_the_rest(self):
+        from booking.utils import materialize_schedule as real
+
+        def flaky(company, dates):
+            if company.pk == self.companies[0].pk:
+                raise RuntimeError("boom")
+            return real(company, dates)
+
+        out, err = StringIO(), StringIO()
+        with patch('booking.management.commands.generate_daily_schedule.materialize_schedule', side_effect=flaky):
+            with self.assertRaisesMessage(CommandError, "1 of 2 companies failed"):
+                call_command('generate_daily_schedule', stdout=out, stderr=err)
+
+        self.assertIn("Auto Gym 0: FAILED", err.getvalue())
+        self.assertEqual(Event.objects.filter(coach__company=self.companies[1]).count(), 1)
+
+    def test_dead_pool_worker_is_reported_with_the_rest(self):
+        command = 'booking.management.commands.generate_daily_schedule'
+        out, err = StringIO(), StringIO()
+        with patch(f'{command}.ProcessPoolExecutor', InlinePool), patch(f'{command}.connections'), \
+                patch.object(InlinePool, 'broken', {self.companies[0].pk}):
+            with self.assertRaisesMessage(CommandError, "1 of 2 companies failed"):
+                call_command('generate_daily_schedule', workers=2, stdout=out, stderr=err)
+
+        self.assertIn(f"Company {self.companies[0].pk}: FAILED", err.getvalue())
+        self.assertIn("BrokenProcessPool", err.getvalue())
+        self.assertIn("Auto Gym 1: 1 events created", out.getvalue())
+        self.assertIn("Total events created: 1 across 1 companies", out.getvalue())
+
+    def test_pool_runs_every_company(self):
+        command = 'booking.management.commands.generate_daily_schedule'
+        out = StringIO()
+        with patch(f'{command}.ProcessPoolExecutor', InlinePool), patch(f'{command}.connections'):
+            call_command('generate_daily_schedule', workers=2, stdout=out)
+
+        self.assertIn("Total events created: 2 across 2 companies", out.getvalue())
+        self.assertIn("2 workers", out.getvalue())
+
+
+class InlinePool:
+    """Stands in for ProcessPoolExecutor, running each company in this process."""
+    broken = set()  # company ids whose worker "dies"
+
+    def __init__(self, max_workers, initializer):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, company_id, dates):
+        future = Future()
+        if company_id in self.broken:
+            future.set_exception(BrokenProcessPool("A child process terminated abruptly"))
+        else:
+            future.set_result(generate_for_company(company_id, dates))
+        return future
+
+
+class EventCompanyTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tenantuser', password='pass1234')
+        self.company = Company.objects.create(name='Tenant Gym', manager=self.user)
+        self.venue = Venue.objects.create(name='Tenant Venue', company=self.company)
+        self.coach = Coach.objects.create(coach=self.user, company=self.company)
+
+    def test_company_copied_on_create(self):
+        event = Event.objects.create(
+            event_name='Tenant Event', date_of_event=timezone.localdate(), coach=self.coach,
+            status=0, description='Desc', venue=self.venue,
+            start_time=time(9, 0), end_time=time(10, 0), capacity=5
+        )
+        booking = Booking.objects.create(event=event, user=self.user)
+
+        self.assertEqual(event.company_id, self.company.pk)
+        self.assertEqual(booking.company_id, self.company.pk)
+
+    def test_saving_an_event_with_a_company_skips_the_coach_lookup(self):
+        event = Event.objects.create(
+            event_name='Tenant Event', date_of_event=timezone.localdate(), coach=self.coach,
+            status=0, description='Desc', venue=self.venue,
+            start_time=time(9, 0), end_time=time(10, 0), capacity=5
+        )
+        event = Event.objects.get(pk=event.pk)
+        event.capacity = 6
+        with CaptureQueriesContext(connection) as queries:
+            event.save()
+        self.assertFalse([q for q in queries if 'company_coach' in q['sql']])
+
+    def test_event_date_copied_and_kept_in_step(self):
+        event = Event.objects.create(
+            event_name='Tenant Event', date_of_event=timezone.localdate(), coach=self.coach,
+            status=0, description='Desc', venue=self.venue,
+            start_time=time(9, 0), end_time=time(10, 0), capacity=5
+        )
+        booking = Booking.objects.create(event=event, user=self.user)
+        self.assertEqual(booking.event_date, event.date_of_event)
+
+        event.date_of_event += timedelta(days=2)
+        event.save()
+        booking.refresh_from_db()
+        self.assertEqual(booking.event_date, event.date_of_event)
+
+    def test_tenant_filters_need_no_join(self):
+        with CaptureQueriesContext(connection) as queries:
+            list(Event.objects.filter(company=self.company, date_of_event=timezone.localdate()))
+            list(Booking.objects.filter(company=self.company))
+        for query in queries:
+            self.assertNotIn('JOIN', query['sql'])
+
+
+class BenchmarkDataTest(TestCase):
+    def test_seed_is_deterministic_and_fills_denormalized_columns(self):
+        from booking.benchmark_data import seed_benchmark_data
+        from company.models import Token, TokenBalance
+
+        counts = seed_benchmark_data(companies=2, coaches=1, clients=5, classes_per_day=2,
+                                     days_back=1, days_ahead=2, scores_per_client=1, prefix='a')
+        self.assertEqual(counts['users'], 2 * 7)
+        self.assertEqual(counts['events'], 2 * 3 * 2)
+        first = list(Booking.objects.order_by('pk').values_list('event__event_name', 'user__username'))
+
+        Booking.objects.all().delete()
+        seed_benchmark_data(companies=2, coaches=1, clients=5, classes_per_day=2,
+                            days_back=1, days_ahead=2, scores_per_client=1, prefix='a2')
+        second = list(Booking.objects.order_by('pk').values_list('event__event_name', 'user__username'))
+        self.assertEqual([name for name, _ in first], [name for name, _ in second])
+        self.assertEqual([u[2:] for _, u in first], [u[3:] for _, u in second])
+
+        event = Event.objects.filter(booked_count__gt=0).first()
+        self.assertEqual(event.booked_count, event.event_booking.count())
+        self.assertEqual(event.company_id, event.coach.company_id)
+        balance = TokenBalance.objects.first()
+        self.assertEqual(
+            balance.balance,
+            Token.objects.filter(user=balance.user, company=balance.company, used=False).count()
+        )
+
+    def test_run_benchmarks_writes_results_and_rolls_back(self):
+        import json
+        import tempfile
+
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('run_benchmarks', sizes='20', companies=1, iterations=2,
+                         output=output.name, stdout=StringIO())
+            results = json.load(open(output.name))
+
+        targets = results['sizes']['20']['targets']
+        self.assertIn('book_event', targets)
+        self.assertIn('generate_schedule_for_next_30_days', targets)
+        self.assertGreater(targets['view_bookings']['queries'], 0)
+        self.assertFalse(User.objects.filter(username__startswith='runbench').exists())
@@ -1,14 +1,19 @@
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils.timezone import make_aware
 from datetime import date, time, timedelta
+from io import StringIO
+from django.core.management import call_command
 import html
 from django.contrib.messages import get_messages
 from unittest.mock import patch, PropertyMock
 
 from company.models import Coach, Company, Venue, Token, UserProfile
-from booking.models import Event, Booking, Day, TemplateEvent
+from booking.models import Event, Booking, Day, TemplateEvent, Job
+from booking.jobs import JOB_LEASE, claim_next_job, run_job, run_pending_jobs
 
 from booking.forms import EventForm, TemplateEventForm, BulkDeleteEventsForm
 
@@ -137,6 +142,49 @@ class EventSearchViewTest(TestCase):
         self.assertEqual(response.context['tokens'], 1)
         self.assertIn('is_coach', response.context)
 
+    def _add_booked_events(self, count, client_user):
+        for i in range(count):
+            event = Event.objects.create(
+                event_name=f"Extra Event {i}",
+                date_of_event=self.today + timedelta(days=1),
+                coach=self.coach,
+                status=0,
+                description='Extra',
+                venue=self.venue,
+                start_time=time(6, 0),
+                end_time=time(7, 0),
+                capacity=1
+            )
+            Booking.objects.create(event=event, user=client_user)
+
+    def test_query_count_does_not_grow_with_events(self):
+        client_user = User.objects.create_user(username='member', password='pass1234')
+        client_user.profile.company = self.company
+        client_user.profile.save()
+        Token.objects.create(user=client_user, company=self.company, used=False)
+
+        self.client.login(username='member', password='pass1234')
+        url = reverse('event_search', args=[(self.today + timedelta(days=1)).strftime('%Y-%m-%d')])
+
+        self._add_booked_events(1, client_user)
+        self.client.get(url)  # warm the per-user role cache
+        with CaptureQueriesContext(connection) as one_event:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['events']), 1)
+
+        self._add_booked_events(20, client_user)
+        with CaptureQueriesContext(connection) as many_events:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['events']), 21)
+
+        self.assertEqual(len(one_event.captured_queries), len(many_events.captured_queries))
+        event = response.context['events'][0]
+        self.assertEqual(event.booked_count, 1)
+        self.assertTrue(event.full)
+        self.assertTrue(event.user_booked)
+        self.assertEqual(event.coach_username, 'viewuser')
+        self.assertEqual(event.venue_name, 'Search Venue')
+
 # tests for event booking
 
 
@@ -557,7 +605,11 @@ class DuplicateEventViewTest(TestCase):
         }, follow=True)
 
         self.assertRedirects(response, reverse('event_search', args=[self.original_date]))
+        # Small copies are made straight away
+        self.assertFalse(Job.objects.exists())
         self.assertEqual(Event.objects.filter(event_name="Yoga").count(), 3)  # original + 2 copies
+        messages = list(response.context['messages'])
+        self.assertIn("2 event(s) duplicated", messages[0].message)
         self.assertTrue(Event.objects.filter(date_of_event=new_dates[0]).exists())
         self.assertTrue(Event.objects.filter(date_of_event=new_dates[1]).exists())
 
@@ -569,6 +621,39 @@ class DuplicateEventViewTest(TestCase):
         self.assertEqual(len(messages), 1)
         self.assertIn("Invalid date input", messages[0].message)
 
+    def test_post_malformed_dates_rejected(self):
+        self.client.login(username='coachuser', password='testpass')
+        response = self.client.post(self.url, {'dates-sent': '2024-13-40'}, follow=True)
+        messages = list(response.context['messages'])
+        self.assertIn("Invalid date input", messages[0].message)
+        self.assertFalse(Job.objects.exists())
+
+    @patch('booking.views.DUPLICATE_INLINE_LIMIT', 2)
+    def test_post_weekly_repeat_queues_every_nth_week(self):
+        self.client.login(username='coachuser', password='testpass')
+        response = self.client.post(self.url, {
+            'mode': 'weekly', 'every_weeks': 2, 'until': (self.original_date + timedelta(weeks=6)).isoformat(),
+        })
+
+        self.assertRedirects(response, reverse('event_search', args=[self.original_date]))
+        self.assertEqual(Job.objects.get().payload['dates'], [
+            (self.original_date + timedelta(weeks=weeks)).isoformat() for weeks in (2, 4, 6)
+        ])
+        run_pending_jobs()
+        self.assertEqual(Event.objects.filter(event_name="Yoga").count(), 4)
+
+    def test_post_date_range_rejects_reversed_range(self):
+        self.client.login(username='coachuser', password='testpass')
+        response = self.client.post(self.url, {
+            'mode': 'range',
+            'start_date': (self.original_date + timedelta(days=5)).isoformat(),
+            'end_date': (self.original_date + timedelta(days=1)).isoformat(),
+        }, follow=True)
+
+        messages = list(response.context['messages'])
+        self.assertIn("start date must be on or before the end date", messages[0].message)
+        self.assertFalse(Job.objects.exists())
+
     def test_invalid_url_date_returns_400(self):
         self.client.login(username='coachuser', password='testpass')
         bad_url = reverse('duplicate_day_events', args=["2024-99-99"])  # invalid date
@@ -597,6 +682,7 @@ class DuplicateEventViewTest(TestCase):
         self.client.login(username='coachuser', password='testpass')
         new_date = (self.original_date + timedelta(days=1)).strftime("%Y-%m-%d")
         response = self.client.post(self.url, {'dates-sent': new_date}, follow=True)
+        run_pending_jobs()
 
         # Only the original user's event should be duplicated
         yoga_events = Event.objects.filter(event_name="Yoga")
@@ -1251,34 +1337,111 @@ class GenerateScheduleViewTest(TestCase):
         messages = list(get_messages(response.wsgi_request))
         self.assertTrue(any("You are not authorized to generate a schedule." in m.message for m in messages))
 
-    @patch('booking.views.generate_schedule_for_next_30_days')
+    @patch('booking.jobs.generate_schedule_for_next_30_days')
     def test_schedule_generated_successfully(self, mock_generate_schedule):
-        """Test that the schedule is generated successfully for the next 30 days."""
+        """Test that the schedule is generated in the background for the next 30 days."""
         self.client.login(username='coachuser', password='testpass')
         mock_generate_schedule.return_value = 15  # Mock 15 events created
 
         response = self.client.get(self.url, follow=True)
         self.assertRedirects(response, reverse('coach_dashboard'))
         messages = list(get_messages(response.wsgi_request))
-        self.assertTrue(any("15 events created for the next 30 days." in m.message for m in messages))
+        self.assertTrue(any("Schedule generation started." in m.message for m in messages))
+        mock_generate_schedule.assert_not_called()
+
+        run_pending_jobs()
+        job = Job.objects.get(kind='generate_schedule')
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual(job.result, "15 events created for the next 30 days.")
 
         # Ensure the mock was called with the correct company
         mock_generate_schedule.assert_called_once_with(self.company)
 
-    @patch('booking.views.generate_schedule_for_next_30_days')
+    @patch('booking.jobs.generate_schedule_for_next_30_days')
     def test_no_events_created(self, mock_generate_schedule):
-        """Test that a success message is shown even if no events are created."""
+        """Test that the job succeeds even if no events are created."""
         self.client.login(username='coachuser', password='testpass')
         mock_generate_schedule.return_value = 0  # Mock 0 events created
 
-        response = self.client.get(self.url, follow=True)
-        self.assertRedirects(response, reverse('coach_dashboard'))
-        messages = list(get_messages(response.wsgi_request))
-        self.assertTrue(any("0 events created for the next 30 days." in m.message for m in messages))
+        self.client.get(self.url)
+        run_pending_jobs()
 
-        # Ensure the mock was called with the correct company
+        job = Job.objects.get(kind='generate_schedule')
+        self.assertEqual(job.result, "0 events created for the next 30 days.")
         mock_generate_schedule.assert_called_once_with(self.company)
 
+    @patch('booking.jobs.generate_schedule_for_next_30_days', side_effect=RuntimeError("db down"))
+    def test_failed_job_retried_with_backoff(self, mock_generate_schedule):
+        self.client.login(username='coachuser', password='testpass')
+        self.client.get(self.url)
+        run_pending_jobs()
+
+        job = Job.objects.get(kind='generate_schedule')
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("db down", job.error)
+        self.assertGreater(job.run_after, job.created_at)
+
+        # Not due yet, so the worker leaves it alone
+        self.assertEqual(run_pending_jobs(), 0)
+
+        Job.objects.filter(pk=job.pk).update(run_after=job.created_at, attempts=job.max_attempts - 1)
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNotNone(job.finished_at)
+
+    @patch('booking.jobs.generate_schedule_for_next_30_days', return_value=4)
+    def test_job_abandoned_by_a_dead_worker_is_reclaimed(self, mock_generate_schedule):
+        self.client.login(username='coachuser', password='testpass')
+        self.client.get(self.url)
+        job = claim_next_job()  # the worker dies before running it
+
+        # Still inside the lease, so no other worker takes it
+        self.assertIsNone(claim_next_job())
+        self.assertEqual(run_pending_jobs(), 0)
+
+        reclaimed = claim_next_job(now=job.started_at + JOB_LEASE)
+        self.assertEqual((reclaimed.pk, reclaimed.attempts), (job.pk, 2))
+        run_job(reclaimed)
+        self.assertEqual(Job.objects.get().status, 'succeeded')
+
+    def test_job_abandoned_on_its_last_attempt_fails(self):
+        self.client.login(username='coachuser', password='testpass')
+        self.client.get(self.url)
+        job = claim_next_job()
+        Job.objects.filter(pk=job.pk).update(attempts=job.max_attempts)
+
+        self.assertIsNone(claim_next_job(now=job.started_at + JOB_LEASE))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn("Worker stopped", job.error)
+
+    def test_job_status_endpoint(self):
+        self.client.login(username='coachuser', password='testpass')
+        self.client.get(self.url)
+        job = Job.objects.get()
+
+        response = self.client.get(reverse('job_status', args=[job.pk]))
+        self.assertEqual(response.json()['status'], 'queued')
+
+        with patch('booking.jobs.generate_schedule_for_next_30_days', return_value=3):
+            call_command('run_jobs', once=True, stdout=StringIO())
+        data = self.client.get(reverse('job_status', args=[job.pk])).json()
+        self.assertEqual(data['status'], 'succeeded')
+        self.assertTrue(data['finished'])
+        self.assertEqual(data['result'], "3 events created for the next 30 days.")
+
+    def test_job_status_hidden_from_other_companies(self):
+        self.client.login(username='coachuser', password='testpass')
+        self.client.get(self.url)
+        job = Job.objects.get()
+
+        User.objects.create_user(username='outsider', password='testpass')
+        self.client.login(username='outsider', password='testpass')
+        response = self.client.get(reverse('job_status', args=[job.pk]))
+        self.assertEqual(response.status_code, 403)
+
 
 
 class DeleteFutureEventsViewTest(TestCase):
@@ -1338,12 +1501,12 @@ class DeleteFutureEventsViewTest(TestCase):
             "end_date": (date.today() + timedelta(days=2)).strftime("%Y-%m-%d"),
         }
         response = self.client.post(self.url, data, follow=True)
+        run_pending_jobs()
 
         self.assertRedirects(response, reverse("coach_dashboard"))
         self.assertEqual(Event.objects.count(), 0)  # All events should be deleted
 
-        messages = list(get_messages(response.wsgi_request))
-        self.assertTrue(any("2 future event(s) deleted." in m.message for m in messages))
+        self.assertEqual(Job.objects.get().result, "2 future event(s) deleted.")
 
     def test_post_valid_form_no_events_to_delete(self):
         """Test that a valid POST request with no events to delete shows a success message."""
@@ -1354,12 +1517,12 @@ class DeleteFutureEventsViewTest(TestCase):
             "end_date": (date.today() + timedelta(days=2)).strftime("%Y-%m-%d"),
         }
         response = self.client.post(self.url, data, follow=True)
+        run_pending_jobs()
 
         self.assertRedirects(response, reverse("coach_dashboard"))
         self.assertEqual(Event.objects.count(), 0)  # No events should exist
 
-        messages = list(get_messages(response.wsgi_request))
-        self.assertTrue(any("0 future event(s) deleted." in m.message for m in messages))
+        self.assertEqual(Job.objects.get().result, "0 future event(s) deleted.")
 
     def test_post_invalid_form_shows_form_errors(self):
         """Test that an invalid POST request shows form errors."""
@@ -1417,13 +1580,39 @@ class DeleteFutureEventsViewTest(TestCase):
             "end_date": (date.today() + timedelta(days=2)).strftime("%Y-%m-%d"),
         }
         response = self.client.post(self.url, data, follow=True)
+        run_pending_jobs()
 
         self.assertRedirects(response, reverse("coach_dashboard"))
         self.assertEqual(Event.objects.count(), 1)  # Only the past event should remain
         self.assertTrue(Event.objects.filter(event_name="Past Event").exists())
 
-        messages = list(get_messages(response.wsgi_request))
-        self.assertTrue(any("2 future event(s) deleted." in m.message for m in messages))
+        self.assertEqual(Job.objects.get().result, "2 future event(s) deleted.")
+
+
+    def test_post_leaves_other_companies_events(self):
+        other_user = User.objects.create_user(username="othercoach", password="testpass")
+        other_company = Company.objects.create(name="Other Company", manager=other_user)
+        other_coach = Coach.objects.create(coach=other_user, company=other_company)
+        Event.objects.create(
+            event_name="Other Event",
+            date_of_event=date.today() + timedelta(days=1),
+            start_time=time(10, 0),
+            end_time=time(11, 0),
+            venue=self.venue,
+            status=0,
+            description="Test Description",
+            capacity=10,
+            coach=other_coach,
+        )
+
+        self.client.login(username="coachuser", password="testpass")
+        self.client.post(self.url, {
+            "start_date": date.today().strftime("%Y-%m-%d"),
+            "end_date": (date.today() + timedelta(days=2)).strftime("%Y-%m-%d"),
+        })
+        run_pending_jobs()
+
+        self.assertEqual(list(Event.objects.values_list("event_name", flat=True)), ["Other Event"])
 
 
 class SwitchAutoUpdateStatusViewTest(TestCase):
@@ -28,6 +28,7 @@ urlpatterns = [
     path('edit_event/<int:event_id>/', views.edit_event, name='edit_event'),
     path('edit_template_event/<int:template_id>/',
          views.edit_template_event, name='edit_template_event'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
     path('<str:date>/', views.event_search, name='event_search'),
     path('<str:date>/<int:id>/', views.event_detail, name='event_detail'),
     path('<int:event_id>/coach-no-show/', views.mark_coach_no_show, name='mark_coach_no_show'),
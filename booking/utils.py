@@ -1,75 +1,258 @@
+import logging
+import time as time_module
+from collections import defaultdict
+from django.db import IntegrityError, transaction
 from django.utils import timezone
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from datetime import datetime, time, timedelta, date
-from .models import TemplateEvent, Event, Coach, Day
+from .models import TemplateEvent, Event, Booking, Coach, Day
+from .overlaps import without_clashes
 
-def update_event_status_if_needed(event):
-    now = timezone.now()  # Always returns a timezone-aware datetime
+logger = logging.getLogger(__name__)
 
-    # Combine the event date and start time
-    event_start = datetime.combine(event.date_of_event, event.start_time)
+def started_events_q(now=None):
+    """Filter for events whose start time has passed, read from the clock like Event.has_started()."""
+    now = timezone.localtime(now)
+    return Q(status=1) | Q(date_of_event__lt=now.date()) | Q(
+        date_of_event=now.date(), start_time__lte=now.time()
+    )
 
-    # Make sure it's timezone-aware
-    if timezone.is_naive(event_start):
-        event_start = timezone.make_aware(event_start)
 
-    if event.status == 0 and now >= event_start:  # 0 == Future
-        event.status = 1  # Past
-        event.save(update_fields=['status'])
+def expire_started_events(now=None):
+    """
+    Move every Future event whose start time has passed to Past with a
+    single UPDATE. Returns the number of events moved.
+    """
+    return Event.objects.filter(started_events_q(now), status=0).update(status=1)  # 0 == Future, 1 == Past
 
 
-def generate_schedule_for_date(company, target_date):
-    created_count = 0
-    weekday = target_date.weekday()
-
-    try:
-        day_obj = Day.objects.get(id=weekday + 1)  # Your Day model uses id 1=Monday, etc.
-    except Day.DoesNotExist:
-        return 0  # No matching weekday in DB
-
-    for coach in Coach.objects.filter(company=company):
-        # Skip excluded dates
-        # if ExcludedDate.objects.filter(coach=coach, date=target_date).exists():
-        #     continue
-
-        templates = TemplateEvent.objects.filter(
-            coach=coach,
-            day_of_week=day_obj,
-            active=True
-        )
-
-        for tpl in templates:
-            event_exists = Event.objects.filter(
-                coach=coach,
-                venue=tpl.venue,
+def booking_count_subquery():
+    counts = Booking.objects.filter(event=OuterRef('pk')).order_by().values('event').annotate(
+        total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def reconcile_booked_counts(events=None):
+    """
+    Repair Event.booked_count wherever it has drifted from the real number
+    of bookings. Returns the number of events that were corrected.
+    """
+    if events is None:
+        events = Event.objects.all()
+    drifted = events.annotate(actual=booking_count_subquery()).exclude(booked_count=F('actual'))
+    return Event.objects.filter(pk__in=drifted.values('pk')).update(booked_count=booking_count_subquery())
+
+
+def _insert_template_events(events, batch_size=500):
+    """
+    Bulk insert generated events and return how many rows were written.
+    A batch that hits the unique (template, date) constraint - a concurrent
+    run got there first - is retried without the slots that now exist, so
+    the count only includes rows this run inserted.
+    """
+    created = 0
+    for offset in range(0, len(events), batch_size):
+        batch = events[offset:offset + batch_size]
+        while batch:
+            try:
+                with transaction.atomic():
+                    Event.objects.bulk_create(batch)
+            except IntegrityError:
+                taken = set(Event.objects.filter(
+                    template_id__in={event.template_id for event in batch},
+                    date_of_event__in={event.date_of_event for event in batch},
+                ).values_list('template_id', 'date_of_event'))
+                remaining = [event for event in batch if (event.template_id, event.date_of_event) not in taken]
+                if len(remaining) == len(batch):
+                    raise
+                batch = remaining
+            else:
+                created += len(batch)
+                break
+    return created
+
+
+def materialize_schedule(company, dates):
+    """
+    Create the events a company's active schedule templates call for on
+    the given dates. Loads the templates and the existing events in the
+    window once, diffs them in memory on the natural key and bulk inserts
+    whatever is missing. Safe to re-run: already-created slots are skipped.
+
+    Slots that would double-book a coach or venue are left out and counted
+    as clashes.
+
+    Returns a dict with created/skipped/clashes counts and the time taken.
+    """
+    started = time_module.perf_counter()
+    dates = sorted(set(dates))
+    summary = {'created': 0, 'skipped': 0, 'clashes': 0, 'seconds': 0.0}
+    if not dates:
+        return summary
+
+    templates_by_day = defaultdict(list)  # Day ids run 1=Monday .. 7=Sunday
+    for tpl in TemplateEvent.objects.filter(coach__company=company, active=True):
+        templates_by_day[tpl.day_of_week_id].append(tpl)
+
+    existing = set(Event.objects.filter(
+        company=company,
+        date_of_event__range=(dates[0], dates[-1]),
+    ).values_list('coach_id', 'venue_id', 'event_name', 'date_of_event', 'start_time', 'end_time'))
+
+    new_events = []
+    for target_date in dates:
+        for tpl in templates_by_day[target_date.weekday() + 1]:
+            key = (tpl.coach_id, tpl.venue_id, tpl.event_name, target_date, tpl.start_time, tpl.end_time)
+            if key in existing:
+                summary['skipped'] += 1
+                continue
+            existing.add(key)
+            new_events.append(Event(
+                coach_id=tpl.coach_id,
+                company_id=company.pk,
+                venue_id=tpl.venue_id,
+                template=tpl,
                 event_name=tpl.event_name,
+                description=tpl.description,
                 date_of_event=target_date,
                 start_time=tpl.start_time,
-                end_time=tpl.end_time
-            ).exists()
+                end_time=tpl.end_time,
+                capacity=tpl.capacity,
+                status=0  # Future
+            ))
+
+    new_events, clashes = without_clashes(new_events)
+    summary['clashes'] = len({id(clash.event) for clash in clashes})
+    for clash in clashes:
+        logger.warning(f"Schedule for {company}: {clash.event} not created, clashes with {clash.other} ({clash.resource})")
+
+    summary['created'] = _insert_template_events(new_events)
+    summary['skipped'] += len(new_events) - summary['created']
+    summary['seconds'] = time_module.perf_counter() - started
+    logger.info(
+        f"Schedule for {company} ({dates[0]} to {dates[-1]}): {summary['created']} created, "
+        f"{summary['skipped']} skipped, {summary['clashes']} clashing in {summary['seconds']:.3f}s"
+    )
+    return summary
 
-            if not event_exists:
-                Event.objects.create(
+
+# Most target dates one duplication may fill (a year of daily copies)
+MAX_DUPLICATE_DATES = 366
+# Copies up to this many events are made during the request; bigger ones go to the job worker
+DUPLICATE_INLINE_LIMIT = 200
+
+
+def duplication_dates(source_date, dates=None, start=None, end=None, every_weeks=None, until=None):
+    """
+    The days a copy of source_date should fill: the given dates, every day
+    from start to end, or the same weekday every `every_weeks` weeks up to
+    `until`. The source day itself is never a target. Raises ValueError
+    for an empty or oversized selection.
+    """
+    if dates is not None:
+        dates = sorted(set(dates))
+    elif every_weeks:
+        if until is None or until <= source_date:
+            raise ValueError("The repeat end date must be after the day being copied.")
+        step = timedelta(weeks=every_weeks)
+        dates = []
+        current = source_date + step
+        while current <= until and len(dates) <= MAX_DUPLICATE_DATES:
+            dates.append(current)
+            current += step
+    else:
+        if start is None or end is None or start > end:
+            raise ValueError("The start date must be on or before the end date.")
+        if (end - start).days >= MAX_DUPLICATE_DATES + 1:
+            raise ValueError(f"You can copy to at most {MAX_DUPLICATE_DATES} days at once.")
+        dates = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+    dates = [day for day in dates if day != source_date]
+    if not dates:
+        raise ValueError("There are no days to copy to.")
+    if len(dates) > MAX_DUPLICATE_DATES:
+        raise ValueError(f"You can copy to at most {MAX_DUPLICATE_DATES} days at once.")
+    return dates
+
+
+def duplicate_day(coach, source_date, dates):
+    """
+    Copy a coach's events on source_date onto each of the given dates.
+    The source events and the coach's events in the target window are
+    each loaded with one query; copies that already exist are skipped,
+    copies that would double-book the coach or venue are left out, and
+    the rest are bulk inserted. Safe to re-run, even alongside another
+    copy for the same coach: the coach row is locked while the existing
+    events are read and the copies inserted.
+
+    Returns a dict with created/skipped/clashes counts and the time taken.
+    """
+    started = time_module.perf_counter()
+    dates = sorted(set(dates) - {source_date})
+    summary = {'created': 0, 'skipped': 0, 'clashes': 0, 'seconds': 0.0}
+    source_events = list(Event.objects.filter(
+        coach=coach, date_of_event=source_date
+    ).select_related('coach', 'venue').order_by('start_time'))
+    if not dates or not source_events:
+        return summary
+
+    with transaction.atomic():
+        # A double-submitted form, or an inline copy overlapping the queued job, waits here
+        # and then sees the other run's copies as existing
+        Coach.objects.select_for_update().filter(pk=coach.pk).exists()
+        existing = set(Event.objects.filter(
+            coach=coach, date_of_event__range=(dates[0], dates[-1]),
+        ).values_list('venue_id', 'event_name', 'date_of_event', 'start_time', 'end_time'))
+
+        new_events = []
+        for target_date in dates:
+            for event in source_events:
+                key = (event.venue_id, event.event_name, target_date, event.start_time, event.end_time)
+                if key in existing:
+                    summary['skipped'] += 1
+                    continue
+                new_events.append(Event(
                     coach=coach,
-                    venue=tpl.venue,
-                    event_name=tpl.event_name,
-                    description=tpl.description,
+                    company_id=coach.company_id,
+                    venue=event.venue,
+                    event_name=event.event_name,
+                    description=event.description,
                     date_of_event=target_date,
-                    start_time=tpl.start_time,
-                    end_time=tpl.end_time,
-                    capacity=tpl.capacity,
+                    capacity=event.capacity,
+                    start_time=event.start_time,
+                    end_time=event.end_time,
                     status=0  # Future
-                )
-                created_count += 1
+                ))
+
+        new_events, clashes = without_clashes(new_events)
+        summary['clashes'] = len({id(clash.event) for clash in clashes})
+        Event.objects.bulk_create(new_events, batch_size=500)
+    summary['created'] = len(new_events)
+    summary['seconds'] = time_module.perf_counter() - started
+    logger.info(
+        f"Duplicated {coach}'s {source_date} onto {len(dates)} day(s): {summary['created']} created, "
+        f"{summary['skipped']} skipped, {summary['clashes']} clashing in {summary['seconds']:.3f}s"
+    )
+    return summary
+
 
-    return created_count
+def duplication_message(summary, source_date):
+    message = f"{summary['created']} event(s) duplicated from {source_date}."
+    if summary['skipped']:
+        message += f" {summary['skipped']} already existed."
+    if summary['clashes']:
+        message += f" {summary['clashes']} skipped because the coach or venue was already booked."
+    return message
+
+
+def generate_schedule_for_date(company, target_date):
+    return materialize_schedule(company, [target_date])['created']
 
 def generate_schedule_for_next_30_days(company):
     today = date.today()
-    total_created = 0
-    for offset in range(30):
-        day = today + timedelta(days=offset)
-        total_created += generate_schedule_for_date(company, day)
-    return total_created
+    dates = [today + timedelta(days=offset) for offset in range(30)]
+    return materialize_schedule(company, dates)['created']
 
 
 def generate_schedule_for_day_30(company):
@@ -1,15 +1,20 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponse
-from .models import Event, Booking, Coach, TemplateEvent, ExcludedDate, Day
+from django.http import HttpResponse, JsonResponse
+from .models import Event, Booking, Coach, TemplateEvent, ExcludedDate, Day, Job
 from django.views import generic
 from datetime import timedelta, datetime
 from django.contrib import messages
+from django.db import transaction
 from django.contrib.auth.decorators import login_required
-from .forms import EventForm, MultiEventForm, TemplateEventForm, DuplicateTemplateDayForm, BulkDeleteEventsForm
+from .forms import EventForm, MultiEventForm, TemplateEventForm, DuplicateTemplateDayForm, BulkDeleteEventsForm, DuplicateDayForm
 from datetime import date, timedelta
 from django.shortcuts import render, redirect
-from company.models import Token
-from booking.utils import update_event_status_if_needed, generate_schedule_for_next_30_days
+from company.models import Company, Token
+from company.tokens import get_token_balance
+from booking.jobs import enqueue_job
+from booking.overlaps import find_event_clashes
+from booking.utils import DUPLICATE_INLINE_LIMIT, duplicate_day, duplication_message
+from booking.services import book_event_for_user, cancel_booking_for_user, BookingError
 from utils.email import send_custom_email
 
 import logging
@@ -17,14 +22,6 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-def check_for_coach(request):
-    coaches = Coach.objects.all()
-    for coach in coaches:
-        if request.user == coach.coach:
-            return True
-    return False
-
-
 @login_required
 def event_detail(request, id, date):
     current_date = datetime.strptime(date, "%Y-%m-%d").date()
@@ -36,7 +33,7 @@ def event_detail(request, id, date):
         request,
         "booking/event_detail.html",
         {"event": event,
-         'is_coach': check_for_coach(request)}
+         'is_coach': request.roles.is_coach}
     )
 
 
@@ -56,14 +53,11 @@ def event_search(request, date):
     next_date = current_date + timedelta(days=1)
 
     user_company = request.user.profile.company
-    events = Event.objects.filter(coach__company=user_company, date_of_event=current_date)
-    events = events.order_by('start_time')
-    for event in events:
-        update_event_status_if_needed(event) # check to see if each event has started
-        event.is_user_booked = event.is_user_booked(request.user) # checks if user is booked
+    events = Event.objects.filter(company=user_company, date_of_event=current_date)
+    events = events.timetable(request.user).order_by('start_time')
 
-    is_coach = check_for_coach(request)
-    tokens = Token.objects.filter(user=request.user, used=False, company=user_company).count()
+    is_coach = request.roles.is_coach
+    tokens = get_token_balance(request.user, user_company)
 
     return render(request, "booking/index.html", {
         "events": events,
@@ -80,51 +74,24 @@ def event_search(request, date):
 def book_event(request, event_id):
     event = get_object_or_404(Event, pk=event_id)
 
-    update_event_status_if_needed(event)
-
-    if event.status == 1:  # Past event
+    if event.has_started():
         messages.error(request, "You can't book after the class has started.")
         return redirect('event_search', date=event.date_of_event)
 
     if request.method == 'POST':
-        # Check if event is full
-        if event.is_full():
-            messages.error(request, "Event is full")
-            return redirect('event_search', date=event.date_of_event)
-
-        # Check if user has already booked
-        if event.is_user_booked(request.user):
-            messages.error(request, "You have already booked this event")
-            return redirect('event_search', date=event.date_of_event)
-
-        # Check for overlapping events
-        overlapping_events = Booking.objects.filter(
-            user=request.user,
-            event__date_of_event=event.date_of_event,
-            event__start_time__lt=event.end_time,
-            event__end_time__gt=event.start_time
-        )
-        if overlapping_events.exists():
-            messages.error(request, "You cannot book overlapping events")
-            return redirect('event_search', date=event.date_of_event)
-
-        # Check for available token
-        token = Token.objects.filter(user=request.user, used=False, company=event.coach.company).first()
-        if not token:
-            messages.error(request, "You don't have any available tokens")
+        try:
+            # Queue the confirmation in the booking's transaction
+            with transaction.atomic():
+                booking = book_event_for_user(request.user, event.pk)
+                event = booking.event
+                send_custom_email(
+                    subject="Booking Confirmation",
+                    message=f"You are booked onto {event.event_name} at {event.venue.name} from {event.start_time} until {event.end_time}",
+                    recipient_list=[request.user.email]
+                )
+        except BookingError as e:
+            messages.error(request, str(e))
             return redirect('event_search', date=event.date_of_event)
-        
-
-        # Proceed with booking
-        Booking.objects.create(event=event, user=request.user)
-        token.used = True
-        token.booking = Booking.objects.filter(event=event, user=request.user).first()
-        token.save()
-        send_custom_email(
-        subject="Booking Confirmation",
-        message=f"You are booked onto {event.event_name} at {event.venue.name} from {event.start_time} until {event.end_time}",
-        recipient_list=[request.user.email]
-    )
 
         messages.success(request, "Event booked successfully. 1 token has been used.")
         return redirect('event_search', date=event.date_of_event)
@@ -136,30 +103,22 @@ def book_event(request, event_id):
 # used to cancel a booking
 @login_required
 def cancel_event(request, event_id):
-    user = request.user
     event = get_object_or_404(Event, pk=event_id)
 
-    update_event_status_if_needed(event)
-
-    if event.status == 1:  # Past event
+    if event.has_started():
         messages.error(request, "You can't cancel a booking after the class has started.")
         return redirect('event_search', date=event.date_of_event)
 
     if request.method == 'POST':
-        booking = Booking.objects.filter(event=event, user=user).first()
-        if booking:
-            # Find and refund the token linked to this booking
-            token = Token.objects.filter(user=user, booking=booking, used=True).first()
-            if token:
-                token.used = False
-                token.booking = None
-                token.save()
-            else:
-                messages.error(request, "No token found for this booking to refund.")
-            booking.delete()
-            messages.success(request, "Booking cancelled successfully and token refunded.")
-        else:
-            messages.error(request, "You do not have a booking for this event")
+        try:
+            token_returned = cancel_booking_for_user(request.user, event)
+        except BookingError as e:
+            messages.error(request, str(e))
+            return redirect('event_search', date=event.date_of_event)
+
+        if not token_returned:
+            messages.error(request, "No token found for this booking to refund.")
+        messages.success(request, "Booking cancelled successfully and token refunded.")
         return redirect('event_search', date=event.date_of_event)
     return redirect('event_search', date=event.date_of_event)
 
@@ -175,12 +134,18 @@ def delete_event(request, event_id):
     return redirect('event_search', date=event.date_of_event)
 
 
+def _add_clash_error(form):
+    # The coach or venue is already taken for part of the form's time slot
+    clashes = find_event_clashes([form.instance])
+    if clashes:
+        form.add_error(None, str(clashes[0]))
+    return bool(clashes)
+
+
 @login_required
 def create_event(request):
     # Check if the user is a coach
-    try:
-        coach = Coach.objects.get(coach=request.user)  # <-- FIXED HERE
-    except Coach.DoesNotExist:
+    if not request.roles.is_coach:
         messages.error(request, "You are not authorized to create events")
         return redirect('event_search', date=date.today())
 
@@ -188,10 +153,11 @@ def create_event(request):
         form = EventForm(request.POST, user=request.user, request=request)
         if form.is_valid():
             event = form.save(commit=False)
-            event.coach = coach  # Reuse the coach object you already got
-            event.save()
-            messages.success(request, "Event created successfully")
-            return redirect('event_search', date=event.date_of_event)
+            event.coach_id = request.roles.coach_id
+            if not _add_clash_error(form):
+                event.save()
+                messages.success(request, "Event created successfully")
+                return redirect('event_search', date=event.date_of_event)
     else:
         form = EventForm(user=request.user, request=request)
     return render(request, "booking/create_event.html", {'form': form})
@@ -200,9 +166,7 @@ def create_event(request):
 
 @login_required
 def create_multi_event(request):
-    try:
-        coach = Coach.objects.get(coach=request.user)
-    except Coach.DoesNotExist:
+    if not request.roles.is_coach:
         messages.error(request, "You do not have permission to create events.")
         return redirect('event_search', date=date.today())
 
@@ -235,7 +199,8 @@ def create_multi_event(request):
 
                 events.append(
                     Event(
-                        coach=coach,
+                        coach_id=request.roles.coach_id,
+                        company_id=request.roles.coach_company_id,
                         venue=venue,
                         event_name=name,
                         description=desc,
@@ -250,6 +215,14 @@ def create_multi_event(request):
                 # Next class
                 start_dt = end_dt + gap_td
 
+            clashes = find_event_clashes(events)
+            if clashes:
+                clashing = len({id(clash.event) for clash in clashes})
+                messages.error(request, f"{clashing} event(s) would double-book the coach or venue. No events were created.")
+                for message in dict.fromkeys(str(clash) for clash in clashes[:5]):
+                    form.add_error(None, message)
+                return render(request, "booking/multi_event.html", {"form": form})
+
             if events:
                 Event.objects.bulk_create(events)
                 messages.success(request, f"{len(events)} event(s) created successfully.")
@@ -273,46 +246,36 @@ def duplicate_event(request, date_str):
     except ValueError:
         return HttpResponse("Invalid date format", status=400)
     
-    coach_input = get_object_or_404(Coach, coach=request.user)
+    coach_input = get_object_or_404(Coach, pk=request.roles.coach_id)
 
     if request.method == 'POST':
-        # Get the events for the selected date
-        events = Event.objects.filter(date_of_event=selected_date, coach__company=coach_input.company)
-
-        # Create a list to hold the new events
-        new_events = []
-
-        date_input = request.POST.get('dates-sent')
-        # Check if the date input is valid
-        if date_input:
-            date_array = [date.strip() for date in date_input.split(',')]
-        else:
-            messages.error(request, "Invalid date input")
+        form = DuplicateDayForm(request.POST, source_date=selected_date)
+        if not form.is_valid():
+            messages.error(request, f"Invalid date input. {' '.join(form.non_field_errors()) or 'Please check the dates.'}")
             return redirect('event_search', date=selected_date)
 
-        # Loop through each event and create a new one
-        for event in events:
-            for day in date_array:
-                if event.coach.company == coach_input.company and event.coach == coach_input:
-                    new_event = Event(
-                        coach=event.coach,
-                        event_name=event.event_name,
-                        description=event.description,
-                        venue = event.venue,
-                        date_of_event= day,
-                        capacity=event.capacity,
-                        start_time=event.start_time,
-                        end_time=event.end_time,
-                        status=event.status,
-                    )
-                    new_events.append(new_event)
+        dates = form.cleaned_data['target_dates']
+        copies = Event.objects.filter(coach=coach_input, date_of_event=selected_date).count() * len(dates)
+        if copies <= DUPLICATE_INLINE_LIMIT:
+            with transaction.atomic():
+                summary = duplicate_day(coach_input, selected_date, dates)
+            messages.success(request, duplication_message(summary, selected_date))
+            return redirect('event_search', date=selected_date)
 
-        # Bulk create the new events
-        Event.objects.bulk_create(new_events)
-        messages.success(request, "Events duplicated successfully")
+        # Very large copies can be slow, so hand them to the job worker
+        enqueue_job(
+            'duplicate_day', coach_input.company, request.user,
+            coach_id=coach_input.pk, source_date=selected_date.isoformat(),
+            dates=[day.isoformat() for day in dates]
+        )
+        messages.success(
+            request,
+            f"Duplicating events onto {len(dates)} day(s) in the background. Check the coach dashboard for progress."
+        )
         return redirect('event_search', date=selected_date)
     else:
-        return render(request, 'booking/duplicate_events.html', {'selected_date': selected_date})
+        form = DuplicateDayForm(source_date=selected_date)
+        return render(request, 'booking/duplicate_events.html', {'selected_date': selected_date, 'form': form})
 
 
 @login_required
@@ -320,7 +283,7 @@ def edit_event(request, event_id):
     event = get_object_or_404(Event, pk=event_id)
     if request.method == 'POST':
         form = EventForm(request.POST, instance=event, user=request.user)
-        if form.is_valid():
+        if form.is_valid() and not _add_clash_error(form):
             event = form.save()
             messages.success(request, "Event updated successfully")
             return redirect('event_search', date=event.date_of_event)
@@ -336,29 +299,28 @@ def edit_event(request, event_id):
 
 @login_required
 def coach_dashboard(request):
-    if not check_for_coach(request):
+    if not request.roles.is_coach:
         messages.error(request, "You are not authorized to view this page")
         return redirect('event_search', date=date.today())
 
-    coach = get_object_or_404(Coach, coach=request.user)
-    company = coach.company
+    company = get_object_or_404(Company, company_id=request.roles.coach_company_id)
+    jobs = Job.objects.filter(company=company)[:10]
 
     return render(
         request,
         "booking/coach_dashboard.html",
-        {'is_coach': True, 'company': company}
+        {'is_coach': True, 'company': company, 'jobs': jobs}
     )
 
 @login_required
 def schedule(request, day_id):
-    if not check_for_coach(request):
+    if not request.roles.is_coach:
         messages.error(request, "You are not authorized to view this page")
         return redirect('event_search', date=date.today())
 
     day = get_object_or_404(Day, id=day_id)
-    # Ensure the user is a coach
-    coach = get_object_or_404(Coach, coach=request.user)
-    template_events = TemplateEvent.objects.filter(coach=coach, day_of_week=day).order_by('start_time')
+    template_events = TemplateEvent.objects.filter(
+        coach_id=request.roles.coach_id, day_of_week=day).order_by('start_time')
 
     return render(
         request,
@@ -394,9 +356,7 @@ def delete_template_event(request, template_id):
     template = get_object_or_404(TemplateEvent, pk=template_id)
     day = get_object_or_404(Day, id=template.day_of_week.id)
 
-    user_is_coach = Coach.objects.filter(coach=request.user).exists()
-
-    if not user_is_coach:
+    if not request.roles.is_coach:
         messages.error(request, "You are not authorized to delete this template event.")
         return redirect('event_search', date=date.today())
     
@@ -432,7 +392,7 @@ def view_template_event(request, template_id):
     template_event = get_object_or_404(TemplateEvent, id=template_id)
 
     # Optional: Check if user is the coach who created it
-    if check_for_coach(request) == False:
+    if not request.roles.is_coach:
         messages.error(request, "You are not authorized to view this template event.")
         return redirect('schedule', day_id=template_event.day_of_week.id)
 
@@ -446,7 +406,7 @@ def view_template_event(request, template_id):
 def duplicate_template_schedule(request, source_day_id):
     source_day = get_object_or_404(Day, id=source_day_id)
 
-    if check_for_coach(request) == False:
+    if not request.roles.is_coach:
         # If the user is not a coach, redirect with an error message
         messages.error(request, "You are not authorised to duplicate this schedule.")
         return redirect('schedule', day_id=source_day.id)
@@ -499,19 +459,23 @@ def duplicate_template_schedule(request, source_day_id):
 
 @login_required
 def generate_schedule_view(request):
-    if not check_for_coach(request):
+    if not request.roles.is_coach:
         messages.error(request, "You are not authorized to generate a schedule.")
         return redirect('event_search', date=date.today())
     # Ensure the user is a coach
     company = request.user.profile.company
 
-    created = generate_schedule_for_next_30_days(company)
-    messages.success(request, f"{created} events created for the next 30 days.")
+    enqueue_job('generate_schedule', company, request.user)
+    messages.success(request, "Schedule generation started. Progress is shown below.")
 
     return redirect('coach_dashboard')  
 
 @login_required
 def delete_future_events(request):
+    if not request.roles.is_coach:
+        messages.error(request, "You are not authorized to delete events.")
+        return redirect('event_search', date=date.today())
+
     if request.method == "POST":
         form = BulkDeleteEventsForm(request.POST)
         if form.is_valid():
@@ -522,12 +486,13 @@ def delete_future_events(request):
                 messages.error(request, "Start date must be before the end date.")
                 return render(request, "booking/delete_events.html", {"form": form})
 
-            deleted, _ = Event.objects.filter(
-                date_of_event__range=(start, end),
-                status=0  # Future events only
-            ).delete()
+            company = get_object_or_404(Company, company_id=request.roles.coach_company_id)
+            enqueue_job(
+                'delete_events', company, request.user,
+                start_date=start.isoformat(), end_date=end.isoformat()
+            )
 
-            messages.success(request, f"{deleted} future event(s) deleted.")
+            messages.success(request, "Deleting future events in the background. Progress is shown below.")
             return redirect("coach_dashboard")  # Adjust as needed
     else:
         form = BulkDeleteEventsForm()
@@ -536,7 +501,7 @@ def delete_future_events(request):
 
 @login_required
 def switch_auto_update_status(request):
-    if request.user.profile.company.manager_id == request.user.id:
+    if request.roles.is_manager:
         try:
             company = request.user.profile.company
             company.auto_updates = not company.auto_updates  # Toggle the auto-updates status
@@ -554,7 +519,7 @@ def switch_auto_update_status(request):
 def mark_coach_no_show(request, event_id):
     event = get_object_or_404(Event, pk=event_id)
 
-    if request.user != event.coach.coach:
+    if event.coach_id != request.roles.coach_id:
         messages.error(request, "You do not have permission to update this event.")
         return redirect('event_search', date=event.date_of_event)
 
@@ -568,4 +533,20 @@ def mark_coach_no_show(request, event_id):
         token.save()
 
     messages.success(request, "Marked as coach no-show and tokens reset.")
-    return redirect('event_search', date=event.date_of_event)
\ No newline at end of file
+    return redirect('event_search', date=event.date_of_event)
+
+@login_required
+def job_status(request, job_id):
+    job = get_object_or_404(Job, pk=job_id)
+    if not request.roles.is_coach or job.company_id != request.roles.coach_company_id:
+        return JsonResponse({'error': 'Not authorised'}, status=403)
+
+    return JsonResponse({
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'result': job.result,
+        'error': job.error if job.status == 'failed' else '',
+        'finished': job.is_finished(),
+    })
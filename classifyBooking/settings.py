@@ -67,6 +67,7 @@ LOGIN_URL = 'account_login'
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'utils.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -74,6 +75,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    'company.middleware.RoleMiddleware',
 ]
 
 ROOT_URLCONF = 'classifyBooking.urls'
@@ -240,4 +242,16 @@ STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY")
 STRIPE_PUBLIC_KEY = os.environ.get("STRIPE_PUBLIC_KEY")
 STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET") # <--- ADD THIS LINE
 if not STRIPE_SECRET_KEY or not STRIPE_PUBLIC_KEY:
-    raise ValueError("Stripe keys are not set in the environment variables.")
\ No newline at end of file
+    raise ValueError("Stripe keys are not set in the environment variables.")
+# Stripe client (see company/stripe_gateway.py). 'fake' swaps in an in-process
+# stand-in so checkout, refunds and onboarding can run offline, e.g. for load tests
+STRIPE_BACKEND = os.environ.get('STRIPE_BACKEND', 'live')
+STRIPE_CONNECT_TIMEOUT = float(os.environ.get('STRIPE_CONNECT_TIMEOUT', '3'))
+STRIPE_READ_TIMEOUT = float(os.environ.get('STRIPE_READ_TIMEOUT', '20'))
+STRIPE_MAX_NETWORK_RETRIES = int(os.environ.get('STRIPE_MAX_NETWORK_RETRIES', '2'))
+# Seconds the fake backend waits on every call, to mimic Stripe's response time
+STRIPE_FAKE_LATENCY = float(os.environ.get('STRIPE_FAKE_LATENCY', '0'))
+# Request metrics (see utils/metrics.py), scraped from /metrics/ by staff
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+# Record only this fraction of requests; lower it on busy production dynos
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '1.0'))
@@ -16,9 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from utils.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', metrics_view, name='metrics'),
     path("accounts/", include("allauth.urls")),
     path('booking/', include('booking.urls'), name="booking-urls"),
     path('logbook/', include('logbook.urls'), name="logbook-urls"),
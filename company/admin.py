@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Company, Venue, Coach, UserProfile, Token, RefundRequest, Image, TokenPurchase
+from .models import Company, Venue, Coach, UserProfile, Token, RefundRequest, Image, TokenPurchase, TokenLedgerEntry, TokenBalance, OutboxEmail, StripeEvent
 
 # Register your models here.
 admin.site.register(Company)
@@ -8,4 +8,8 @@ admin.site.register(UserProfile)
 admin.site.register(Token)
 admin.site.register(RefundRequest)
 admin.site.register(Image)
-admin.site.register(TokenPurchase)
\ No newline at end of file
+admin.site.register(TokenPurchase)
+admin.site.register(TokenLedgerEntry)
+admin.site.register(TokenBalance)
+admin.site.register(OutboxEmail)
+admin.site.register(StripeEvent)
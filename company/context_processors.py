@@ -1,7 +1,51 @@
 # company/context_processors.py
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from utils.cache import cache_is_shared
 from .models import Image
 
+APP_LOGOS_CACHE_KEY = 'app_logos'
+APP_LOGOS_CACHE_TIMEOUT = getattr(settings, 'APP_LOGOS_CACHE_TIMEOUT', 60 * 60)
+# How long a process trusts its own copy before re-checking the shared cache
+APP_LOGOS_LOCAL_TIMEOUT = getattr(settings, 'APP_LOGOS_LOCAL_TIMEOUT', 60)
+
+_local_logos = None
+_local_expires = 0.0
+
+
+def get_app_logos():
+    """
+    Logo name -> URL map. Kept per process and in the shared cache,
+    so the Image table and Cloudinary URL building are only hit on a miss.
+    Without a shared cache only the short per-process copy is kept, since
+    an admin save could not clear the other workers' entries.
+    """
+    global _local_logos, _local_expires
+    now = time.monotonic()
+    if _local_logos is not None and now < _local_expires:
+        return _local_logos
+
+    shared = cache_is_shared()
+    logos = cache.get(APP_LOGOS_CACHE_KEY) if shared else None
+    if logos is None:
+        logos = {logo.name: logo.image.url for logo in Image.objects.all()}
+        if shared:
+            cache.set(APP_LOGOS_CACHE_KEY, logos, APP_LOGOS_CACHE_TIMEOUT)
+
+    _local_logos = logos
+    _local_expires = now + APP_LOGOS_LOCAL_TIMEOUT
+    return logos
+
+
+def invalidate_app_logos():
+    global _local_logos
+    _local_logos = None
+    cache.delete(APP_LOGOS_CACHE_KEY)
+
+
 def app_logos(request):
-    logos = Image.objects.all()
-    logos_dict = {logo.name: logo.image.url for logo in logos}
-    return {'app_logos': logos_dict}
+    # Lazy so pages that never reference app_logos don't load them
+    return {'app_logos': SimpleLazyObject(get_app_logos)}
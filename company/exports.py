@@ -0,0 +1,96 @@
+import csv
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from booking.models import Booking
+from .models import RefundRequest, Token, TokenPurchase
+
+EXPORT_CHUNK_SIZE = 2000
+
+# name -> model, company lookup, date lookup (for the range filter) and exported columns
+EXPORTS = {
+    'bookings': {
+        'model': Booking,
+        'company': 'company',
+        'date': 'event_date',
+        'fields': [
+            'id', 'user__username', 'user__email', 'event_id', 'event__event_name',
+            'event__date_of_event', 'event__start_time', 'event__end_time', 'status', 'created_on',
+        ],
+    },
+    'tokens': {
+        'model': Token,
+        'company': 'company',
+        'date': 'purchased_on__date',
+        'fields': ['id', 'user__username', 'purchased_on', 'used', 'refunded', 'booking_id', 'purchase_id'],
+    },
+    'purchases': {
+        'model': TokenPurchase,
+        'company': 'company',
+        'date': 'timestamp__date',
+        'fields': [
+            'id', 'user__username', 'tokens_bought', 'total_price', 'timestamp', 'stripe_payment_intent_id',
+        ],
+    },
+    'refunds': {
+        'model': RefundRequest,
+        'company': 'token__company',
+        'date': 'created_at__date',
+        'fields': ['id', 'user__username', 'token_id', 'status', 'created_at', 'reviewed_by__username'],
+    },
+}
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+
+def export_rows(kind, company, start_date=None, end_date=None):
+    """
+    Yield the export's rows as dicts. Rows are streamed from the database
+    in chunks, so memory use doesn't grow with the size of the export.
+    """
+    spec = EXPORTS[kind]
+    rows = spec['model'].objects.filter(**{spec['company']: company})
+    if start_date:
+        rows = rows.filter(**{f"{spec['date']}__gte": start_date})
+    if end_date:
+        rows = rows.filter(**{f"{spec['date']}__lte": end_date})
+    return rows.order_by('pk').values(*spec['fields']).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+# Spreadsheets run a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    value = _plain(value)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class Echo:
+    """File-like object whose write() hands back the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def export_lines(kind, rows, fmt):
+    """Encode rows as CSV (with a header) or JSON Lines, one string per row."""
+    fields = EXPORTS[kind]['fields']
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow([_csv_cell(row[field]) for field in fields])
+    else:
+        for row in rows:
+            yield json.dumps({field: _plain(row[field]) for field in fields}) + "\n"
@@ -1,7 +1,10 @@
+import uuid
+
 from allauth.account.forms import SignupForm
 from django import forms
 from django.contrib.auth.models import User
 from company.models import Company, Coach, Venue, Token
+from company.tokens import issue_tokens
 
 class CustomSignupForm(SignupForm):
     company = forms.ModelChoiceField(
@@ -152,17 +155,20 @@ class EditVenueForm(forms.Form):
 
 class PurchaseTokenForm(forms.Form):
     token_count = forms.IntegerField(min_value=1, max_value=10, label="Number of Tokens", required=True)
+    # Fresh per rendered form; the checkout idempotency key is built from it
+    checkout_nonce = forms.CharField(widget=forms.HiddenInput, required=False)
 
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)  # Extract the 'user' argument
         super().__init__(*args, **kwargs)
+        if not self.is_bound:
+            self.fields['checkout_nonce'].initial = uuid.uuid4().hex
         if user and hasattr(user, 'profile') and user.profile.company:
             self.company = user.profile.company
 
     def save(self):
         token_count = self.cleaned_data['token_count']
-        for _ in range(token_count):
-            Token.objects.create(user=self.company.manager, company=self.company)
+        issue_tokens(self.company.manager, self.company, token_count)
         return token_count
     
 class JoinCompanyForm(forms.Form):
@@ -179,3 +185,52 @@ class TokenPriceUpdateForm(forms.ModelForm):
         fields = ['token_price']
         labels = {'token_price': 'Token Price (£)'}
 
+
+
+class ExportForm(forms.Form):
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')], required=False)
+    start_date = forms.DateField(required=False)
+    end_date = forms.DateField(required=False)
+
+    def clean(self):
+        cleaned = super().clean()
+        start, end = cleaned.get('start_date'), cleaned.get('end_date')
+        if start and end and start > end:
+            raise forms.ValidationError("Start date must be before the end date.")
+        return cleaned
+
+
+class BookingFilterForm(forms.Form):
+    STATUS_CHOICES = [('', 'Any status'), ('0', 'Active'), ('1', 'Expired')]
+
+    start_date = forms.DateField(
+        required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    end_date = forms.DateField(
+        required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    event = forms.CharField(
+        required=False, max_length=200, label="Event name",
+        widget=forms.TextInput(attrs={'class': 'form-control'})
+    )
+    client = forms.CharField(
+        required=False, max_length=150, label="Client username",
+        widget=forms.TextInput(attrs={'class': 'form-control'})
+    )
+    status = forms.ChoiceField(
+        required=False, choices=STATUS_CHOICES, widget=forms.Select(attrs={'class': 'form-control'})
+    )
+
+    def filter(self, bookings):
+        data = self.cleaned_data
+        if data.get('start_date'):
+            bookings = bookings.filter(event_date__gte=data['start_date'])
+        if data.get('end_date'):
+            bookings = bookings.filter(event_date__lte=data['end_date'])
+        if data.get('event'):
+            bookings = bookings.filter(event__event_name__icontains=data['event'])
+        if data.get('client'):
+            bookings = bookings.filter(user__username__icontains=data['client'])
+        if data.get('status'):
+            bookings = bookings.filter(status=int(data['status']))
+        return bookings
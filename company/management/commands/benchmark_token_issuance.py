@@ -0,0 +1,51 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from company.models import Company, Token, UserProfile
+from company.tokens import issue_tokens
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compares issue_tokens() with the old one-INSERT-per-token loop. Nothing is kept in the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200, help="Tokens issued per run")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per strategy")
+
+    def old_loop(self, user, company, count):
+        for _ in range(count):
+            Token.objects.create(user=user, company=company)
+        profile = UserProfile.objects.get(user=user)
+        profile.token_count += count
+        profile.save()
+
+    def time_strategy(self, strategy, count, repeat):
+        timings, queries = [], 0
+        for _ in range(repeat):
+            try:
+                with transaction.atomic():
+                    user = User.objects.create_user(username='token-benchmark-user')
+                    company = Company.objects.create(name='Token Benchmark', manager=user)
+                    with CaptureQueriesContext(connection) as captured:
+                        started = time.perf_counter()
+                        strategy(user, company, count)
+                        timings.append(time.perf_counter() - started)
+                    queries = len(captured.captured_queries)
+                    raise Rollback
+            except Rollback:
+                pass
+        return min(timings), queries
+
+    def handle(self, *args, **options):
+        count, repeat = options['count'], options['repeat']
+        for name, strategy in [('loop', self.old_loop), ('issue_tokens', issue_tokens)]:
+            best, queries = self.time_strategy(strategy, count, repeat)
+            self.stdout.write(f"{name:<14} {count} tokens: best {best * 1000:.1f} ms, {queries} queries")
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from company.exports import EXPORT_FORMATS, EXPORTS, export_lines, export_rows
+from company.models import Company
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = "Streams bookings, tokens, purchases or refund requests for one company as CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--company', type=int, required=True, help="Company id to export")
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--start', type=parse_date, help="First date to include (YYYY-MM-DD)")
+        parser.add_argument('--end', type=parse_date, help="Last date to include (YYYY-MM-DD)")
+        parser.add_argument('--output', help="File to write to (default: stdout)")
+
+    def handle(self, *args, **options):
+        if not Company.objects.filter(pk=options['company']).exists():
+            raise CommandError(f"Company {options['company']} does not exist")
+
+        kind = options['kind']
+        rows = export_rows(kind, options['company'], options['start'], options['end'])
+        lines = export_lines(kind, rows, options['format'])
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+                out.writelines(lines)
+            self.stderr.write(self.style.SUCCESS(f"{kind} export written to {options['output']}"))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from company.webhooks import process_next_stripe_event
+
+
+class Command(BaseCommand):
+    help = "Processes Stripe webhook events waiting in the inbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Process the events that are currently due and exit instead of polling."
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=2.0,
+            help="Seconds to wait between polls when the inbox is empty (default: 2)."
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            stripe_event = process_next_stripe_event()
+            if stripe_event is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            processed += 1
+            line = f"{stripe_event.type} {stripe_event.stripe_event_id}: {stripe_event.status}"
+            if stripe_event.last_error:
+                self.stderr.write(f"{line} - {stripe_event.last_error}")
+            else:
+                self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS(f"{processed} events processed"))
@@ -0,0 +1,74 @@
+import json
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from company.models import StripeEvent
+from company.webhooks import process_stripe_event, sign_payload
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-drives stored Stripe events. By default the handlers run in this process inside a "
+        "transaction that is rolled back; --commit keeps the result, and --url instead posts the "
+        "signed events to a webhook endpoint such as a local dev server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_ids', nargs='*', help="Stripe event ids (evt_...) to replay")
+        parser.add_argument('--type', help="Only replay events of this type")
+        parser.add_argument('--status', choices=[choice for choice, _ in StripeEvent.STATUS_CHOICES],
+                            help="Only replay events with this status, e.g. dead")
+        parser.add_argument('--limit', type=int, default=100)
+        parser.add_argument('--commit', action='store_true',
+                            help="Keep the handlers' changes and the events' new status")
+        parser.add_argument('--url', help="POST the events to this webhook URL instead of running them here")
+        parser.add_argument('--secret', help="Signing secret for --url (default: STRIPE_WEBHOOK_SECRET)")
+
+    def handle(self, *args, **options):
+        events = StripeEvent.objects.order_by('received_at', 'id')
+        if options['event_ids']:
+            events = events.filter(stripe_event_id__in=options['event_ids'])
+        if options['type']:
+            events = events.filter(type=options['type'])
+        if options['status']:
+            events = events.filter(status=options['status'])
+        events = list(events[:options['limit']])
+        if not events:
+            raise CommandError("No stored events match.")
+
+        for stripe_event in events:
+            if options['url']:
+                outcome = self.post(stripe_event, options['url'], options['secret'] or settings.STRIPE_WEBHOOK_SECRET)
+            else:
+                outcome = self.run(stripe_event, options['commit'])
+            self.stdout.write(f"{stripe_event.type} {stripe_event.stripe_event_id}: {outcome}")
+
+        self.stdout.write(self.style.SUCCESS(f"{len(events)} events replayed"))
+
+    def run(self, stripe_event, commit):
+        with transaction.atomic():
+            locked = StripeEvent.objects.select_for_update().get(pk=stripe_event.pk)
+            locked.status, locked.attempts = 'pending', 0
+            process_stripe_event(locked)
+            outcome = locked.status + (f" - {locked.last_error}" if locked.last_error else "")
+            if not commit:
+                transaction.set_rollback(True)
+        return outcome
+
+    def post(self, stripe_event, url, secret):
+        payload = json.dumps(stripe_event.payload)
+        request = urllib.request.Request(url, data=payload.encode(), method='POST', headers={
+            'Content-Type': 'application/json',
+            'Stripe-Signature': sign_payload(payload, secret),
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return f"HTTP {response.status}"
+        except urllib.error.HTTPError as e:
+            return f"HTTP {e.code}"
+        except urllib.error.URLError as e:
+            raise CommandError(f"Could not reach {url}: {e.reason}")
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from utils.email import send_outbox_batch
+
+
+class Command(BaseCommand):
+    help = "Sends queued outbox emails in batches over a reused SMTP connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Send the emails that are currently due and exit instead of polling."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help="Emails sent per SMTP connection (default: 50)."
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=5.0,
+            help="Seconds to wait between polls when nothing is due (default: 5)."
+        )
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = send_outbox_batch(options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f"Batch: {sent} sent, {failed} failed")
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"{total_sent} emails sent, {total_failed} failed"))
@@ -0,0 +1,16 @@
+from django.utils.functional import SimpleLazyObject
+from .roles import get_user_roles
+
+
+class RoleMiddleware:
+    """
+    Attaches request.roles, resolved lazily on first access so views that
+    never check a role don't pay for the lookup.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.roles = SimpleLazyObject(lambda: get_user_roles(request.user))
+        return self.get_response(request)
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.17 on 2026-10-17 23:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Q
+
+
+def backfill_balances(apps, schema_editor):
+    Token = apps.get_model('company', 'Token')
+    TokenBalance = apps.get_model('company', 'TokenBalance')
+    TokenLedgerEntry = apps.get_model('company', 'TokenLedgerEntry')
+
+    totals = Token.objects.values('user_id', 'company_id').annotate(
+        available=Count('id', filter=Q(used=False, refunded=False))
+    ).order_by()
+    balances, entries = [], []
+    for row in totals.iterator():
+        balances.append(TokenBalance(user_id=row['user_id'], company_id=row['company_id'],
+                                     balance=row['available']))
+        if row['available']:
+            entries.append(TokenLedgerEntry(user_id=row['user_id'], company_id=row['company_id'],
+                                            delta=row['available'], reason='opening'))
+    TokenBalance.objects.bulk_create(balances, batch_size=1000)
+    TokenLedgerEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('company', '0020_company_stripe_customer_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField()),
+                ('reason', models.CharField(choices=[('opening', 'Opening balance'), ('purchase', 'Purchase'), ('booking', 'Booking'), ('release', 'Booking released'), ('refund', 'Refund'), ('refund_denied', 'Refund denied'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='company.company')),
+                ('token', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='company.token')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_ledger', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TokenBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='company.company')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tokenbalance',
+            constraint=models.UniqueConstraint(fields=('user', 'company'), name='unique_token_balance'),
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
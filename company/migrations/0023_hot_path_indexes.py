@@ -0,0 +1,33 @@
+# Generated by Django 4.2.17 on 2026-10-17 23:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0022_outbox_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='refundrequest',
+            index=models.Index(fields=['token', 'status'], name='refund_token_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='refundrequest',
+            index=models.Index(condition=models.Q(('status', 'Pending')), fields=['created_at'], name='refund_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='token',
+            index=models.Index(condition=models.Q(('used', False)), fields=['user', 'company'], name='token_unused_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='token',
+            index=models.Index(fields=['user', 'company', 'used', 'refunded'], name='token_user_company_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='token',
+            index=models.Index(fields=['booking', 'used'], name='token_booking_used_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-18 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0024_stripe_event'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='refundrequest',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Processing', 'Processing'), ('Approved', 'Approved'), ('Denied', 'Denied')], default='Pending', max_length=20),
+        ),
+    ]
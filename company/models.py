@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from cloudinary.models import CloudinaryField
 
@@ -116,9 +117,62 @@ class Token(models.Model):
     def __str__(self):
         return f"Token for {self.user.username} - Used: {self.used}"
 
+    class Meta:
+        indexes = [
+            # Picking a spendable token when booking
+            models.Index(
+                fields=['user', 'company'], condition=models.Q(used=False),
+                name='token_unused_idx'
+            ),
+            # Balance and history listings by state
+            models.Index(fields=['user', 'company', 'used', 'refunded'], name='token_user_company_state_idx'),
+            # The token that paid for a booking, on cancel and refund
+            models.Index(fields=['booking', 'used'], name='token_booking_used_idx'),
+        ]
+
+# Token ledger - an append-only record of every change to a user's
+# spendable tokens, with TokenBalance holding the running total
+class TokenLedgerEntry(models.Model):
+    REASON_CHOICES = [
+        ('opening', 'Opening balance'),
+        ('purchase', 'Purchase'),
+        ('booking', 'Booking'),
+        ('release', 'Booking released'),
+        ('refund', 'Refund'),
+        ('refund_denied', 'Refund denied'),
+        ('adjustment', 'Adjustment'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='token_ledger')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    token = models.ForeignKey(Token, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user.username} {self.delta:+d} ({self.reason})"
+
+
+class TokenBalance(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='token_balances')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    balance = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'company'], name='unique_token_balance'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} has {self.balance} token(s) with {self.company}"
+
+
 class RefundRequest(models.Model):
     STATUS_CHOICES = [
         ('Pending', 'Pending'),
+        ('Processing', 'Processing'),  # claimed by an approval that is calling Stripe
         ('Approved', 'Approved'),
         ('Denied', 'Denied'),
     ]
@@ -140,3 +194,76 @@ class RefundRequest(models.Model):
     def __str__(self):
         return f"RefundRequest for Token {self.token.id} - Status: {self.status}"
 
+    class Meta:
+        indexes = [
+            # Company refund queue: token__company join filtered by status
+            models.Index(fields=['token', 'status'], name='refund_token_status_idx'),
+            models.Index(
+                fields=['created_at'], condition=models.Q(status='Pending'),
+                name='refund_pending_idx'
+            ),
+        ]
+
+
+
+class OutboxEmail(models.Model):
+    """
+    An email waiting to be sent by the send_outbox_emails worker. Written
+    in the same transaction as the change it reports on, so a rolled back
+    booking never emails and an SMTP outage never fails a booking.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead'),  # gave up after max attempts
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)} ({self.status})"
+
+
+class StripeEvent(models.Model):
+    """
+    A Stripe webhook event, stored as soon as its signature checks out and
+    processed later by the process_stripe_events worker. The unique event id
+    means Stripe's retries of the same event are stored, and handled, once.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),  # no handler for the event type
+        ('dead', 'Dead'),  # handler gave up, see last_error
+    ]
+
+    stripe_event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='stripe_event_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.stripe_event_id} ({self.status})"
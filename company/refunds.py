@@ -0,0 +1,196 @@
+"""
+Bulk refund approval. Pending requests are grouped by the PaymentIntent
+that paid for their tokens, and each PaymentIntent gets one Stripe refund
+for the summed amount. Refunds for different PaymentIntents are issued
+concurrently; the database is then updated with a handful of set-based
+UPDATEs rather than a save() per token.
+
+Requests are claimed (Pending -> Processing, with their tokens locked)
+before Stripe is called, so overlapping approvals - a double submit, or
+"approve all" alongside a ticked subset - never refund a token twice.
+"""
+import hashlib
+import logging
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from utils.email import send_custom_email
+from . import stripe_gateway
+from .models import RefundRequest, Token
+from .tokens import record_token_change
+
+logger = logging.getLogger(__name__)
+
+# Concurrent Stripe calls per bulk approval
+REFUND_MAX_WORKERS = getattr(settings, 'REFUND_MAX_WORKERS', 4)
+
+
+def _refund_key(payment_intent, token_ids):
+    # Same PaymentIntent and tokens -> same key, so a retried batch can't refund twice
+    digest = hashlib.sha256(",".join(map(str, sorted(token_ids))).encode()).hexdigest()[:32]
+    return f"refund-{payment_intent}-{digest}"
+
+
+def claim_refund_requests(company_id, items):
+    """
+    Move the items' requests from Pending to Processing and return the
+    items that were claimed; the rest get an error. Each item needs
+    request_id, token_id and user_id. Tokens are locked
+    first, so a competing claim waits and then sees the Processing request.
+    Spendable tokens leave the balance here, as refund_token does when a
+    client asks for a refund, so they can't be booked while Stripe is called.
+    """
+    token_ids = sorted({item['token_id'] for item in items})
+    with transaction.atomic():
+        tokens = {
+            token['id']: token for token in
+            Token.objects.select_for_update().filter(id__in=token_ids).order_by('id').values('id', 'used', 'refunded')
+        }
+        busy = set(RefundRequest.objects.filter(
+            token_id__in=token_ids, status__in=['Processing', 'Approved']
+        ).values_list('token_id', flat=True))
+        pending = set(RefundRequest.objects.filter(
+            id__in=[item['request_id'] for item in items], status='Pending'
+        ).values_list('id', flat=True))
+
+        claimed, debits = [], Counter()
+        for item in items:
+            token = tokens.get(item['token_id'])
+            if item['request_id'] not in pending or item['token_id'] in busy:
+                item['error'] = 'Request was claimed by another approval.'
+            elif token is None or (token['used'] and not token['refunded']):
+                item['error'] = 'Token was used for a booking.'
+            else:
+                busy.add(item['token_id'])
+                claimed.append(item)
+                if not (token['used'] or token['refunded']):
+                    debits[item['user_id']] += 1
+        if not claimed:
+            return claimed
+
+        RefundRequest.objects.filter(id__in=[item['request_id'] for item in claimed]).update(status='Processing')
+        # update() skips the Token signals, so the balance is moved by the rows actually taken out
+        for user_id in debits:
+            taken = Token.objects.filter(
+                id__in=[item['token_id'] for item in claimed if item['user_id'] == user_id],
+                used=False, refunded=False,
+            ).update(used=True, refunded=True)
+            record_token_change(user_id, company_id, -taken, 'refund')
+    return claimed
+
+
+def release_refund_requests(request_ids):
+    """Put claimed requests back in the queue after Stripe refused the refund."""
+    RefundRequest.objects.filter(id__in=request_ids, status='Processing').update(status='Pending')
+
+
+def _issue_refund(payment_intent, items, reviewer):
+    token_ids = [item['token_id'] for item in items]
+    try:
+        refund = stripe_gateway.create_refund(
+            _refund_key(payment_intent, token_ids),
+            payment_intent=payment_intent,
+            amount=sum(item['amount'] for item in items),
+            metadata={
+                "refunded_by": reviewer.get_full_name() or reviewer.username,
+                "reviewer_user_id": reviewer.id,
+                "token_ids": ",".join(map(str, token_ids)),
+            },
+        )
+    except stripe.error.StripeError as e:
+        return None, str(e.user_message or e)
+    except Exception as e:
+        logger.exception(f"Unexpected error refunding PaymentIntent {payment_intent}")
+        return None, str(e)
+    return refund, None
+
+
+def bulk_approve_refunds(company, reviewer, request_ids=None, max_workers=None):
+    """
+    Approve the company's pending refund requests (all, or those in
+    request_ids). Returns one result dict per request with its status
+    ('approved', 'failed' or 'skipped'), amount in pence and value in
+    pounds, PaymentIntent, and refund id or error.
+    """
+    pending = RefundRequest.objects.filter(token__company=company, status='Pending').select_related(
+        'user', 'token__purchase'
+    ).annotate(
+        # refund_token flags the token refunded as soon as the request is made, so the flag
+        # can't tell us whether Stripe was called; an approved request for the token can
+        already_refunded=Exists(RefundRequest.objects.filter(token=OuterRef('token'), status='Approved')),
+    ).order_by('created_at', 'id')
+    if request_ids is not None:
+        pending = pending.filter(id__in=request_ids)
+
+    results, candidates, seen_tokens = [], [], set()
+    for refund_request in pending:
+        token, purchase = refund_request.token, refund_request.token.purchase
+        item = {
+            'request_id': refund_request.id, 'token_id': token.id, 'user_id': refund_request.user_id,
+            'username': refund_request.user.username, 'email': refund_request.user.email,
+            'payment_intent': purchase.stripe_payment_intent_id if purchase else None,
+            'amount': int(purchase.get_cost_per_token() * 100) if purchase else 0,
+            'status': 'skipped', 'refund_id': None, 'error': '',
+        }
+        item['value'] = item['amount'] / 100
+        results.append(item)
+        if refund_request.already_refunded:
+            item['error'] = 'Token was already refunded.'
+        elif token.id in seen_tokens:
+            item['error'] = 'Another request for this token is in the batch.'
+        elif not item['payment_intent']:
+            item['error'] = 'Token purchase has no Stripe PaymentIntent.'
+        else:
+            seen_tokens.add(token.id)
+            candidates.append(item)
+
+    groups = defaultdict(list)
+    if candidates:
+        for item in claim_refund_requests(company.pk, candidates):
+            groups[item['payment_intent']].append(item)
+
+    if groups:
+        workers = max(1, min(max_workers or REFUND_MAX_WORKERS, len(groups)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                payment_intent: pool.submit(_issue_refund, payment_intent, items, reviewer)
+                for payment_intent, items in groups.items()
+            }
+        for payment_intent, future in futures.items():
+            refund, error = future.result()
+            for item in groups[payment_intent]:
+                item['status'] = 'approved' if refund else 'failed'
+                item['refund_id'] = refund.id if refund else None
+                item['error'] = error or ''
+
+    failed = [item['request_id'] for item in results if item['status'] == 'failed']
+    if failed:
+        release_refund_requests(failed)
+    approved = [item for item in results if item['status'] == 'approved']
+    if approved:
+        _record_approvals(reviewer, approved)
+    return results
+
+
+def _record_approvals(reviewer, approved):
+    with transaction.atomic():
+        # The tokens already left the balance when their requests were made or claimed
+        RefundRequest.objects.filter(
+            id__in=[item['request_id'] for item in approved], status='Processing'
+        ).update(status='Approved', reviewed_by=reviewer)
+
+        by_user = defaultdict(list)
+        for item in approved:
+            by_user[(item['username'], item['email'])].append(item)
+        for (username, email), items in by_user.items():
+            total = sum(item['value'] for item in items)
+            send_custom_email(
+                subject="Token Refund Confirmation",
+                message=f"Dear {username},\n\n{len(items)} of your tokens have been refunded by {reviewer.username}. Refund value: £{total:.2f}. If you have any questions, please contact your gym.\n\nBest regards,\nClassifyBooking Team",
+                recipient_list=[email]
+            )
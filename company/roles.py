@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.contrib.auth.models import User
+from utils.cache import cache_is_shared
+from .models import Coach
+
+ROLE_CACHE_TIMEOUT = getattr(settings, 'ROLE_CACHE_TIMEOUT', 300)
+
+
+def _cache_key(user_id):
+    return f"roles:{user_id}"
+
+
+class UserRoles:
+    """
+    Role and company membership of a single user.
+    Built once per request by RoleMiddleware and exposed as request.roles.
+    """
+
+    def __init__(self, company_id=None, manager_id=None, coach_id=None,
+                 coach_company_id=None, user_id=None):
+        self.user_id = user_id
+        self.company_id = company_id
+        self.coach_id = coach_id
+        self.coach_company_id = coach_company_id
+        self.is_manager = user_id is not None and manager_id == user_id
+
+    @property
+    def is_coach(self):
+        return self.coach_id is not None
+
+    @property
+    def is_client(self):
+        return self.company_id is not None and not (self.is_coach or self.is_manager)
+
+    def manages(self, company_id):
+        return self.is_manager and self.company_id == company_id
+
+
+def _load_roles(user_id):
+    # One query: profile company, its manager and the user's coach row
+    coaches = Coach.objects.filter(coach_id=OuterRef('pk')).order_by('id')
+    row = User.objects.filter(pk=user_id).values(
+        'profile__company_id',
+        'profile__company__manager_id',
+    ).annotate(
+        coach_id=Subquery(coaches.values('id')[:1]),
+        coach_company_id=Subquery(coaches.values('company_id')[:1]),
+    ).first() or {}
+    return {
+        'user_id': user_id,
+        'company_id': row.get('profile__company_id'),
+        'manager_id': row.get('profile__company__manager_id'),
+        'coach_id': row.get('coach_id'),
+        'coach_company_id': row.get('coach_company_id'),
+    }
+
+
+def roles_cache_is_shared():
+    """Roles are only kept between requests in a cache every worker shares (e.g. Redis or Memcached)."""
+    # A revoked coach or manager would otherwise keep access in other workers until expiry
+    return ROLE_CACHE_TIMEOUT > 0 and cache_is_shared()
+
+
+def get_user_roles(user):
+    # RoleMiddleware resolves this lazily once per request, so without a shared
+    # cache it is still a single query per request
+    if not user.is_authenticated:
+        return UserRoles()
+    if not roles_cache_is_shared():
+        return UserRoles(**_load_roles(user.pk))
+
+    key = _cache_key(user.pk)
+    data = cache.get(key)
+    if data is None:
+        data = _load_roles(user.pk)
+        cache.set(key, data, ROLE_CACHE_TIMEOUT)
+    return UserRoles(**data)
+
+
+def invalidate_user_roles(*user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids if user_id])
@@ -1,9 +1,85 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .models import UserProfile, Coach, Company, Token, Image
+from .context_processors import invalidate_app_logos
+from .roles import invalidate_user_roles
+from .tokens import is_available, record_token_change
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        UserProfile.objects.create(user=instance)
\ No newline at end of file
+        UserProfile.objects.create(user=instance)
+
+
+@receiver([post_save, post_delete], sender=Image)
+def invalidate_logos_on_image_change(sender, instance, **kwargs):
+    invalidate_app_logos()
+
+
+# Cached roles are keyed by user, so drop the entry whenever something
+# that feeds into them changes.
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_roles_on_profile_change(sender, instance, **kwargs):
+    invalidate_user_roles(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Coach)
+def invalidate_roles_on_coach_change(sender, instance, **kwargs):
+    invalidate_user_roles(instance.coach_id)
+
+
+@receiver(pre_save, sender=Company)
+def remember_company_manager(sender, instance, **kwargs):
+    instance._previous_manager_id = None
+    if instance.pk:
+        instance._previous_manager_id = Company.objects.filter(pk=instance.pk).values_list(
+            'manager_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Company)
+def invalidate_roles_on_company_change(sender, instance, **kwargs):
+    # Both the new manager and the one being replaced
+    invalidate_user_roles(instance.manager_id, getattr(instance, '_previous_manager_id', None))
+
+
+@receiver(pre_delete, sender=Company)
+def invalidate_roles_on_company_delete(sender, instance, **kwargs):
+    member_ids = UserProfile.objects.filter(company=instance).values_list('user_id', flat=True)
+    invalidate_user_roles(instance.manager_id, *member_ids)
+
+
+# Keep the token ledger in step with every Token write that goes through save()/delete()
+@receiver(pre_save, sender=Token)
+def remember_token_state(sender, instance, **kwargs):
+    instance._previous_state = None
+    if instance.pk:
+        instance._previous_state = Token.objects.filter(pk=instance.pk).values('used', 'refunded').first()
+
+
+@receiver(post_save, sender=Token)
+def record_token_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_state', None)
+    now_available = is_available(instance)
+
+    if created or previous is None:
+        if now_available:
+            record_token_change(instance.user_id, instance.company_id, 1, 'purchase', instance)
+        return
+
+    was_available = not (previous['used'] or previous['refunded'])
+    if was_available and not now_available:
+        reason = 'refund' if instance.refunded else 'booking' if instance.booking_id else 'adjustment'
+        record_token_change(instance.user_id, instance.company_id, -1, reason, instance)
+    elif now_available and not was_available:
+        reason = 'refund_denied' if previous['refunded'] else 'release'
+        record_token_change(instance.user_id, instance.company_id, 1, reason, instance)
+
+
+@receiver(post_delete, sender=Token)
+def record_token_delete(sender, instance, origin=None, **kwargs):
+    # Skip cascades from deleting the user or company - their ledger goes with them
+    deleted_directly = isinstance(origin, Token) or getattr(origin, 'model', None) is Token
+    if deleted_directly and is_available(instance):
+        record_token_change(instance.user_id, instance.company_id, -1, 'adjustment')
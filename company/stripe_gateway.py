@@ -0,0 +1,205 @@
+"""
+Every Stripe API call the app makes goes through this module.
+
+The live backend configures the stripe library once: connect/read timeouts,
+bounded network retries, and a requests-based client that keeps one
+persistent session per thread, so repeat calls skip the TLS handshake.
+Callers pass idempotency keys, so a retried or double-submitted request
+never refunds or charges twice.
+
+With STRIPE_BACKEND = 'fake', calls go to FakeStripeBackend instead. It
+needs no network, answers with Stripe-shaped objects after
+STRIPE_FAKE_LATENCY seconds, and delivers checkout.session.completed into
+the webhook inbox, so checkout, refunds and onboarding can be load tested
+offline.
+"""
+import itertools
+import json
+import threading
+import time
+
+import stripe
+from django.conf import settings
+
+_configured = False
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def configure_stripe():
+    """Apply the API key, timeouts and retry policy to the stripe library (once per process)."""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    stripe.max_network_retries = getattr(settings, 'STRIPE_MAX_NETWORK_RETRIES', 2)
+    stripe.default_http_client = stripe.RequestsClient(timeout=(
+        getattr(settings, 'STRIPE_CONNECT_TIMEOUT', 3),
+        getattr(settings, 'STRIPE_READ_TIMEOUT', 20),
+    ))
+
+
+class LiveStripeBackend:
+    """Calls the real Stripe API through the stripe library."""
+
+    def __init__(self):
+        configure_stripe()
+
+    def create_account(self, idempotency_key, **params):
+        return stripe.Account.create(idempotency_key=idempotency_key, **params)
+
+    def retrieve_account(self, account_id):
+        return stripe.Account.retrieve(account_id)
+
+    def create_account_link(self, **params):
+        return stripe.AccountLink.create(**params)
+
+    def create_checkout_session(self, idempotency_key, **params):
+        return stripe.checkout.Session.create(idempotency_key=idempotency_key, **params)
+
+    def create_refund(self, idempotency_key, **params):
+        return stripe.Refund.create(idempotency_key=idempotency_key, **params)
+
+
+class FakeStripeBackend:
+    """
+    In-process stand-in for Stripe. State lives in memory for the life of
+    the process, and a repeated idempotency key returns the original object.
+    """
+
+    def __init__(self, latency=None):
+        self.latency = getattr(settings, 'STRIPE_FAKE_LATENCY', 0) if latency is None else latency
+        self.accounts = {}
+        self.payment_intents = {}  # id -> amount still refundable, in pence
+        self._responses = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _new_id(self, prefix):
+        with self._lock:
+            return f"{prefix}_fake_{next(self._ids)}"
+
+    def _object(self, values):
+        return stripe.StripeObject.construct_from(values, None)
+
+    def _idempotent(self, key, create):
+        with self._lock:
+            if key in self._responses:
+                return self._responses[key]
+        response = create()
+        with self._lock:
+            return self._responses.setdefault(key, response)
+
+    def create_account(self, idempotency_key, **params):
+        self._wait()
+
+        def create():
+            account = {'id': self._new_id('acct'), 'object': 'account', 'details_submitted': False,
+                       'business_type': params.get('business_type'), 'email': params.get('email')}
+            self.accounts[account['id']] = account
+            return self._object(account)
+        return self._idempotent(idempotency_key, create)
+
+    def retrieve_account(self, account_id):
+        self._wait()
+        if account_id not in self.accounts:
+            # Accounts created before this process started are taken as fully onboarded
+            self.accounts[account_id] = {'id': account_id, 'object': 'account', 'details_submitted': True,
+                                         'business_type': 'individual'}
+        return self._object(self.accounts[account_id])
+
+    def create_account_link(self, **params):
+        self._wait()
+        # Onboarding "completes" immediately: the link goes straight back to the app
+        self.accounts.setdefault(params['account'], {'id': params['account'], 'object': 'account'})
+        self.accounts[params['account']]['details_submitted'] = True
+        return self._object({'object': 'account_link', 'url': params['return_url']})
+
+    def create_checkout_session(self, idempotency_key, **params):
+        self._wait()
+
+        def create():
+            amount = sum(item['price_data']['unit_amount'] * item['quantity'] for item in params['line_items'])
+            payment_intent = self._new_id('pi')
+            self.payment_intents[payment_intent] = amount
+            session = {
+                'id': self._new_id('cs'), 'object': 'checkout.session', 'url': params['success_url'],
+                'payment_status': 'paid', 'amount_total': amount, 'payment_intent': payment_intent,
+                'metadata': params.get('metadata', {}),
+            }
+            self._deliver('checkout.session.completed', session)
+            return self._object(session)
+        return self._idempotent(idempotency_key, create)
+
+    def create_refund(self, idempotency_key, **params):
+        self._wait()
+
+        def create():
+            payment_intent, amount = params['payment_intent'], params['amount']
+            with self._lock:
+                # Payments made before this process started are assumed to cover the refund
+                remaining = self.payment_intents.get(payment_intent, amount)
+                if amount > remaining:
+                    raise stripe.error.InvalidRequestError(
+                        f"Refund amount ({amount}) is greater than the unrefunded amount ({remaining}).",
+                        'amount',
+                    )
+                self.payment_intents[payment_intent] = remaining - amount
+            return self._object({
+                'id': self._new_id('re'), 'object': 'refund', 'amount': amount, 'currency': 'gbp',
+                'payment_intent': payment_intent, 'status': 'succeeded', 'metadata': params.get('metadata', {}),
+            })
+        return self._idempotent(idempotency_key, create)
+
+    def _deliver(self, event_type, obj):
+        # What Stripe would post to the webhook, stored straight into the inbox
+        from .webhooks import record_stripe_event
+        record_stripe_event(json.dumps({
+            'id': self._new_id('evt'), 'type': event_type, 'data': {'object': obj},
+        }))
+
+
+BACKENDS = {
+    'live': LiveStripeBackend,
+    'fake': FakeStripeBackend,
+}
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = BACKENDS[getattr(settings, 'STRIPE_BACKEND', 'live')]()
+    return _backend
+
+
+def set_backend(backend):
+    """Swap the backend, e.g. a FakeStripeBackend in tests. None re-reads STRIPE_BACKEND."""
+    global _backend
+    _backend = backend
+
+
+def create_account(idempotency_key, **params):
+    return get_backend().create_account(idempotency_key, **params)
+
+
+def retrieve_account(account_id):
+    return get_backend().retrieve_account(account_id)
+
+
+def create_account_link(**params):
+    return get_backend().create_account_link(**params)
+
+
+def create_checkout_session(idempotency_key, **params):
+    return get_backend().create_checkout_session(idempotency_key, **params)
+
+
+def create_refund(idempotency_key, **params):
+    return get_backend().create_refund(idempotency_key, **params)
@@ -0,0 +1,56 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from company import context_processors
+from company.context_processors import app_logos
+from company.models import Image
+
+
+def fake_url(self, **options):
+    return f"https://images.test/{self.public_id}"
+
+
+@patch('cloudinary.CloudinaryResource.build_url', fake_url)
+class AppLogosTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        context_processors.invalidate_app_logos()
+        self.request = RequestFactory().get('/')
+        Image.objects.create(name='Logo', image='logo_id')
+
+    def test_not_loaded_until_used(self):
+        with CaptureQueriesContext(connection) as queries:
+            context = app_logos(self.request)
+        self.assertEqual(len(queries), 0)
+
+        self.assertEqual(context['app_logos']['Logo'], "https://images.test/logo_id")
+
+    def test_cached_after_first_use(self):
+        app_logos(self.request)['app_logos']['Logo']
+        with CaptureQueriesContext(connection) as queries:
+            logo = app_logos(self.request)['app_logos']['Logo']
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(logo, "https://images.test/logo_id")
+
+    def test_image_changes_invalidate_cache(self):
+        app_logos(self.request)['app_logos']['Logo']
+
+        image = Image.objects.create(name='Logo_text_grey', image='text_id')
+        self.assertIn('Logo_text_grey', app_logos(self.request)['app_logos'])
+
+        image.delete()
+        self.assertNotIn('Logo_text_grey', app_logos(self.request)['app_logos'])
+
+    def test_process_local_cache_is_not_written(self):
+        app_logos(self.request)['app_logos']['Logo']
+        self.assertIsNone(cache.get(context_processors.APP_LOGOS_CACHE_KEY))
+
+    @patch('company.context_processors.cache_is_shared', return_value=True)
+    def test_shared_cache_is_filled_on_a_miss(self, _):
+        app_logos(self.request)['app_logos']['Logo']
+        self.assertEqual(cache.get(context_processors.APP_LOGOS_CACHE_KEY),
+                         {'Logo': "https://images.test/logo_id"})
@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+from datetime import date, time, timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from booking.models import Booking, Event
+from company.models import Coach, Company, Token, Venue
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(username='manager', password='testpass')
+        self.company = Company.objects.create(name='Export Gym', manager=self.manager)
+        self.manager.profile.company = self.company
+        self.manager.profile.save()
+        coach = Coach.objects.create(coach=self.manager, company=self.company)
+        venue = Venue.objects.create(name='Export Venue', company=self.company)
+        self.member = User.objects.create_user(username='member', password='testpass')
+        for offset in range(3):
+            event = Event.objects.create(
+                event_name=f'Class {offset}', date_of_event=date(2025, 3, 1) + timedelta(days=offset),
+                coach=coach, status=1, description='Desc', venue=venue,
+                start_time=time(9, 0), end_time=time(10, 0), capacity=5
+            )
+            Booking.objects.create(event=event, user=self.member)
+        Token.objects.create(user=self.member, company=self.company)
+
+        # Another tenant's data must never leak into the export
+        other_manager = User.objects.create_user(username='other', password='testpass')
+        other = Company.objects.create(name='Other Gym', manager=other_manager)
+        Token.objects.create(user=other_manager, company=other)
+
+    def stream(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_bookings_csv_streams_company_rows(self):
+        self.client.login(username='manager', password='testpass')
+        response = self.client.get(reverse('export_data', args=['bookings']))
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(self.stream(response))))
+        self.assertEqual([r['event__event_name'] for r in rows], ['Class 0', 'Class 1', 'Class 2'])
+        self.assertEqual(rows[0]['user__username'], 'member')
+
+    def test_csv_neutralises_formulas(self):
+        Event.objects.filter(event_name='Class 0').update(event_name='=HYPERLINK("http://evil.example")')
+        self.client.login(username='manager', password='testpass')
+        response = self.client.get(reverse('export_data', args=['bookings']))
+
+        rows = list(csv.DictReader(io.StringIO(self.stream(response))))
+        self.assertEqual(rows[0]['event__event_name'], '\'=HYPERLINK("http://evil.example")')
+
+        response = self.client.get(reverse('export_data', args=['bookings']), {'format': 'jsonl'})
+        rows = [json.loads(line) for line in self.stream(response).splitlines()]
+        self.assertEqual(rows[0]['event__event_name'], '=HYPERLINK("http://evil.example")')
+
+    def test_date_range_and_jsonl(self):
+        self.client.login(username='manager', password='testpass')
+        response = self.client.get(reverse('export_data', args=['bookings']), {
+            'format': 'jsonl', 'start_date': '2025-03-02', 'end_date': '2025-03-02'
+        })
+        rows = [json.loads(line) for line in self.stream(response).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['event__date_of_event'], '2025-03-02')
+
+    def test_tokens_scoped_to_company(self):
+        self.client.login(username='manager', password='testpass')
+        response = self.client.get(reverse('export_data', args=['tokens']))
+        rows = list(csv.DictReader(io.StringIO(self.stream(response))))
+        self.assertEqual([r['user__username'] for r in rows], ['member'])
+
+    def test_non_manager_refused(self):
+        self.client.login(username='member', password='testpass')
+        response = self.client.get(reverse('export_data', args=['bookings']))
+        self.assertRedirects(response, reverse('company_dashboard'), fetch_redirect_response=False)
+
+    def test_unknown_export_and_bad_range(self):
+        self.client.login(username='manager', password='testpass')
+        self.assertEqual(self.client.get(reverse('export_data', args=['users'])).status_code, 404)
+        response = self.client.get(reverse('export_data', args=['bookings']), {
+            'start_date': '2025-03-05', 'end_date': '2025-03-01'
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_command_writes_jsonl(self):
+        out = StringIO()
+        call_command('export_data', 'bookings', company=self.company.pk, format='jsonl', start='2025-03-02', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r['event__event_name'] for r in rows], ['Class 1', 'Class 2'])
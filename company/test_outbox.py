@@ -0,0 +1,115 @@
+from datetime import date, time, timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from booking.models import Event
+from company.models import Coach, Company, OutboxEmail, Token, Venue
+from utils.email import MAX_EMAIL_ATTEMPTS, send_custom_email, send_outbox_batch
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxEmailTest(TestCase):
+    def test_send_custom_email_only_queues(self):
+        send_custom_email("Hello", "Body", ["member@example.com"])
+
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.status, 'pending')
+        self.assertEqual(email.recipients, ["member@example.com"])
+
+    def test_blank_recipients_are_not_queued(self):
+        self.assertIsNone(send_custom_email("Hello", "Body", [""]))
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_sign_up_queues_welcome_email(self):
+        User.objects.create_user(username='newbie', email='newbie@example.com', password='pass1234')
+
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.subject, "Welcome to Classify Booking!")
+        self.assertEqual(email.recipients, ["newbie@example.com"])
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_batch_sent_over_one_connection(self):
+        for n in range(3):
+            send_custom_email(f"Hello {n}", "Body", [f"member{n}@example.com"])
+
+        with patch('utils.email.get_connection', wraps=mail.get_connection) as get_connection:
+            sent, failed = send_outbox_batch()
+
+        self.assertEqual((sent, failed), (3, 0))
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(OutboxEmail.objects.exclude(status='sent').exists())
+
+    def test_failed_send_backs_off_then_dead_letters(self):
+        email = send_custom_email("Hello", "Body", ["member@example.com"])
+
+        with patch('django.core.mail.EmailMessage.send', side_effect=OSError("SMTP down")):
+            self.assertEqual(send_outbox_batch(), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual(email.status, 'pending')
+            self.assertGreater(email.next_attempt_at, timezone.now())
+            self.assertIn("SMTP down", email.last_error)
+
+            # Not due again until the backoff has passed
+            self.assertEqual(send_outbox_batch(), (0, 0))
+
+            OutboxEmail.objects.filter(pk=email.pk).update(
+                attempts=MAX_EMAIL_ATTEMPTS - 1, next_attempt_at=timezone.now()
+            )
+            send_outbox_batch()
+
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'dead')
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_command_drains_outbox(self):
+        send_custom_email("Hello", "Body", ["member@example.com"])
+        out = StringIO()
+        call_command('send_outbox_emails', once=True, stdout=out)
+
+        self.assertIn("1 emails sent, 0 failed", out.getvalue())
+        self.assertEqual(mail.outbox[0].subject, "Hello")
+
+
+class BookingEmailTest(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(username='manager', password='pass1234')
+        self.company = Company.objects.create(name='Mail Gym', manager=self.manager)
+        self.coach = Coach.objects.create(coach=self.manager, company=self.company)
+        self.venue = Venue.objects.create(name='Mail Venue', company=self.company)
+        self.member = User.objects.create_user(
+            username='member', password='pass1234', email='member@example.com'
+        )
+        self.event = Event.objects.create(
+            event_name="Mail Class",
+            date_of_event=date.today() + timedelta(days=1),
+            coach=self.coach,
+            status=0,
+            description='Desc',
+            venue=self.venue,
+            start_time=time(10, 0),
+            end_time=time(11, 0),
+            capacity=5
+        )
+        OutboxEmail.objects.all().delete()  # the member's welcome email
+        self.client.login(username='member', password='pass1234')
+
+    def test_booking_queues_confirmation(self):
+        Token.objects.create(user=self.member, company=self.company)
+        self.client.post(reverse('book_event', args=[self.event.id]))
+
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.subject, "Booking Confirmation")
+        self.assertEqual(email.recipients, ['member@example.com'])
+
+    def test_failed_booking_queues_nothing(self):
+        self.client.post(reverse('book_event', args=[self.event.id]))  # no tokens
+        self.assertFalse(OutboxEmail.objects.exists())
@@ -0,0 +1,227 @@
+import time
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from company import refunds, stripe_gateway
+from company.models import Company, OutboxEmail, RefundRequest, Token, TokenLedgerEntry, TokenPurchase
+from company.refunds import bulk_approve_refunds
+from company.stripe_gateway import FakeStripeBackend
+from company.tokens import get_token_balance, issue_tokens
+
+
+class RecordingFakeBackend(FakeStripeBackend):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.refund_calls = []
+
+    def create_refund(self, idempotency_key, **params):
+        self.refund_calls.append(params)
+        return super().create_refund(idempotency_key, **params)
+
+
+class BulkRefundApprovalTest(TestCase):
+    def setUp(self):
+        self.fake = RecordingFakeBackend(latency=0)
+        stripe_gateway.set_backend(self.fake)
+        self.addCleanup(stripe_gateway.set_backend, None)
+
+        self.manager = User.objects.create_user(username='manager', password='pass1234')
+        self.company = Company.objects.create(name='Refund Gym', manager=self.manager)
+        self.manager.profile.company = self.company
+        self.manager.profile.save()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass1234')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass1234')
+
+    def purchase(self, user, count, price, payment_intent):
+        """Buy tokens and put each one up for refund through the refund_token view, as clients do."""
+        purchase = TokenPurchase.objects.create(
+            user=user, company=self.company, tokens_bought=count, total_price=price,
+            stripe_payment_intent_id=payment_intent,
+        )
+        tokens = issue_tokens(user, self.company, count, purchase=purchase)
+        self.client.force_login(user)
+        for token in tokens:
+            self.client.post(reverse('refund_token', args=[token.id]))
+        self.client.logout()
+        return list(RefundRequest.objects.filter(token__in=tokens).order_by('id'))
+
+    def test_one_refund_per_payment_intent(self):
+        self.purchase(self.alice, 3, 6, 'pi_a')
+        self.purchase(self.bob, 1, 2.5, 'pi_b')
+
+        results = bulk_approve_refunds(self.company, self.manager)
+
+        self.assertEqual([item['status'] for item in results], ['approved'] * 4)
+        self.assertEqual(
+            sorted((call['payment_intent'], call['amount']) for call in self.fake.refund_calls),
+            [('pi_a', 600), ('pi_b', 250)]
+        )
+        self.assertEqual(Token.objects.filter(refunded=True, used=True).count(), 4)
+        self.assertFalse(RefundRequest.objects.exclude(status='Approved').exists())
+        self.assertEqual(RefundRequest.objects.filter(reviewed_by=self.manager).count(), 4)
+        self.assertEqual(get_token_balance(self.alice, self.company), 0)
+        self.assertEqual(get_token_balance(self.bob, self.company), 0)
+        self.assertEqual(OutboxEmail.objects.filter(subject="Token Refund Confirmation").count(), 2)
+
+    def test_failed_payment_intent_leaves_its_requests_pending(self):
+        self.purchase(self.alice, 2, 4, 'pi_a')
+        self.purchase(self.bob, 1, 2, 'pi_b')
+        self.fake.payment_intents['pi_a'] = 100  # less than the 400 asked for
+
+        results = {item['username']: item for item in bulk_approve_refunds(self.company, self.manager)}
+
+        self.assertEqual(results['alice']['status'], 'failed')
+        self.assertIn('greater than the unrefunded amount', results['alice']['error'])
+        self.assertEqual(results['bob']['status'], 'approved')
+        self.assertEqual(RefundRequest.objects.filter(user=self.alice, status='Pending').count(), 2)
+        # Still out of the balance while the requests wait for another try
+        self.assertEqual(get_token_balance(self.alice, self.company), 0)
+
+    def test_requests_from_refund_token_are_approved(self):
+        (refund_request,) = self.purchase(self.alice, 1, 2, 'pi_a')
+        self.assertEqual(get_token_balance(self.alice, self.company), 0)
+
+        results = bulk_approve_refunds(self.company, self.manager)
+
+        self.assertEqual((results[0]['status'], results[0]['amount']), ('approved', 200))
+        refund_request.refresh_from_db()
+        self.assertEqual(refund_request.status, 'Approved')
+        # Debited once, when the client asked for the refund
+        self.assertEqual(get_token_balance(self.alice, self.company), 0)
+        self.assertEqual(TokenLedgerEntry.objects.filter(user=self.alice, reason='refund').count(), 1)
+
+    def test_spendable_token_is_debited_on_approval(self):
+        purchase = TokenPurchase.objects.create(
+            user=self.alice, company=self.company, tokens_bought=1, total_price=2, stripe_payment_intent_id='pi_a',
+        )
+        (token,) = issue_tokens(self.alice, self.company, 1, purchase=purchase)
+        RefundRequest.objects.create(user=self.alice, token=token)
+
+        results = bulk_approve_refunds(self.company, self.manager)
+
+        self.assertEqual(results[0]['status'], 'approved')
+        self.assertEqual(get_token_balance(self.alice, self.company), 0)
+
+    def test_selected_requests_only_and_refunded_tokens_skipped(self):
+        first, second = self.purchase(self.alice, 2, 4, 'pi_a')
+        RefundRequest.objects.create(user=self.alice, token=second.token, status='Approved', reviewed_by=self.manager)
+
+        results = bulk_approve_refunds(self.company, self.manager, request_ids=[second.pk])
+        self.assertEqual((results[0]['status'], results[0]['error']), ('skipped', 'Token was already refunded.'))
+        self.assertEqual(self.fake.refund_calls, [])
+
+        results = bulk_approve_refunds(self.company, self.manager, request_ids=[first.pk])
+        self.assertEqual(results[0]['status'], 'approved')
+        self.assertEqual(self.fake.refund_calls[0]['amount'], 200)
+
+    def racing(self, target, other_run):
+        """Patch target's claim so other_run runs to completion just before the first claim."""
+        claim, runs = refunds.claim_refund_requests, [other_run]
+
+        def claim_after_other_run(*args):
+            if runs:
+                runs.pop()()
+            return claim(*args)
+        return patch(target, side_effect=claim_after_other_run)
+
+    def test_overlapping_batches_refund_each_token_once(self):
+        requests = self.purchase(self.alice, 2, 4, 'pi_a')
+        self.fake.payment_intents['pi_a'] = 400
+        ticked = []
+
+        with self.racing('company.refunds.claim_refund_requests', lambda: ticked.extend(
+            bulk_approve_refunds(self.company, self.manager, request_ids=[requests[0].pk])
+        )):
+            approve_all = {item['request_id']: item for item in bulk_approve_refunds(self.company, self.manager)}
+
+        self.assertEqual(ticked[0]['status'], 'approved')
+        self.assertEqual((approve_all[requests[0].pk]['status'], approve_all[requests[0].pk]['error']),
+                         ('skipped', 'Request was claimed by another approval.'))
+        self.assertEqual(approve_all[requests[1].pk]['status'], 'approved')
+        self.assertEqual(len(self.fake.refund_calls), 2)
+        self.assertEqual(TokenLedgerEntry.objects.filter(user=self.alice, reason='refund').count(), 2)
+        self.assertEqual(OutboxEmail.objects.filter(subject="Token Refund Confirmation").count(), 2)
+
+    def test_same_batch_run_twice_refunds_once(self):
+        purchase = TokenPurchase.objects.create(
+            user=self.alice, company=self.company, tokens_bought=1, total_price=2, stripe_payment_intent_id='pi_a',
+        )
+        (token,) = issue_tokens(self.alice, self.company, 1, purchase=purchase)
+        first = RefundRequest.objects.create(user=self.alice, token=token)
+        second = RefundRequest.objects.create(user=self.alice, token=token)
+        runs = []
+
+        with self.racing('company.refunds.claim_refund_requests', lambda: runs.append(
+            bulk_approve_refunds(self.company, self.manager, request_ids=[first.pk])
+        )):
+            runs.append(bulk_approve_refunds(self.company, self.manager, request_ids=[second.pk]))
+
+        self.assertEqual([run[0]['status'] for run in runs], ['approved', 'skipped'])
+        self.assertEqual(len(self.fake.refund_calls), 1)
+        # Debited once, from the rows the winning claim took out of the balance
+        self.assertEqual(TokenLedgerEntry.objects.filter(user=self.alice, reason='refund').count(), 1)
+        self.assertEqual(get_token_balance(self.alice, self.company), 0)
+        self.assertEqual(OutboxEmail.objects.filter(subject="Token Refund Confirmation").count(), 1)
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'Pending')
+
+    def test_token_booked_since_the_request_is_not_refunded(self):
+        purchase = TokenPurchase.objects.create(
+            user=self.alice, company=self.company, tokens_bought=1, total_price=2, stripe_payment_intent_id='pi_a',
+        )
+        (token,) = issue_tokens(self.alice, self.company, 1, purchase=purchase)
+        RefundRequest.objects.create(user=self.alice, token=token)
+
+        with self.racing('company.refunds.claim_refund_requests',
+                         lambda: Token.objects.filter(pk=token.pk).update(used=True)):
+            results = bulk_approve_refunds(self.company, self.manager)
+
+        self.assertEqual((results[0]['status'], results[0]['error']), ('skipped', 'Token was used for a booking.'))
+        self.assertEqual(self.fake.refund_calls, [])
+
+    def test_single_approval_loses_to_a_bulk_claim(self):
+        (refund_request,) = self.purchase(self.alice, 1, 2, 'pi_a')
+        self.client.login(username='manager', password='pass1234')
+
+        with self.racing('company.views.claim_refund_requests',
+                         lambda: bulk_approve_refunds(self.company, self.manager)):
+            response = self.client.post(reverse('approve_refund_request', args=[refund_request.pk]), follow=True)
+
+        self.assertContains(response, "Request was claimed by another approval.")
+        self.assertEqual(len(self.fake.refund_calls), 1)
+        refund_request.refresh_from_db()
+        self.assertEqual(refund_request.status, 'Approved')
+
+    def test_payment_intents_are_refunded_concurrently(self):
+        self.fake.latency = 0.2
+        for n in range(4):
+            self.purchase(self.alice, 1, 2, f'pi_{n}')
+
+        started = time.perf_counter()
+        results = bulk_approve_refunds(self.company, self.manager, max_workers=4)
+        self.assertLess(time.perf_counter() - started, 0.6)
+        self.assertEqual([item['status'] for item in results], ['approved'] * 4)
+
+    def test_view_reports_each_request(self):
+        requests = self.purchase(self.alice, 2, 4, 'pi_a')
+        self.client.login(username='manager', password='pass1234')
+
+        response = self.client.post(reverse('bulk_approve_refund_requests'), {'request_ids': [requests[0].pk]})
+
+        self.assertTemplateUsed(response, 'company/bulk_refund_report.html')
+        self.assertContains(response, 'Approved')
+        self.assertContains(response, '£2.00')
+        self.assertEqual(RefundRequest.objects.filter(status='Pending').count(), 1)
+
+    def test_view_is_manager_only(self):
+        self.purchase(self.alice, 1, 2, 'pi_a')
+        self.alice.profile.company = self.company
+        self.alice.profile.save()
+        self.client.login(username='alice', password='pass1234')
+
+        response = self.client.post(reverse('bulk_approve_refund_requests'))
+        self.assertRedirects(response, reverse('company_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.fake.refund_calls, [])
@@ -0,0 +1,90 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from company.models import Coach, Company
+from company.roles import _load_roles, get_user_roles, roles_cache_is_shared
+
+
+class UserRolesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.manager = User.objects.create_user(username='manager', password='testpass')
+        self.company = Company.objects.create(name='Roles Gym', manager=self.manager)
+        self.manager.profile.company = self.company
+        self.manager.profile.save()
+
+        self.client_user = User.objects.create_user(username='client', password='testpass')
+        self.client_user.profile.company = self.company
+        self.client_user.profile.save()
+
+    def test_manager_roles(self):
+        roles = get_user_roles(self.manager)
+        self.assertTrue(roles.is_manager)
+        self.assertFalse(roles.is_coach)
+        self.assertEqual(roles.company_id, self.company.company_id)
+        self.assertTrue(roles.manages(self.company.company_id))
+
+    def test_client_roles(self):
+        roles = get_user_roles(self.client_user)
+        self.assertTrue(roles.is_client)
+        self.assertFalse(roles.is_manager)
+        self.assertFalse(roles.is_coach)
+
+    def test_process_local_cache_is_not_used(self):
+        # The test settings use LocMemCache, which other workers can't see
+        self.assertFalse(roles_cache_is_shared())
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                get_user_roles(self.client_user)
+
+    @patch('company.roles.roles_cache_is_shared', return_value=True)
+    def test_roles_resolved_with_one_query_then_cached(self, shared):
+        with self.assertNumQueries(1):
+            get_user_roles(self.client_user)
+        with self.assertNumQueries(0):
+            get_user_roles(self.client_user)
+
+    @patch('company.roles.roles_cache_is_shared', return_value=True)
+    def test_previous_manager_loses_rights_on_handover(self, shared):
+        self.assertTrue(get_user_roles(self.manager).is_manager)
+
+        self.company.manager = self.client_user
+        self.company.save()
+
+        self.assertFalse(get_user_roles(self.manager).is_manager)
+        self.assertTrue(get_user_roles(self.client_user).is_manager)
+
+    def test_request_roles_resolved_once_per_request(self):
+        self.client.login(username='client', password='testpass')
+        with patch('company.roles._load_roles', wraps=_load_roles) as load:
+            self.client.get(reverse('company_dashboard'))
+        self.assertEqual(load.call_count, 1)
+
+    def test_cache_invalidated_on_coach_create_and_delete(self):
+        self.assertFalse(get_user_roles(self.client_user).is_coach)
+
+        coach = Coach.objects.create(coach=self.client_user, company=self.company)
+        roles = get_user_roles(self.client_user)
+        self.assertTrue(roles.is_coach)
+        self.assertEqual(roles.coach_id, coach.id)
+        self.assertEqual(roles.coach_company_id, self.company.company_id)
+
+        coach.delete()
+        self.assertFalse(get_user_roles(self.client_user).is_coach)
+
+    def test_cache_invalidated_on_company_change(self):
+        self.assertEqual(get_user_roles(self.client_user).company_id, self.company.company_id)
+        self.client_user.profile.company = None
+        self.client_user.profile.save()
+        self.assertIsNone(get_user_roles(self.client_user).company_id)
+
+    def test_request_roles_attribute(self):
+        Coach.objects.create(coach=self.client_user, company=self.company)
+        self.client.login(username='client', password='testpass')
+        response = self.client.get(reverse('coach_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.wsgi_request.roles.is_coach)
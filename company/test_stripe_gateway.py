@@ -0,0 +1,102 @@
+import time
+from unittest.mock import patch
+
+import stripe
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from company import stripe_gateway
+from company.models import Company, StripeEvent, Token, TokenPurchase
+from company.stripe_gateway import FakeStripeBackend, LiveStripeBackend
+from company.webhooks import process_pending_stripe_events
+
+
+class LiveStripeBackendTest(TestCase):
+    @override_settings(STRIPE_CONNECT_TIMEOUT=2, STRIPE_READ_TIMEOUT=15, STRIPE_MAX_NETWORK_RETRIES=3)
+    def test_configures_timeouts_and_retries(self):
+        with patch.object(stripe_gateway, '_configured', False), \
+                patch.object(stripe, 'default_http_client', None), \
+                patch.object(stripe, 'max_network_retries', 0):
+            LiveStripeBackend()
+            self.assertIsInstance(stripe.default_http_client, stripe.RequestsClient)
+            self.assertEqual(stripe.default_http_client._timeout, (2, 15))
+            self.assertEqual(stripe.max_network_retries, 3)
+
+    @patch('stripe.Refund.create')
+    def test_passes_the_idempotency_key(self, refund_create):
+        LiveStripeBackend().create_refund('refund-token-1', payment_intent='pi_1', amount=500)
+        refund_create.assert_called_once_with(idempotency_key='refund-token-1', payment_intent='pi_1', amount=500)
+
+
+class FakeStripeBackendTest(TestCase):
+    def setUp(self):
+        self.fake = FakeStripeBackend(latency=0)
+        stripe_gateway.set_backend(self.fake)
+        self.addCleanup(stripe_gateway.set_backend, None)
+
+        self.manager = User.objects.create_user(username='manager', password='pass1234')
+        self.company = Company.objects.create(name='Offline Gym', manager=self.manager, token_price=2)
+        self.manager.profile.company = self.company
+        self.manager.profile.save()
+
+    def test_onboarding_completes_offline(self):
+        self.client.login(username='manager', password='pass1234')
+        response = self.client.get(reverse('stripe_onboard_company'))
+        self.assertRedirects(response, 'http://testserver' + reverse('stripe_onboard_company_return'),
+                             fetch_redirect_response=False)
+
+        self.client.get(reverse('stripe_onboard_company_return'))
+        self.company.refresh_from_db()
+        self.assertTrue(self.company.stripe_account_id.startswith('acct_fake_'))
+        self.assertTrue(self.company.stripe_onboarding_completed)
+
+    def test_checkout_delivers_the_webhook_and_tokens_follow(self):
+        Company.objects.filter(pk=self.company.pk).update(
+            stripe_account_id='acct_existing', stripe_onboarding_completed=True
+        )
+        self.client.login(username='manager', password='pass1234')
+        response = self.client.post(reverse('create_checkout_session'), {'token_count': 3})
+        self.assertRedirects(response, 'http://testserver' + reverse('checkout_success'),
+                             fetch_redirect_response=False)
+
+        self.assertEqual(StripeEvent.objects.get().type, 'checkout.session.completed')
+        process_pending_stripe_events()
+        purchase = TokenPurchase.objects.get()
+        self.assertEqual((purchase.tokens_bought, float(purchase.total_price)), (3, 6.0))
+        self.assertEqual(Token.objects.filter(user=self.manager).count(), 3)
+
+    def test_resubmitted_purchase_form_reuses_its_session(self):
+        Company.objects.filter(pk=self.company.pk).update(
+            stripe_account_id='acct_existing', stripe_onboarding_completed=True
+        )
+        self.client.login(username='manager', password='pass1234')
+        form = self.client.get(reverse('purchase_tokens')).context['form']
+        nonce = form['checkout_nonce'].value()
+        self.assertRegex(nonce, r'^[0-9a-f]{32}$')
+
+        for _ in range(2):
+            self.client.post(reverse('create_checkout_session'), {'token_count': 3, 'checkout_nonce': nonce})
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+        self.client.post(reverse('create_checkout_session'), {'token_count': 3, 'checkout_nonce': 'f' * 32})
+        self.assertEqual(StripeEvent.objects.count(), 2)
+
+    def test_refunds_are_idempotent_and_bounded(self):
+        session = self.fake.create_checkout_session(
+            'checkout-1', success_url='/ok/', metadata={},
+            line_items=[{'price_data': {'unit_amount': 500}, 'quantity': 2}],
+        )
+        first = self.fake.create_refund('refund-token-1', payment_intent=session.payment_intent, amount=500)
+        again = self.fake.create_refund('refund-token-1', payment_intent=session.payment_intent, amount=500)
+        self.assertEqual(first.id, again.id)
+
+        self.fake.create_refund('refund-token-2', payment_intent=session.payment_intent, amount=500)
+        with self.assertRaises(stripe.error.InvalidRequestError):
+            self.fake.create_refund('refund-token-3', payment_intent=session.payment_intent, amount=500)
+
+    def test_latency_is_injected(self):
+        slow = FakeStripeBackend(latency=0.05)
+        started = time.perf_counter()
+        slow.retrieve_account('acct_1')
+        self.assertGreaterEqual(time.perf_counter() - started, 0.05)
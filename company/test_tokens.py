@@ -0,0 +1,95 @@
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.contrib.auth.models import User
+from datetime import date, time, timedelta
+
+from company.models import Company, Coach, Venue, Token, TokenBalance, TokenLedgerEntry
+from company.tokens import get_token_balance, issue_tokens
+from booking.models import Event
+from booking.services import book_event_for_user, cancel_booking_for_user
+
+
+class TokenLedgerTest(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(username='manager', password='testpass')
+        self.company = Company.objects.create(name='Ledger Gym', manager=self.manager)
+        self.member = User.objects.create_user(username='member', password='testpass')
+
+    def reasons(self):
+        return list(TokenLedgerEntry.objects.filter(user=self.member).order_by('id').values_list('reason', 'delta'))
+
+    def test_new_tokens_are_credited(self):
+        Token.objects.create(user=self.member, company=self.company)
+        Token.objects.create(user=self.member, company=self.company)
+        self.assertEqual(get_token_balance(self.member, self.company), 2)
+        self.assertEqual(self.reasons(), [('purchase', 1), ('purchase', 1)])
+
+    def test_balance_read_is_one_query(self):
+        Token.objects.create(user=self.member, company=self.company)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_token_balance(self.member, self.company), 1)
+
+    def test_booking_and_cancel_move_the_balance(self):
+        coach = Coach.objects.create(coach=self.manager, company=self.company)
+        venue = Venue.objects.create(name='Ledger Venue', company=self.company)
+        event = Event.objects.create(
+            event_name='Ledger Class', date_of_event=date.today() + timedelta(days=1),
+            coach=coach, status=0, description='Desc', venue=venue,
+            start_time=time(10, 0), end_time=time(11, 0), capacity=5
+        )
+        Token.objects.create(user=self.member, company=self.company)
+
+        book_event_for_user(self.member, event.pk)
+        self.assertEqual(get_token_balance(self.member, self.company), 0)
+
+        cancel_booking_for_user(self.member, event)
+        self.assertEqual(get_token_balance(self.member, self.company), 1)
+        self.assertEqual(self.reasons(), [('purchase', 1), ('booking', -1), ('release', 1)])
+
+    def test_refund_and_denial(self):
+        token = Token.objects.create(user=self.member, company=self.company)
+        token.used = True
+        token.refunded = True
+        token.save()
+        self.assertEqual(get_token_balance(self.member, self.company), 0)
+
+        token.used = False
+        token.refunded = False
+        token.save()
+        self.assertEqual(get_token_balance(self.member, self.company), 1)
+        self.assertEqual(self.reasons(), [('purchase', 1), ('refund', -1), ('refund_denied', 1)])
+
+    def test_saving_without_state_change_records_nothing(self):
+        token = Token.objects.create(user=self.member, company=self.company)
+        token.save()
+        self.assertEqual(TokenLedgerEntry.objects.filter(user=self.member).count(), 1)
+
+    def test_deleting_user_removes_their_balance(self):
+        Token.objects.create(user=self.member, company=self.company)
+        self.member.delete()
+        self.assertFalse(TokenBalance.objects.exists())
+
+
+class IssueTokensTest(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(username='manager', password='testpass')
+        self.company = Company.objects.create(name='Issue Gym', manager=self.manager)
+        self.member = User.objects.create_user(username='member', password='testpass')
+
+    def test_issue_tokens_updates_tokens_balance_and_profile(self):
+        issue_tokens(self.member, self.company, 7)
+
+        self.assertEqual(Token.objects.filter(user=self.member, company=self.company).count(), 7)
+        self.assertEqual(get_token_balance(self.member, self.company), 7)
+        self.member.profile.refresh_from_db()
+        self.assertEqual(self.member.profile.token_count, 7)
+
+    def test_query_count_does_not_grow_with_token_count(self):
+        issue_tokens(self.member, self.company, 1)  # creates the balance row
+        with CaptureQueriesContext(connection) as few:
+            issue_tokens(self.member, self.company, 2)
+        # Stays within one INSERT batch even on SQLite's bind-parameter limit
+        with CaptureQueriesContext(connection) as many:
+            issue_tokens(self.member, self.company, 100)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
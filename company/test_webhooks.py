@@ -0,0 +1,159 @@
+import json
+from io import StringIO
+from unittest.mock import patch
+
+import stripe
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from company.models import Company, OutboxEmail, StripeEvent, Token, TokenPurchase
+from company.webhooks import process_pending_stripe_events, sign_payload
+
+SECRET = 'whsec_test'
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=SECRET)
+class StripeWebhookInboxTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass1234')
+        self.company = Company.objects.create(name='Webhook Gym', manager=self.user)
+
+    def checkout_event(self, event_id='evt_1', payment_intent='pi_1', **metadata):
+        return {
+            'id': event_id,
+            'type': 'checkout.session.completed',
+            'data': {'object': {
+                'id': 'cs_1',
+                'payment_status': 'paid',
+                'amount_total': 2500,
+                'payment_intent': payment_intent,
+                'metadata': {
+                    'user_id': str(self.user.pk), 'company_id': str(self.company.pk),
+                    'token_count': '5', 'purchase_type': 'token_purchase', **metadata,
+                },
+            }},
+        }
+
+    def deliver(self, event, secret=SECRET):
+        payload = json.dumps(event)
+        return self.client.post(reverse('stripe_webhook'), data=payload, content_type='application/json',
+                                HTTP_STRIPE_SIGNATURE=sign_payload(payload, secret))
+
+    def test_event_is_stored_and_acknowledged_without_processing(self):
+        response = self.deliver(self.checkout_event())
+
+        self.assertEqual(response.status_code, 200)
+        stripe_event = StripeEvent.objects.get()
+        self.assertEqual((stripe_event.stripe_event_id, stripe_event.status), ('evt_1', 'pending'))
+        self.assertFalse(TokenPurchase.objects.exists())
+
+    def test_bad_signature_is_rejected(self):
+        response = self.deliver(self.checkout_event(), secret='whsec_wrong')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_redelivered_event_issues_tokens_once(self):
+        for _ in range(3):
+            self.assertEqual(self.deliver(self.checkout_event()).status_code, 200)
+
+        self.assertEqual(process_pending_stripe_events(), 1)
+        self.assertEqual(process_pending_stripe_events(), 0)
+        self.assertEqual(TokenPurchase.objects.get().tokens_bought, 5)
+        self.assertEqual(Token.objects.filter(user=self.user).count(), 5)
+        self.assertTrue(OutboxEmail.objects.filter(recipients=['buyer@example.com']).exists())
+        stripe_event = StripeEvent.objects.get()
+        self.assertEqual(stripe_event.status, 'processed')
+        self.assertIsNotNone(stripe_event.processed_at)
+
+    def test_second_event_for_the_same_payment_is_a_no_op(self):
+        self.deliver(self.checkout_event('evt_1'))
+        self.deliver(self.checkout_event('evt_2'))
+        process_pending_stripe_events()
+
+        self.assertEqual(TokenPurchase.objects.count(), 1)
+        self.assertEqual(Token.objects.count(), 5)
+
+    def test_bad_metadata_is_dead_lettered_without_retry(self):
+        self.deliver(self.checkout_event(user_id='999999'))
+        process_pending_stripe_events()
+
+        stripe_event = StripeEvent.objects.get()
+        self.assertEqual((stripe_event.status, stripe_event.attempts), ('dead', 1))
+        self.assertIn('not found', stripe_event.last_error)
+
+    def test_failed_handler_rolls_back_and_retries_later(self):
+        self.deliver(self.checkout_event())
+        with patch('company.webhooks.issue_tokens', side_effect=RuntimeError('db down')):
+            process_pending_stripe_events()
+
+        stripe_event = StripeEvent.objects.get()
+        self.assertEqual((stripe_event.status, stripe_event.attempts), ('pending', 1))
+        self.assertGreater(stripe_event.next_attempt_at, timezone.now())
+        self.assertFalse(TokenPurchase.objects.exists())
+
+        StripeEvent.objects.update(next_attempt_at=timezone.now())
+        process_pending_stripe_events()
+        self.assertEqual(StripeEvent.objects.get().status, 'processed')
+        self.assertEqual(Token.objects.count(), 5)
+
+    def test_unhandled_type_is_ignored(self):
+        self.deliver({'id': 'evt_x', 'type': 'payout.paid', 'data': {'object': {'id': 'po_1'}}})
+        process_pending_stripe_events()
+        self.assertEqual(StripeEvent.objects.get().status, 'ignored')
+
+    def test_account_updated_syncs_onboarding(self):
+        Company.objects.filter(pk=self.company.pk).update(stripe_account_id='acct_1')
+        self.deliver({'id': 'evt_a', 'type': 'account.updated',
+                      'data': {'object': {'id': 'acct_1', 'details_submitted': True}}})
+        call_command('process_stripe_events', once=True, stdout=StringIO())
+
+        self.company.refresh_from_db()
+        self.assertTrue(self.company.stripe_onboarding_completed)
+
+    def test_replay_rolls_back_unless_committed(self):
+        self.deliver(self.checkout_event(user_id='999999'))
+        process_pending_stripe_events()
+        # The missing user was the problem; point the stored event at a real one and replay
+        stripe_event = StripeEvent.objects.get()
+        stripe_event.payload['data']['object']['metadata']['user_id'] = str(self.user.pk)
+        stripe_event.save()
+
+        out = StringIO()
+        call_command('replay_stripe_events', 'evt_1', stdout=out)
+        self.assertIn('evt_1: processed', out.getvalue())
+        self.assertFalse(TokenPurchase.objects.exists())
+        self.assertEqual(StripeEvent.objects.get().status, 'dead')
+
+        call_command('replay_stripe_events', status='dead', commit=True, stdout=StringIO())
+        self.assertEqual(StripeEvent.objects.get().status, 'processed')
+        self.assertEqual(Token.objects.count(), 5)
+
+    def test_replay_posts_signed_events_to_a_url(self):
+        self.deliver(self.checkout_event())
+        sent = []
+
+        class Response:
+            status = 200
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+
+        def urlopen(request, timeout):
+            sent.append(request)
+            return Response()
+
+        out = StringIO()
+        with patch('urllib.request.urlopen', side_effect=urlopen):
+            call_command('replay_stripe_events', url='http://localhost:8000/company/webhooks/stripe/', stdout=out)
+
+        self.assertIn('evt_1: HTTP 200', out.getvalue())
+        request = sent[0]
+        event = stripe.Webhook.construct_event(request.data, request.get_header('Stripe-signature'), SECRET)
+        self.assertEqual(event['id'], 'evt_1')
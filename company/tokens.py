@@ -0,0 +1,56 @@
+from django.db import transaction
+from django.db.models import F
+from .models import Token, TokenBalance, TokenLedgerEntry, UserProfile
+
+ISSUE_BATCH_SIZE = 500
+
+
+def is_available(token):
+    return not (token.used or token.refunded)
+
+
+def record_token_change(user_id, company_id, delta, reason, token=None):
+    """
+    Append a ledger entry and move the (user, company) balance by delta.
+    Token.save() and delete() are recorded by the signals in company.signals;
+    call this directly for bulk writes that skip signals.
+    """
+    if not delta:
+        return
+    with transaction.atomic():
+        TokenLedgerEntry.objects.create(
+            user_id=user_id, company_id=company_id, delta=delta, reason=reason, token=token
+        )
+        updated = TokenBalance.objects.filter(user_id=user_id, company_id=company_id).update(
+            balance=F('balance') + delta
+        )
+        if not updated:
+            TokenBalance.objects.get_or_create(user_id=user_id, company_id=company_id)
+            TokenBalance.objects.filter(user_id=user_id, company_id=company_id).update(
+                balance=F('balance') + delta
+            )
+
+
+def get_token_balance(user, company):
+    """Number of tokens the user can spend with the company - a single row read."""
+    if company is None:
+        return 0
+    balance = TokenBalance.objects.filter(user=user, company=company).values_list('balance', flat=True).first()
+    return balance or 0
+
+
+def issue_tokens(user, company, count, purchase=None):
+    """
+    Create count tokens for the user in batched INSERTs, credit the ledger
+    and bump the profile counter - all in one transaction. Used by the
+    purchase view, PurchaseTokenForm and the Stripe webhook.
+    """
+    with transaction.atomic():
+        tokens = Token.objects.bulk_create(
+            [Token(user=user, company=company, purchase=purchase) for _ in range(count)],
+            batch_size=ISSUE_BATCH_SIZE,
+        )
+        # bulk_create skips the Token signals, so credit the ledger here
+        record_token_change(user.pk, company.pk, count, 'purchase')
+        UserProfile.objects.filter(user=user).update(token_count=F('token_count') + count)
+    return tokens
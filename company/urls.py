@@ -9,6 +9,7 @@ urlpatterns = [
     path('remove_coach/', views.remove_coach, name='remove_coach'),
     path('remove_client/<int:client_id>/', views.remove_client, name="remove_client"),
     path('view_bookings/', views.view_bookings, name='view_bookings'),
+    path('export/<str:kind>/', views.export_data, name='export_data'),
     path('delete_booking/<int:booking_id>/', views.delete_booking, name='delete_booking'),
     path('view_clients/', views.view_clients, name='view_clients'),
     path('client_details/<int:client_id>/', views.client_details, name='client_details'),
@@ -24,6 +25,7 @@ urlpatterns = [
     path('view_client_tokens/<int:client_id>/', views.view_client_tokens, name='view_client_tokens'),
     path('view_refund_requests/', views.view_refund_requests, name="view_refund_requests"),
     path('approve_refund_request/<int:request_id>/', views.approve_refund_request, name='approve_refund_request'),
+    path('approve_refund_requests/', views.bulk_approve_refund_requests, name='bulk_approve_refund_requests'),
     path('deny_refund_request/<int:request_id>/', views.deny_refund_request, name='deny_refund_request'),
     path('client_leave_company/', views.client_leave_company, name='client_leave_company'),
     path('join_company/', views.join_company, name='join_company'),
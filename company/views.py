@@ -1,20 +1,29 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from .forms import CreateCompanyForm, ChangeCompanyDetailsForm, AddCoachForm, RemoveCoachForm, AddVenueForm, EditVenueForm, PurchaseTokenForm, JoinCompanyForm, TokenPriceUpdateForm
+from .forms import CreateCompanyForm, ChangeCompanyDetailsForm, AddCoachForm, RemoveCoachForm, AddVenueForm, EditVenueForm, PurchaseTokenForm, JoinCompanyForm, TokenPriceUpdateForm, BookingFilterForm, ExportForm
 from booking.models import Booking, Event # Ensure Event is imported
 from django.contrib import messages
 from django.contrib.auth.models import User
 from .models import Coach, Token, Venue, RefundRequest, TokenPurchase, Company, UserProfile, Image # Ensure all models are imported
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Case, When, IntegerField
+from django.db import transaction
+from django.db.models import Case, When, IntegerField, Q, Sum
 from django.urls import reverse # Import reverse for dynamic URLs
 import stripe
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse, StreamingHttpResponse, Http404
 import logging
+import re
+import uuid
+from datetime import datetime
 from utils.email import send_custom_email
+from .tokens import get_token_balance, issue_tokens
+from .exports import EXPORTS, export_lines, export_rows
+from .webhooks import record_stripe_event
+from . import stripe_gateway
+from .refunds import bulk_approve_refunds, claim_refund_requests, release_refund_requests
 
 User = get_user_model() # Best practice for custom user model
 logger = logging.getLogger(__name__) # Initialize logger
@@ -26,14 +35,15 @@ def company_dashboard(request):
         if request.user.profile.company:
             company = request.user.profile.company
             # Check if the user is the manager
-            if company.manager == request.user:
+            if request.roles.is_manager:
                 return render(request, 'company/company_manager_dashboard.html', {'company': company})
             # Else if they are a coach or user (you can check for their role)
             else:
-                tokens = Token.objects.filter(user=request.user, company=company, used=False).count()
+                tokens = get_token_balance(request.user, company)
                 return render(request, 'company/company_user_dashboard.html', {'company': company,
                                                                                'user': request.user,
-                                                                               'tokens': tokens})
+                                                                               'tokens': tokens,
+                                                                               'is_coach': request.roles.is_coach})
         else:
             # If the user doesn't have a company, redirect to company creation page
             create_company_form = CreateCompanyForm(request.POST)
@@ -179,11 +189,10 @@ def remove_client(request, client_id):
     if request.method == 'POST':
         try:
             client = User.objects.get(id=client_id, profile__company=request.user.profile.company)
-            tokens = Token.objects.filter(user__id=client_id, company=request.user.profile.company, refunded=False, used=False)
-            if tokens.exists():
+            if get_token_balance(client, request.user.profile.company) > 0:
                 messages.error(request, 'Cannot remove client with active tokens. Please refund or use the tokens first.')
                 return redirect('view_clients')
-            if client.profile.company == request.user.profile.company and request.user.profile.company.manager == request.user:
+            if client.profile.company_id == request.roles.company_id and request.roles.is_manager:
                 if Coach.objects.filter(coach=client, company=request.user.profile.company).exists():
                     messages.error(request, 'The selected client is also a coach and cannot be removed as a client.')
                     return redirect('view_clients')
@@ -216,23 +225,108 @@ def view_client_tokens(request, client_id):
         messages.error(request, 'Client not found or does not belong to your company.')
         return redirect('view_clients')
 
+BOOKINGS_PAGE_SIZE = 50
+# Counting past this many rows is not worth it, the page shows "1000+"
+BOOKINGS_COUNT_CAP = 1000
+
+
+def _parse_booking_cursor(value):
+    """A cursor is "<date>.<booking id>" for the row the page starts after/before."""
+    try:
+        day, pk = value.split('.')
+        return datetime.strptime(day, "%Y-%m-%d").date(), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _booking_cursor(booking):
+    return f"{booking.event_date.isoformat()}.{booking.pk}"
+
+
 @login_required
 def view_bookings(request):
-    # This function should be implemented to view bookings related to the company
-    bookings = Booking.objects.filter(event__coach__company=request.user.profile.company).order_by('-event__date_of_event')
-    if not bookings:
+    # Newest first, paged by seeking on (event date, id) - both on Booking and covered by
+    # booking_company_date_idx - so deep pages cost the same as the first
+    company = request.user.profile.company
+    form = BookingFilterForm(request.GET or None)
+    bookings = Booking.objects.filter(company=company)
+    if form.is_bound and form.is_valid():
+        bookings = form.filter(bookings)
+
+    total = bookings.values('pk')[:BOOKINGS_COUNT_CAP + 1].count()
+    total_label = f"{BOOKINGS_COUNT_CAP}+" if total > BOOKINGS_COUNT_CAP else str(total)
+
+    page = bookings.select_related('user', 'event')
+    after = _parse_booking_cursor(request.GET.get('after'))
+    before = _parse_booking_cursor(request.GET.get('before'))
+    if before:
+        day, pk = before
+        page = page.filter(
+            Q(event_date__gt=day) | Q(event_date=day, pk__gt=pk)
+        ).order_by('event_date', 'pk')
+    else:
+        if after:
+            day, pk = after
+            page = page.filter(
+                Q(event_date__lt=day) | Q(event_date=day, pk__lt=pk)
+            )
+        page = page.order_by('-event_date', '-pk')
+
+    rows = list(page[:BOOKINGS_PAGE_SIZE + 1])
+    has_more = len(rows) > BOOKINGS_PAGE_SIZE
+    rows = rows[:BOOKINGS_PAGE_SIZE]
+    if before:
+        rows.reverse()
+    has_next = has_more if not before else True
+    has_previous = bool(after) or (before is not None and has_more)
+
+    if not total:
         messages.info(request, 'No bookings found for your company.')
     else:
-        messages.success(request, f'Found {bookings.count()} bookings for your company.')
-    # Render the bookings in a template
-    return render(request, 'company/view_bookings.html', {'company': request.user.profile.company,
-                                                          'bookings': bookings})
+        messages.success(request, f'Found {total_label} bookings for your company.')
+
+    filters = request.GET.copy()
+    filters.pop('after', None)
+    filters.pop('before', None)
+    return render(request, 'company/view_bookings.html', {
+        'company': company,
+        'bookings': rows,
+        'form': form if form.is_bound else BookingFilterForm(),
+        'total_label': total_label,
+        'next_cursor': _booking_cursor(rows[-1]) if rows and has_next else None,
+        'previous_cursor': _booking_cursor(rows[0]) if rows and has_previous else None,
+        'filter_query': filters.urlencode(),
+    })
+
+@login_required
+def export_data(request, kind):
+    if not request.roles.is_manager:
+        messages.error(request, 'You are not authorised to export company data.')
+        return redirect('company_dashboard')
+    if kind not in EXPORTS:
+        raise Http404("Unknown export")
+
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(" ".join(form.errors.get('__all__', [])) or "Invalid export filters")
+
+    fmt = form.cleaned_data['format'] or 'csv'
+    rows = export_rows(
+        kind, request.roles.company_id,
+        form.cleaned_data['start_date'], form.cleaned_data['end_date']
+    )
+    response = StreamingHttpResponse(
+        export_lines(kind, rows, fmt),
+        content_type='text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
 
 @login_required
 def delete_booking(request, booking):
     # This function should be implemented to delete a booking
     booking = Booking.objects.get(id=booking)
-    if booking.event.coach.company == request.user.profile.company:
+    if booking.company_id == request.user.profile.company_id:
         messages.success(request, f'Booking:{booking.id} deleted successfully.')
         booking.delete()
     else:
@@ -293,7 +387,7 @@ def remove_venue(request, venue_id):
         events = venue.event_venue.all()  # related_name from Event to Venue
         event_count = events.count()
 
-        booking_count = sum(event.event_booking.count() for event in events)
+        booking_count = events.aggregate(total=Sum('booked_count'))['total'] or 0
 
         venue_name = venue.name
         venue.delete()  # This cascades to Events and Bookings
@@ -365,17 +459,15 @@ def purchase_tokens(request):
             if company:
                 # create token purchase object
                 total_price = token_count * company.token_price
-                purchase = TokenPurchase.objects.create(
-                    user = request.user,
-                    company=company,
-                    tokens_bought=token_count,
-                    total_price=total_price
-                )
-                # Create tokens for the user
-                for _ in range(token_count):
-                    Token.objects.create(user=request.user, company=company, purchase=purchase)
-                request.user.profile.token_count += token_count
-                request.user.profile.save()
+                with transaction.atomic():
+                    purchase = TokenPurchase.objects.create(
+                        user = request.user,
+                        company=company,
+                        tokens_bought=token_count,
+                        total_price=total_price
+                    )
+                    # Create tokens for the user
+                    issue_tokens(request.user, company, token_count, purchase=purchase)
                 messages.success(request, f'{token_count} tokens purchased successfully.')
                 return redirect('company_dashboard')
             else:
@@ -423,7 +515,7 @@ def view_refund_requests(request):
         return redirect('company_dashboard')
 
     company = request.user.profile.company
-    is_manager = (company.manager == request.user)
+    is_manager = request.roles.is_manager
 
     if is_manager:
         refund_requests = RefundRequest.objects.filter(token__company=company)
@@ -454,6 +546,39 @@ def view_refund_requests(request):
 
 
 
+@login_required
+def bulk_approve_refund_requests(request):
+    """
+    Approves the selected pending refund requests (or every pending one when
+    none are ticked) with one Stripe refund per PaymentIntent, then shows
+    what happened to each request.
+    """
+    if not hasattr(request.user, 'profile') or not request.user.profile.company:
+        messages.error(request, 'You do not have a company associated with your profile.')
+        return redirect('company_dashboard')
+    if not request.roles.is_manager:
+        messages.error(request, 'You are not authorized to approve refund requests.')
+        return redirect('company_dashboard')
+    if request.method != 'POST':
+        return redirect('view_refund_requests')
+
+    request_ids = [int(pk) for pk in request.POST.getlist('request_ids') if pk.isdigit()] or None
+    results = bulk_approve_refunds(request.user.profile.company, request.user, request_ids)
+
+    approved = sum(1 for item in results if item['status'] == 'approved')
+    if not results:
+        messages.info(request, 'No pending refund requests to approve.')
+    elif approved == len(results):
+        messages.success(request, f'{approved} refund requests approved.')
+    else:
+        messages.warning(request, f'{approved} of {len(results)} refund requests approved. See below for the rest.')
+
+    return render(request, 'company/bulk_refund_report.html', {
+        'results': results,
+        'company': request.user.profile.company,
+    })
+
+
 @login_required
 def deny_refund_request(request, request_id):
     try:
@@ -491,8 +616,7 @@ def client_leave_company(request):
             return redirect('company_dashboard')
 
         # Check if the user has any unused and unrefunded tokens
-        unused_tokens = Token.objects.filter(user=request.user, company=request.user.profile.company, used=False, refunded=False)
-        if unused_tokens.exists():
+        if get_token_balance(request.user, request.user.profile.company) > 0:
             messages.error(request, 'You cannot leave the company while you have unused or unrefunded tokens.')
             return redirect('company_dashboard')
 
@@ -512,7 +636,7 @@ def update_token_price(request):
     company = request.user.profile.company
 
     # You could also check here if user is a manager
-    if not request.user == company.manager:
+    if not request.roles.is_manager:
         messages.error(request, 'You do not have permission to update the token price.')
         return redirect('dashboard')  # or show an error
 
@@ -532,9 +656,7 @@ def update_token_price(request):
 
 
 # stripe
-
-
-stripe.api_key = settings.STRIPE_SECRET_KEY
+# API calls go through company/stripe_gateway.py (timeouts, retries, idempotency keys)
 
 
 
@@ -554,7 +676,7 @@ def stripe_onboard_company(request):
         return redirect('company_dashboard')
 
     company = request.user.profile.company
-    if company.manager != request.user:
+    if not request.roles.is_manager:
         messages.error(request, 'You are not authorized to manage Stripe onboarding for this company.')
         return redirect('company_dashboard')
 
@@ -562,7 +684,8 @@ def stripe_onboard_company(request):
         # Check if the company already has a Stripe account ID
         if not company.stripe_account_id:
             # If not, create a new Stripe Express account
-            account = stripe.Account.create(
+            account = stripe_gateway.create_account(
+                f"account-create-{company.pk}",
                 type='express', # Express accounts are suitable for platforms
                 country='GB', # Set the country for the connected account (e.g., Great Britain)
                 email=company.email, # Use the company's email for the Stripe account
@@ -582,12 +705,12 @@ def stripe_onboard_company(request):
             messages.info(request, "New Stripe account created for your company. Redirecting to onboarding...")
         else:
             # If a Stripe account ID already exists, retrieve it to ensure it's valid
-            account = stripe.Account.retrieve(company.stripe_account_id)
+            account = stripe_gateway.retrieve_account(company.stripe_account_id)
             logger.info(f"Existing Stripe Express account retrieved for Company {company.name}: {account.id} (business_type: {account.business_type})")
             messages.info(request, "Existing Stripe account found. Redirecting to complete onboarding...")
 
         # Create an AccountLink to redirect the company manager to Stripe's hosted onboarding flow
-        account_link = stripe.AccountLink.create(
+        account_link = stripe_gateway.create_account_link(
             account=company.stripe_account_id,
             # URLs Stripe will redirect back to after onboarding or if the link expires
             refresh_url=request.build_absolute_uri(reverse('stripe_onboard_company_refresh')), # Removed 'company:'
@@ -622,7 +745,7 @@ def stripe_onboard_company_return(request):
         return redirect('company_dashboard')
 
     company = request.user.profile.company
-    if company.manager != request.user:
+    if not request.roles.is_manager:
         messages.error(request, 'You are not authorized to manage Stripe onboarding for this company.')
         return redirect('company_dashboard')
 
@@ -633,7 +756,7 @@ def stripe_onboard_company_return(request):
             return redirect('company_dashboard')
 
         # Retrieve the Stripe account details to check its status
-        account = stripe.Account.retrieve(company.stripe_account_id)
+        account = stripe_gateway.retrieve_account(company.stripe_account_id)
         if account.details_submitted:
             # If details are submitted, mark onboarding as complete in your database
             company.stripe_onboarding_completed = True
@@ -672,6 +795,9 @@ def stripe_onboard_company_refresh(request):
 # --- Stripe Checkout for Token Purchases (MODIFIED FOR CONNECT) ---
 # This view initiates the Stripe Checkout session for buying tokens.
 # The actual TokenPurchase and Token creation will happen in the webhook.
+CHECKOUT_NONCE_RE = re.compile(r'[0-9a-f]{32}')
+
+
 @login_required
 def create_checkout_session(request):
     """
@@ -716,8 +842,13 @@ def create_checkout_session(request):
             success_url = request.build_absolute_uri(reverse('checkout_success'))
             cancel_url = request.build_absolute_uri(reverse('checkout_cancel'))
 
-            # Create the Stripe Checkout Session
-            session = stripe.checkout.Session.create(
+            # Create the Stripe Checkout Session. The key comes from the nonce rendered into
+            # the purchase form, so a resubmitted form gets back the session it already created
+            nonce = request.POST.get('checkout_nonce', '')
+            if not CHECKOUT_NONCE_RE.fullmatch(nonce):
+                nonce = uuid.uuid4().hex
+            session = stripe_gateway.create_checkout_session(
+                f"checkout-{request.user.id}-{nonce}-{token_count}",
                 payment_method_types=['card'], # Specify accepted payment methods
                 line_items=[{
                     'price_data': {
@@ -792,7 +923,7 @@ def refund_client_token(request, token_id):
             token_company = token.company # Get the company associated with the token
 
             # Authorization check: Ensure logged-in user is the manager of the token's company
-            if token_company.manager != request.user:
+            if not request.roles.manages(token_company.company_id):
                 messages.error(request, 'You do not have permission to refund this token.')
                 return redirect('view_client_tokens', client_id=token.user.id)
 
@@ -815,7 +946,9 @@ def refund_client_token(request, token_id):
             cost_per_token = int(purchase.get_cost_per_token() * 100)
 
             # Perform the Stripe refund for the amount of one token
-            refund = stripe.Refund.create(
+            # Keyed on the token, so a token can only ever be refunded once
+            refund = stripe_gateway.create_refund(
+                f"refund-token-{token.id}",
                 payment_intent=payment_intent_id,
                 amount=cost_per_token, # Refund only the cost of one token
                 # --- KEY CHANGE: REMOVED stripe_account parameter ---
@@ -883,7 +1016,7 @@ def approve_refund_request(request, request_id):
     if not hasattr(request.user, 'profile') or not request.user.profile.company:
         messages.error(request, 'You do not have a company associated with your profile.')
         return redirect('company_dashboard')
-    if request.user.profile.company.manager != request.user:
+    if not request.roles.is_manager:
         messages.error(request, 'You are not authorized to approve refund requests.')
         return redirect('company_dashboard')
 
@@ -915,23 +1048,35 @@ def approve_refund_request(request, request_id):
         cost_per_token = purchase.get_cost_per_token()
         amount_to_refund = int(cost_per_token * 100) # Amount in pence
 
+        # Claim the request so a bulk approval running alongside can't refund the token too
+        item = {'request_id': refund_request.id, 'token_id': token.id, 'user_id': refund_request.user_id}
+        if not claim_refund_requests(token.company_id, [item]):
+            messages.error(request, f"Refund request can't be approved: {item['error']}")
+            return redirect('view_refund_requests')
+
         # Perform the Stripe refund
-        refund = stripe.Refund.create(
-            payment_intent=purchase.stripe_payment_intent_id,
-            amount=amount_to_refund,
-            # --- KEY CHANGE: REMOVED stripe_account parameter ---
-            # Refund is issued from the platform account, which owns the PaymentIntent.
-            # Stripe automatically handles the reversal of the transfer from the connected account.
-            # stripe_account=token_company.stripe_account_id,
-            # -------------------------------------------------------------
-            metadata={
-                "refunded_user": token.user.get_full_name() or token.user.username,
-                "refunded_user_id": token.user.id,
-                "refunded_by": request.user.get_full_name() or request.user.username,
-                "reviewer_user_id": request.user.id,
-                "token_id": token.id
-            }
-        )
+        # Keyed on the token, so a token can only ever be refunded once
+        try:
+            refund = stripe_gateway.create_refund(
+                f"refund-token-{token.id}",
+                payment_intent=purchase.stripe_payment_intent_id,
+                amount=amount_to_refund,
+                # --- KEY CHANGE: REMOVED stripe_account parameter ---
+                # Refund is issued from the platform account, which owns the PaymentIntent.
+                # Stripe automatically handles the reversal of the transfer from the connected account.
+                # stripe_account=token_company.stripe_account_id,
+                # -------------------------------------------------------------
+                metadata={
+                    "refunded_user": token.user.get_full_name() or token.user.username,
+                    "refunded_user_id": token.user.id,
+                    "refunded_by": request.user.get_full_name() or request.user.username,
+                    "reviewer_user_id": request.user.id,
+                    "token_id": token.id
+                }
+            )
+        except Exception:
+            release_refund_requests([refund_request.id])
+            raise
 
         # Update token and refund request status in your database
         token.refunded = True
@@ -963,18 +1108,15 @@ def approve_refund_request(request, request_id):
 
     return redirect('view_refund_requests')
 
-# --- Stripe Webhook (No changes needed here for the money flow, as Stripe handles the transfer) ---
-# The existing checkout.session.completed handler will correctly process the metadata
-# and create the TokenPurchase and Token objects.
-# The `session.get('payment_intent')` will still give you the ID of the PaymentIntent
-# that facilitated the transfer and fee.
+# --- Stripe Webhook ---
+# Event handlers (token purchases, onboarding status, booking payments) live in
+# company/webhooks.py and are run by the process_stripe_events worker.
 @csrf_exempt
 def stripe_webhook(request):
     """
     Handles incoming Stripe webhook events.
-    Verifies the webhook signature and processes different event types,
-    such as `checkout.session.completed` for token purchases and `account.updated`
-    for company onboarding status.
+    Verifies the webhook signature, stores the event in the StripeEvent inbox
+    and acknowledges it straight away.
     """
     try:
         logger.info(f"Webhook received! Method: {request.method}, Path: {request.path}")
@@ -1003,125 +1145,13 @@ def stripe_webhook(request):
             logger.error(f"Unexpected error during webhook construction: {e}", exc_info=True)
             return HttpResponseBadRequest(f"Unexpected error: {e}")
 
-        # Handle the event based on its type
-        if event['type'] == 'checkout.session.completed':
-            # This event signifies a successful Stripe Checkout Session
-            session = event['data']['object']
-            logger.info(f"Checkout Session Completed: {session['id']}, Payment Status: {session.get('payment_status')}")
-
-            # Ensure the payment was actually successful before processing
-            if session.get("payment_status") != "paid":
-                logger.warning(f"Payment status is not 'paid' for session {session['id']}. Status: {session.get('payment_status')}. Returning 200.")
-                return HttpResponse(status=200) # Acknowledge webhook but don't process if not paid
-
-            # Extract metadata that you passed during session creation
-            metadata = session.get('metadata', {})
-            user_id = metadata.get('user_id')
-            token_count_str = metadata.get('token_count')
-            company_id = metadata.get('company_id')
-            purchase_type = metadata.get('purchase_type') # Expected to be 'token_purchase'
-
-            logger.info(f"Extracted Metadata: user_id={user_id}, token_count_str={token_count_str}, company_id={company_id}, purchase_type={purchase_type}")
-
-            # Validate critical metadata is present
-            if not all([user_id, token_count_str, company_id, purchase_type]):
-                logger.error(f"Missing required metadata in checkout.session.completed event for session {session['id']}.")
-                return HttpResponseBadRequest("Missing required metadata.")
-
-            # Process only if it's a token purchase (as identified by metadata)
-            if purchase_type == 'token_purchase':
-                try:
-                    token_count = int(token_count_str)
-                    user = User.objects.get(id=user_id)
-                    company = Company.objects.get(company_id=company_id)
-                    logger.info(f"User and Company found: {user.username}, {company.name}")
-
-                    # `session['amount_total']` is the total amount the customer paid (in cents)
-                    total_price_in_currency_units = session['amount_total'] / 100.0
-
-                    # Create the TokenPurchase record in your database
-                    purchase = TokenPurchase.objects.create(
-                        user=user,
-                        company=company,
-                        tokens_bought=token_count,
-                        total_price=total_price_in_currency_units,
-                        # Store the PaymentIntent ID for potential refunds later
-                        stripe_payment_intent_id=session.get('payment_intent')
-                    )
-                    logger.info(f"TokenPurchase created: {purchase.id} for user {user.username}.")
-
-                    # Create individual Token objects
-                    tokens_to_create = [
-                        Token(user=user, company=company, purchase=purchase)
-                        for _ in range(token_count)
-                    ]
-                    Token.objects.bulk_create(tokens_to_create)
-                    logger.info(f"{token_count} Tokens created for user {user.username}.")
-
-                    # Update the user's profile token count
-                    user_profile, created = UserProfile.objects.get_or_create(user=user)
-                    user_profile.token_count += token_count
-                    user_profile.save()
-                    logger.info(f"UserProfile token_count updated for {user.username}. New count: {user_profile.token_count}")
-
-                    # Send confirmation email
-                    send_custom_email(
-                        subject="Token Purchase Confirmation",
-                        message=f"Dear {user.username},\n\nYou have successfully purchased {token_count} tokens for {company.name}. Total price: £{total_price_in_currency_units:.2f}. Thank you for your purchase!\n\nBest regards,\nClassifyBooking Team",
-                        recipient_list=[user.email]
-                    )
-                    logger.info(f"Confirmation email sent to {user.email}.")
-
-                except (User.DoesNotExist, Company.DoesNotExist) as e:
-                    logger.error(f"User or Company not found for checkout.session.completed event (session {session['id']}): {e}", exc_info=True)
-                    return HttpResponseBadRequest(f"User or Company not found: {e}")
-                except Exception as e:
-                    logger.critical(f"Error processing checkout.session.completed event for session {session['id']}: {e}", exc_info=True)
-                    return HttpResponseBadRequest(f"Error processing webhook: {e}")
-            else:
-                logger.warning(f"Unhandled purchase_type '{purchase_type}' in checkout.session.completed event for session {session['id']}.")
-
-
-        elif event['type'] == 'account.updated':
-            # This webhook handles updates to the *Company's* Stripe Connect account.
-            # It keeps your database's onboarding status in sync with Stripe.
-            account = event['data']['object']
-            logger.info(f"Stripe Account updated: {account['id']}")
-            try:
-                # Find the Company by its Stripe account ID
-                company = Company.objects.get(stripe_account_id=account['id'])
-                if account['details_submitted'] and not company.stripe_onboarding_completed:
-                    # If details are now submitted and it wasn't marked complete before
-                    company.stripe_onboarding_completed = True
-                    company.save()
-                    logger.info(f"Company {company.name} ({company.company_id}) onboarding marked complete via webhook.")
-                elif not account['details_submitted'] and company.stripe_onboarding_completed:
-                    # If details are no longer submitted (e.g., Stripe requires more info)
-                    company.stripe_onboarding_completed = False
-                    company.save()
-                    logger.warning(f"Company {company.name} ({company.company_id}) onboarding marked incomplete via webhook (details_submitted is false).")
-            except Company.DoesNotExist:
-                logger.warning(f"Company with Stripe account ID {account['id']} not found for account.updated event.")
-
-        elif event['type'] == 'payment_intent.succeeded':
-            # This block is intended for payments where funds are transferred to the Company's Stripe account,
-            # such as booking payments (which you would implement separately).
-            payment_intent = event['data']['object']
-            logger.info(f"PaymentIntent succeeded: {payment_intent['id']}")
-            booking_id = payment_intent['metadata'].get('booking_id') # Assumes 'booking_id' metadata is set
-            if booking_id:
-                try:
-                    booking = Booking.objects.get(id=booking_id)
-                    booking.status = 0 # Example: Update booking status to 'Confirmed'
-                    booking.save()
-                    logger.info(f"Booking {booking_id} confirmed via webhook for PaymentIntent {payment_intent['id']}.")
-                except Booking.DoesNotExist:
-                    logger.error(f"Booking {booking_id} not found for PaymentIntent {payment_intent['id']}.")
-            else:
-                logger.warning(f"PaymentIntent {payment_intent['id']} succeeded but no booking_id in metadata. This might be a direct payment not related to a specific booking in your system.")
-
-        # Add more event types as needed (e.g., payout.paid, charge.refunded, etc.)
-        # For a full list of events: https://stripe.com/docs/api/events/types
+        # Store the event and acknowledge at once; process_stripe_events does the work.
+        # Stripe retries of an event already in the inbox are acknowledged again and ignored.
+        stripe_event, created = record_stripe_event(payload)
+        if created:
+            logger.info(f"Stripe event {stripe_event.stripe_event_id} ({stripe_event.type}) queued.")
+        else:
+            logger.info(f"Stripe event {stripe_event.stripe_event_id} already received, ignoring redelivery.")
 
     except Exception as e:
         logger.critical(f"CRITICAL: Unhandled exception in Stripe webhook: {e}", exc_info=True)
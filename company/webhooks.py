@@ -0,0 +1,200 @@
+"""
+Stripe webhook inbox. The webhook view only verifies the signature and
+stores the event (see record_stripe_event); the process_stripe_events
+worker then runs the handler for each event type. A handler's writes and
+the event's status commit in one transaction while the event row is
+locked, so every event takes effect exactly once.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from booking.models import Booking
+from utils.email import send_custom_email
+from .models import Company, StripeEvent, TokenPurchase, UserProfile
+from .tokens import issue_tokens
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+MAX_EVENT_ATTEMPTS = 5
+# Retry delay doubles with every failed attempt: 30s, 60s, 120s...
+RETRY_BACKOFF_SECONDS = 30
+
+WEBHOOK_HANDLERS = {}
+
+
+class WebhookEventError(Exception):
+    """The event can never be processed (bad metadata, unknown user...). It is dead-lettered without retries."""
+
+
+def webhook_handler(event_type):
+    """Register a function as the handler for a Stripe event type."""
+    def register(func):
+        WEBHOOK_HANDLERS[event_type] = func
+        return func
+    return register
+
+
+def record_stripe_event(payload):
+    """
+    Store a verified event from its raw JSON body. Returns (stripe_event, created);
+    redeliveries of an event already in the inbox return created=False.
+    """
+    event = json.loads(payload)
+    return StripeEvent.objects.get_or_create(
+        stripe_event_id=event['id'], defaults={'type': event['type'], 'payload': event},
+    )
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """Build a Stripe-Signature header for payload, as Stripe does when delivering a webhook."""
+    if isinstance(payload, bytes):
+        payload = payload.decode()
+    timestamp = int(timestamp or time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def process_stripe_event(stripe_event):
+    """
+    Run the handler for a locked, pending event and record the outcome on it.
+    Must be called inside the transaction holding the row lock.
+    """
+    stripe_event.attempts += 1
+    handler = WEBHOOK_HANDLERS.get(stripe_event.type)
+    try:
+        # A failed handler rolls back to here; the attempt itself is still recorded
+        with transaction.atomic():
+            if handler is not None:
+                handler(stripe_event.payload['data']['object'])
+    except WebhookEventError as e:
+        logger.error(f"Stripe event {stripe_event.stripe_event_id} ({stripe_event.type}) rejected: {e}")
+        stripe_event.status = 'dead'
+        stripe_event.last_error = str(e)
+    except Exception as e:
+        logger.exception(f"Stripe event {stripe_event.stripe_event_id} ({stripe_event.type}) "
+                         f"failed on attempt {stripe_event.attempts}")
+        stripe_event.last_error = f"{type(e).__name__}: {e}"
+        if stripe_event.attempts >= MAX_EVENT_ATTEMPTS:
+            stripe_event.status = 'dead'
+        else:
+            stripe_event.next_attempt_at = timezone.now() + timedelta(
+                seconds=RETRY_BACKOFF_SECONDS * 2 ** (stripe_event.attempts - 1)
+            )
+    else:
+        stripe_event.status = 'processed' if handler is not None else 'ignored'
+        stripe_event.last_error = ''
+        stripe_event.processed_at = timezone.now()
+    stripe_event.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at', 'processed_at'])
+    return stripe_event
+
+
+def process_next_stripe_event(now=None):
+    """
+    Lock the next due event, process it and commit, returning the event or
+    None when nothing is due. skip_locked lets several workers share the inbox.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        stripe_event = StripeEvent.objects.select_for_update(skip_locked=True).filter(
+            status='pending', next_attempt_at__lte=now
+        ).order_by('next_attempt_at', 'id').first()
+        if stripe_event is None:
+            return None
+        return process_stripe_event(stripe_event)
+
+
+def process_pending_stripe_events(limit=None):
+    """Process due events until none are left or limit is reached. Returns the number processed."""
+    count = 0
+    while limit is None or count < limit:
+        if process_next_stripe_event() is None:
+            break
+        count += 1
+    return count
+
+
+@webhook_handler('checkout.session.completed')
+def handle_checkout_session_completed(session):
+    # Acknowledged but not acted on until the payment has actually gone through
+    if session.get('payment_status') != 'paid':
+        logger.warning(f"Checkout session {session['id']} not paid (status {session.get('payment_status')}).")
+        return
+
+    metadata = session.get('metadata') or {}
+    user_id = metadata.get('user_id')
+    token_count = metadata.get('token_count')
+    company_id = metadata.get('company_id')
+    purchase_type = metadata.get('purchase_type')
+    if not all([user_id, token_count, company_id, purchase_type]):
+        raise WebhookEventError(f"Missing required metadata on checkout session {session['id']}.")
+    if purchase_type != 'token_purchase':
+        logger.warning(f"Unhandled purchase_type '{purchase_type}' on checkout session {session['id']}.")
+        return
+
+    try:
+        user = User.objects.get(id=user_id)
+        company = Company.objects.get(company_id=company_id)
+    except (User.DoesNotExist, Company.DoesNotExist) as e:
+        raise WebhookEventError(f"User or Company not found for checkout session {session['id']}: {e}")
+
+    payment_intent = session.get('payment_intent')
+    # A different event for the same payment (e.g. a replay) must not mint tokens twice
+    if payment_intent and TokenPurchase.objects.filter(stripe_payment_intent_id=payment_intent).exists():
+        logger.warning(f"Tokens for PaymentIntent {payment_intent} were already issued.")
+        return
+
+    token_count = int(token_count)
+    # `amount_total` is the total the customer paid, in cents
+    total_price = session['amount_total'] / 100.0
+    purchase = TokenPurchase.objects.create(
+        user=user,
+        company=company,
+        tokens_bought=token_count,
+        total_price=total_price,
+        # Store the PaymentIntent ID for potential refunds later
+        stripe_payment_intent_id=payment_intent,
+    )
+    UserProfile.objects.get_or_create(user=user)
+    issue_tokens(user, company, token_count, purchase=purchase)
+    send_custom_email(
+        subject="Token Purchase Confirmation",
+        message=f"Dear {user.username},\n\nYou have successfully purchased {token_count} tokens for {company.name}. Total price: £{total_price:.2f}. Thank you for your purchase!\n\nBest regards,\nClassifyBooking Team",
+        recipient_list=[user.email]
+    )
+    logger.info(f"{token_count} tokens issued to {user.username} for purchase {purchase.id}.")
+
+
+@webhook_handler('account.updated')
+def handle_account_updated(account):
+    # Keeps the company's Stripe Connect onboarding status in sync with Stripe
+    company = Company.objects.filter(stripe_account_id=account['id']).first()
+    if company is None:
+        logger.warning(f"Company with Stripe account ID {account['id']} not found for account.updated event.")
+        return
+    if bool(account.get('details_submitted')) != company.stripe_onboarding_completed:
+        company.stripe_onboarding_completed = bool(account.get('details_submitted'))
+        company.save()
+        logger.info(f"Company {company.name} ({company.company_id}) onboarding completed: "
+                    f"{company.stripe_onboarding_completed}.")
+
+
+@webhook_handler('payment_intent.succeeded')
+def handle_payment_intent_succeeded(payment_intent):
+    booking_id = (payment_intent.get('metadata') or {}).get('booking_id')
+    if not booking_id:
+        logger.info(f"PaymentIntent {payment_intent['id']} succeeded with no booking_id in metadata.")
+        return
+    booking = Booking.objects.filter(id=booking_id).first()
+    if booking is None:
+        raise WebhookEventError(f"Booking {booking_id} not found for PaymentIntent {payment_intent['id']}.")
+    booking.status = 0  # Confirmed
+    booking.save()
@@ -0,0 +1,62 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from utils.metrics import Histogram, registry, timed_dependency
+
+
+class MetricsMiddlewareTest(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.staff = User.objects.create_user(username='staff', password='testpass', is_staff=True)
+        self.client.login(username='staff', password='testpass')
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_records_latency_and_sql_per_view(self):
+        self.client.get(reverse('home'))
+        body = self.scrape()
+
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_duration_seconds_count{view="home"} 1', body)
+        self.assertIn('http_request_sql_queries_count{view="home"} 1', body)
+        self.assertNotIn('http_request_sql_queries_sum{view="home"} 0', body)
+        self.assertIn('http_request_duration_seconds_bucket{view="home",le="+Inf"} 1', body)
+
+    def test_external_calls_are_charged_to_the_request(self):
+        stripe_call = timed_dependency('stripe', lambda: None)
+
+        def render_calling_stripe(*args, **kwargs):
+            stripe_call()
+            return HttpResponse('ok')
+
+        with patch('homepage.views.render', side_effect=render_calling_stripe):
+            self.client.get(reverse('home'))
+
+        self.assertIn('http_request_external_seconds_count{dependency="stripe",view="home"} 1', self.scrape())
+
+    @override_settings(METRICS_SAMPLE_RATE=0.0)
+    def test_sampling_skips_requests(self):
+        self.client.get(reverse('home'))
+        self.assertNotIn('view="home"', self.scrape())
+
+    def test_endpoint_is_staff_only(self):
+        self.client.logout()
+        User.objects.create_user(username='member', password='testpass')
+        self.client.login(username='member', password='testpass')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+class HistogramTest(TestCase):
+    def test_values_fall_in_inclusive_upper_bucket(self):
+        histogram = Histogram((1, 5))
+        for value in (0, 1, 3, 5, 9):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 2, 1])
+        self.assertEqual(histogram.total, 18)
@@ -1,7 +1,7 @@
 from django.shortcuts import render
 from booking.models import Booking
-from logbook.models import Score, Exercise
-from django.contrib.auth.models import User
+from logbook.models import PersonalRecord, Score, Exercise
+from logbook.leaderboard import get_leaderboard
 from .forms import LeaderboardFilterForm
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
@@ -21,34 +21,32 @@ def home(request):
         bookings = bookings.filter(event__date_of_event__gte=current_date)
         bookings = bookings.order_by('event__date_of_event')
         # Query scores made by the user
-        scores = Score.objects.filter(user=user).order_by('-created_on')
+        scores = Score.objects.filter(user=user).select_related('exercise').order_by('-created_on')[:3]
+        records = PersonalRecord.objects.filter(user=user).select_related('exercise').order_by('exercise__name')
 
-        if request.method == 'GET':
-            leaderboard_filter = LeaderboardFilterForm(request.GET)
-            if leaderboard_filter.is_valid():
-                exercise = leaderboard_filter.cleaned_data.get('exercise')
-                min_reps = leaderboard_filter.cleaned_data.get('min_reps')
-                min_weight = leaderboard_filter.cleaned_data.get('min_weight')
-
-                leaderboard = Score.objects.filter(user__profile=request.user.profile)
-                if exercise:
-                    leaderboard = leaderboard.filter(exercise=exercise)
-                if min_reps:
-                    leaderboard = leaderboard.filter(reps__gte=min_reps)
-                if min_weight:
-                    leaderboard = leaderboard.filter(weight__gte=min_weight)
-            else:
-                leaderboard = Score.objects.filter(user__profile=request.user.profile)
-        else:
-            leaderboard_filter = LeaderboardFilterForm()
-            leaderboard = Score.objects.filter(user__profile=request.user.profile)
+        leaderboard_filter = LeaderboardFilterForm(request.GET)
+        filters = leaderboard_filter.cleaned_data if leaderboard_filter.is_valid() else {}
+        try:
+            page = max(1, int(request.GET.get('page', 1)))
+        except ValueError:
+            page = 1
+        company = request.user.profile.company
+        # Served from the precomputed per-company table (and cache), not the raw scores
+        leaderboard = get_leaderboard(
+            company, exercise=filters.get('exercise'), min_reps=filters.get('min_reps'),
+            min_weight=filters.get('min_weight'), page=page,
+        ) if company else {'entries': [], 'start': 0, 'page': 1, 'has_next': False}
+        query = request.GET.copy()
+        query.pop('page', None)
 
         return render(request, 'homepage/home.html', {
             'exercises': Exercise.objects.all(),
             'bookings': bookings,
             'scores': scores,
+            'records': records,
             'filter': leaderboard_filter,
-            'leaderboard': leaderboard.order_by('-weight', '-reps'),
+            'leaderboard': leaderboard,
+            'leaderboard_query': query.urlencode(),
         })
     else:
         return render(request, 'homepage/home.html')
@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Score, Exercise
+from .models import Score, Exercise, LeaderboardEntry
 
 # Register your models here.
 admin.site.register(Score)
-admin.site.register(Exercise)
\ No newline at end of file
+admin.site.register(Exercise)
+admin.site.register(LeaderboardEntry)
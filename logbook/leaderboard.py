@@ -0,0 +1,164 @@
+"""
+Per-company leaderboards served from LeaderboardEntry, which holds each
+member's best score per exercise. Entries are updated as scores are saved
+and deleted, and pages are cached per company until the next change.
+Pages are only cached when every worker shares the cache; otherwise a
+version bump in one worker would leave the others serving stale pages.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from company.models import UserProfile
+from utils.cache import cache_is_shared
+from .models import LeaderboardEntry, Score
+
+LEADERBOARD_PAGE_SIZE = getattr(settings, 'LEADERBOARD_PAGE_SIZE', 25)
+LEADERBOARD_CACHE_TIMEOUT = getattr(settings, 'LEADERBOARD_CACHE_TIMEOUT', 5 * 60)
+
+BEST_FIRST = ('-weight', '-reps', 'created_on')
+
+
+def _version_key(company_id):
+    return f'leaderboard:{company_id}:version'
+
+
+def _cache_version(company_id):
+    version = cache.get(_version_key(company_id))
+    if version is None:
+        cache.add(_version_key(company_id), uuid.uuid4().hex, None)
+        version = cache.get(_version_key(company_id))
+    return version
+
+
+def invalidate_leaderboard(company_id):
+    # A new version orphans every cached page for the company; they expire on their own
+    if company_id is not None and cache_is_shared():
+        cache.set(_version_key(company_id), uuid.uuid4().hex, None)
+
+
+def refresh_entry(user_id, exercise_id):
+    """Recompute a member's entry for an exercise from all of their scores."""
+    company_id = UserProfile.objects.filter(user_id=user_id).values_list('company_id', flat=True).first()
+    best = Score.objects.filter(user_id=user_id, exercise_id=exercise_id).order_by(*BEST_FIRST).first()
+    previous = LeaderboardEntry.objects.filter(user_id=user_id, exercise_id=exercise_id).first()
+
+    if company_id is None or best is None:
+        if previous:
+            previous.delete()
+    else:
+        LeaderboardEntry.objects.update_or_create(
+            user_id=user_id, exercise_id=exercise_id,
+            defaults={'company_id': company_id, 'score': best, 'weight': best.weight, 'reps': best.reps},
+        )
+    invalidate_leaderboard(company_id)
+    if previous and previous.company_id != company_id:
+        invalidate_leaderboard(previous.company_id)
+
+
+def record_score(score, created=False):
+    """Fold a saved score into the leaderboard, touching the cache only if a best changed."""
+    # An edited score may have been the best for the exercise it used to have
+    moved = None if created else (
+        LeaderboardEntry.objects.filter(score=score).exclude(exercise_id=score.exercise_id).first()
+    )
+    if moved:
+        moved.delete()
+        refresh_entry(moved.user_id, moved.exercise_id)
+
+    entry = LeaderboardEntry.objects.filter(user_id=score.user_id, exercise_id=score.exercise_id).first()
+    if entry is None:
+        refresh_entry(score.user_id, score.exercise_id)
+    elif entry.score_id == score.pk:
+        if (score.weight, score.reps) >= (entry.weight, entry.reps):
+            entry.weight, entry.reps = score.weight, score.reps
+            entry.save(update_fields=['weight', 'reps'])
+            invalidate_leaderboard(entry.company_id)
+        else:
+            # Edited down, so another score may now be the best
+            refresh_entry(score.user_id, score.exercise_id)
+    elif (score.weight, score.reps) > (entry.weight, entry.reps):
+        entry.score, entry.weight, entry.reps = score, score.weight, score.reps
+        entry.save(update_fields=['score', 'weight', 'reps'])
+        invalidate_leaderboard(entry.company_id)
+
+
+def forget_score(score):
+    # The entry cascades away with its score, so a missing entry means the best was deleted
+    if not LeaderboardEntry.objects.filter(user_id=score.user_id, exercise_id=score.exercise_id).exists():
+        refresh_entry(score.user_id, score.exercise_id)
+
+
+def rebuild_leaderboard(company=None, user=None):
+    """
+    Rebuild entries from scratch for a company, a single member, or everyone.
+    Returns the number of entries written.
+    """
+    profiles = UserProfile.objects.filter(company__isnull=False)
+    if company is not None:
+        profiles = profiles.filter(company=company)
+    if user is not None:
+        profiles = profiles.filter(user=user)
+    companies = dict(profiles.values_list('user_id', 'company_id'))
+
+    best = {}
+    scores = Score.objects.filter(user_id__in=companies).order_by(*BEST_FIRST)
+    for score in scores.values('id', 'user_id', 'exercise_id', 'weight', 'reps').iterator():
+        best.setdefault((score['user_id'], score['exercise_id']), score)
+
+    stale = LeaderboardEntry.objects.all()
+    if company is not None:
+        stale = stale.filter(company=company)
+    if user is not None:
+        stale = stale.filter(user=user)
+    with transaction.atomic():
+        stale_companies = set(stale.values_list('company_id', flat=True))
+        stale.delete()
+        entries = LeaderboardEntry.objects.bulk_create([
+            LeaderboardEntry(
+                company_id=companies[score['user_id']], user_id=score['user_id'],
+                exercise_id=score['exercise_id'], score_id=score['id'],
+                weight=score['weight'], reps=score['reps'],
+            )
+            for score in best.values()
+        ], batch_size=5000)
+    for company_id in stale_companies | set(companies.values()):
+        invalidate_leaderboard(company_id)
+    return len(entries)
+
+
+def get_leaderboard(company, exercise=None, min_reps=None, min_weight=None, page=1):
+    """
+    One page of the company's leaderboard, best lifts first. Filters apply
+    to each member's best score. Returns the rows (dicts with username,
+    exercise, weight and reps), the rank offset and whether a next page exists.
+    """
+    size = LEADERBOARD_PAGE_SIZE
+    start = (page - 1) * size
+    shared, rows = cache_is_shared(), None
+    if shared:
+        key = 'leaderboard:{}:{}:{}:{}:{}:{}'.format(
+            company.pk, _cache_version(company.pk), exercise.pk if exercise else '',
+            min_reps or '', min_weight or '', page,
+        )
+        rows = cache.get(key)
+    if rows is None:
+        entries = LeaderboardEntry.objects.filter(company=company)
+        if exercise:
+            entries = entries.filter(exercise=exercise)
+        if min_reps:
+            entries = entries.filter(reps__gte=min_reps)
+        if min_weight:
+            entries = entries.filter(weight__gte=min_weight)
+        # One extra row tells us whether there is a next page without a COUNT
+        rows = [
+            {'username': username, 'exercise': exercise_name, 'weight': weight, 'reps': reps}
+            for username, exercise_name, weight, reps in entries.order_by('-weight', '-reps', 'pk').values_list(
+                'user__username', 'exercise__name', 'weight', 'reps'
+            )[start:start + size + 1]
+        ]
+        if shared:
+            cache.set(key, rows, LEADERBOARD_CACHE_TIMEOUT)
+    return {'entries': rows[:size], 'start': start, 'page': page, 'has_next': len(rows) > size}
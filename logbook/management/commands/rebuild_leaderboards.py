@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from logbook.leaderboard import rebuild_leaderboard
+
+class Command(BaseCommand):
+    help = "Rebuilds every company's leaderboard entries from the scores table."
+
+    def handle(self, *args, **kwargs):
+        written = rebuild_leaderboard()
+        self.stdout.write(self.style.SUCCESS(f"{written} leaderboard entries written"))
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.17 on 2026-10-17 23:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_leaderboard(apps, schema_editor):
+    Score = apps.get_model('logbook', 'Score')
+    UserProfile = apps.get_model('company', 'UserProfile')
+    LeaderboardEntry = apps.get_model('logbook', 'LeaderboardEntry')
+
+    companies = dict(UserProfile.objects.filter(company__isnull=False).values_list('user_id', 'company_id'))
+    best = {}
+    scores = Score.objects.filter(user_id__in=companies).order_by('-weight', '-reps', 'created_on')
+    for score in scores.values('id', 'user_id', 'exercise_id', 'weight', 'reps').iterator():
+        best.setdefault((score['user_id'], score['exercise_id']), score)
+    LeaderboardEntry.objects.bulk_create([
+        LeaderboardEntry(
+            company_id=companies[score['user_id']], user_id=score['user_id'],
+            exercise_id=score['exercise_id'], score_id=score['id'],
+            weight=score['weight'], reps=score['reps'],
+        )
+        for score in best.values()
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company', '0023_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('logbook', '0003_alter_score_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight', models.FloatField()),
+                ('reps', models.PositiveIntegerField()),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to='company.company')),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='logbook.exercise')),
+                ('score', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entry', to='logbook.score')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'exercise', '-weight', '-reps'], name='leaderboard_exercise_idx'), models.Index(fields=['company', '-weight', '-reps'], name='leaderboard_company_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardentry',
+            constraint=models.UniqueConstraint(fields=('user', 'exercise'), name='unique_leaderboard_entry'),
+        ),
+        migrations.RunPython(backfill_leaderboard, migrations.RunPython.noop),
+    ]
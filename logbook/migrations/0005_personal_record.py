@@ -0,0 +1,66 @@
+# Generated by Django 4.2.17 on 2026-10-17 23:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_personal_records(apps, schema_editor):
+    # Same rules as logbook.records, inlined so the migration doesn't depend on app code
+    Score = apps.get_model('logbook', 'Score')
+    PersonalRecord = apps.get_model('logbook', 'PersonalRecord')
+
+    def estimated_1rm(weight, reps):
+        if reps <= 0:
+            return 0.0
+        if reps == 1:
+            return float(weight)
+        return round(weight * (1 + reps / 30), 1)
+
+    records = {}
+    for user_id, exercise_id, weight, reps in Score.objects.values_list(
+        'user_id', 'exercise_id', 'weight', 'reps'
+    ).iterator():
+        record = records.setdefault((user_id, exercise_id), {
+            'best': (weight, reps), 'estimated_1rm': 0.0, 'count': 0,
+        })
+        record['best'] = max(record['best'], (weight, reps))
+        record['estimated_1rm'] = max(record['estimated_1rm'], estimated_1rm(weight, reps))
+        record['count'] += 1
+    PersonalRecord.objects.bulk_create([
+        PersonalRecord(
+            user_id=user_id, exercise_id=exercise_id, best_weight=record['best'][0],
+            best_weight_reps=record['best'][1], estimated_1rm=record['estimated_1rm'],
+            score_count=record['count'],
+        )
+        for (user_id, exercise_id), record in records.items()
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('logbook', '0004_leaderboard_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonalRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('best_weight', models.FloatField()),
+                ('best_weight_reps', models.PositiveIntegerField()),
+                ('estimated_1rm', models.FloatField()),
+                ('score_count', models.PositiveIntegerField(default=0)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='logbook.exercise')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='personal_records', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='personalrecord',
+            constraint=models.UniqueConstraint(fields=('user', 'exercise'), name='unique_personal_record'),
+        ),
+        migrations.RunPython(backfill_personal_records, migrations.RunPython.noop),
+    ]
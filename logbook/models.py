@@ -21,3 +21,51 @@ class Score(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.exercise.name} - {self.reps}"
+
+
+class LeaderboardEntry(models.Model):
+    """
+    A member's best score (heaviest, then most reps) for one exercise,
+    kept in step with Score by the signals in logbook/signals.py.
+    """
+    company = models.ForeignKey('company.Company', on_delete=models.CASCADE,
+                                related_name='leaderboard_entries')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE)
+    score = models.OneToOneField(Score, on_delete=models.CASCADE, related_name='leaderboard_entry')
+    weight = models.FloatField()
+    reps = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'exercise'], name='unique_leaderboard_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['company', 'exercise', '-weight', '-reps'], name='leaderboard_exercise_idx'),
+            models.Index(fields=['company', '-weight', '-reps'], name='leaderboard_company_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.exercise.name} - {self.weight}kg x {self.reps}"
+
+
+class PersonalRecord(models.Model):
+    """
+    A user's bests for one exercise, kept in step with Score by the signals
+    in logbook/signals.py so pages never have to scan the score history.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='personal_records')
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE)
+    best_weight = models.FloatField()
+    best_weight_reps = models.PositiveIntegerField()  # most reps done at best_weight
+    estimated_1rm = models.FloatField()  # Epley, the best over all scores
+    score_count = models.PositiveIntegerField(default=0)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'exercise'], name='unique_personal_record'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.exercise.name} - {self.best_weight}kg"
@@ -0,0 +1,115 @@
+"""
+Personal records per (user, exercise): best weight, the most reps done at
+that weight, and the best estimated one-rep max. New scores are folded in
+with a comparison; edits and deletes that touch the current record fall
+back to recomputing from that user's scores for the exercise. The record
+row is locked while a score is folded in, so scores saved at the same
+time for one (user, exercise) don't overwrite each other's changes.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from .models import PersonalRecord, Score
+
+
+def estimated_1rm(weight, reps):
+    """Epley formula. A single is its own 1RM, and zero reps says nothing."""
+    if reps <= 0:
+        return 0.0
+    if reps == 1:
+        return float(weight)
+    return round(weight * (1 + reps / 30), 1)
+
+
+def _holds_record(record, weight, reps):
+    return weight >= record.best_weight or estimated_1rm(weight, reps) >= record.estimated_1rm
+
+
+def recompute_record(user_id, exercise_id):
+    """Rebuild a record from the user's scores; deletes it when none are left."""
+    scores = list(Score.objects.filter(user_id=user_id, exercise_id=exercise_id).values_list('weight', 'reps'))
+    if not scores:
+        PersonalRecord.objects.filter(user_id=user_id, exercise_id=exercise_id).delete()
+        return None
+    best_weight, best_weight_reps = max(scores)
+    record, _ = PersonalRecord.objects.update_or_create(
+        user_id=user_id, exercise_id=exercise_id,
+        defaults={
+            'best_weight': best_weight,
+            'best_weight_reps': best_weight_reps,
+            'estimated_1rm': max(estimated_1rm(weight, reps) for weight, reps in scores),
+            'score_count': len(scores),
+        },
+    )
+    return record
+
+
+def _locked_record(user_id, exercise_id):
+    return PersonalRecord.objects.select_for_update().filter(user_id=user_id, exercise_id=exercise_id).first()
+
+
+@transaction.atomic
+def add_score(score):
+    record = _locked_record(score.user_id, score.exercise_id)
+    if record is None:
+        return recompute_record(score.user_id, score.exercise_id)
+    record.score_count += 1
+    _fold_in(record, score.weight, score.reps)
+    record.save()
+    return record
+
+
+def _fold_in(record, weight, reps):
+    if (weight, reps) > (record.best_weight, record.best_weight_reps):
+        record.best_weight, record.best_weight_reps = weight, reps
+    record.estimated_1rm = max(record.estimated_1rm, estimated_1rm(weight, reps))
+
+
+@transaction.atomic
+def update_score(score, previous):
+    """previous holds the score's exercise_id, weight and reps before the edit."""
+    if previous['exercise_id'] != score.exercise_id:
+        recompute_record(score.user_id, previous['exercise_id'])
+        return add_score(score)
+
+    record = _locked_record(score.user_id, score.exercise_id)
+    if record is None or _holds_record(record, previous['weight'], previous['reps']):
+        # The edited score may have been the record, so nothing can be ruled out cheaply
+        return recompute_record(score.user_id, score.exercise_id)
+    _fold_in(record, score.weight, score.reps)
+    record.save()
+    return record
+
+
+@transaction.atomic
+def remove_score(score):
+    record = _locked_record(score.user_id, score.exercise_id)
+    if record is None or record.score_count <= 1 or _holds_record(record, score.weight, score.reps):
+        return recompute_record(score.user_id, score.exercise_id)
+    PersonalRecord.objects.filter(pk=record.pk).update(score_count=F('score_count') - 1)
+    return record
+
+
+def rebuild_personal_records(users=None):
+    """Recompute records in bulk, for the given users or everyone. Returns the number written."""
+    scores = Score.objects.all()
+    records = PersonalRecord.objects.all()
+    if users is not None:
+        scores = scores.filter(user__in=users)
+        records = records.filter(user__in=users)
+
+    bests = {}
+    for user_id, exercise_id, weight, reps in scores.values_list(
+        'user_id', 'exercise_id', 'weight', 'reps'
+    ).iterator():
+        record = bests.get((user_id, exercise_id))
+        if record is None:
+            record = bests[(user_id, exercise_id)] = PersonalRecord(
+                user_id=user_id, exercise_id=exercise_id, best_weight=weight, best_weight_reps=reps,
+                estimated_1rm=0.0, score_count=0,
+            )
+        _fold_in(record, weight, reps)
+        record.score_count += 1
+
+    records.delete()
+    return len(PersonalRecord.objects.bulk_create(bests.values(), batch_size=5000))
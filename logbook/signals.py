@@ -0,0 +1,54 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from company.models import UserProfile
+from .leaderboard import forget_score, invalidate_leaderboard, rebuild_leaderboard, record_score
+from .models import LeaderboardEntry, Score
+from .records import add_score, remove_score, update_score
+
+
+@receiver(pre_save, sender=Score)
+def remember_score_state(sender, instance, **kwargs):
+    instance._previous_state = None
+    if instance.pk:
+        instance._previous_state = Score.objects.filter(pk=instance.pk).values(
+            'exercise_id', 'weight', 'reps'
+        ).first()
+
+
+@receiver(post_save, sender=Score)
+def update_leaderboard_on_score_save(sender, instance, created, **kwargs):
+    record_score(instance, created)
+
+
+@receiver(post_save, sender=Score)
+def update_personal_record_on_score_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_state', None)
+    if created or previous is None:
+        add_score(instance)
+    else:
+        update_score(instance, previous)
+
+
+@receiver(post_delete, sender=Score)
+def update_leaderboard_on_score_delete(sender, instance, **kwargs):
+    forget_score(instance)
+
+
+@receiver(post_delete, sender=Score)
+def update_personal_record_on_score_delete(sender, instance, **kwargs):
+    remove_score(instance)
+
+
+@receiver(post_save, sender=UserProfile)
+def move_leaderboard_entries_with_member(sender, instance, **kwargs):
+    # Members who join, leave or switch company take their entries with them
+    entries = LeaderboardEntry.objects.filter(user_id=instance.user_id)
+    if instance.company_id is None:
+        companies = set(entries.values_list('company_id', flat=True))
+        if companies:
+            entries.delete()
+            for company_id in companies:
+                invalidate_leaderboard(company_id)
+    elif entries.exclude(company_id=instance.company_id).exists() or not entries.exists():
+        rebuild_leaderboard(user=instance.user)
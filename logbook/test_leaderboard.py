@@ -0,0 +1,151 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from io import StringIO
+from unittest.mock import patch
+
+from company.models import Company
+from logbook.leaderboard import get_leaderboard
+from logbook.models import Exercise, LeaderboardEntry, Score
+
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        manager = User.objects.create_user(username='manager', password='pass1234')
+        self.company = Company.objects.create(name='Lift Gym', manager=manager)
+        self.other_company = Company.objects.create(name='Other Gym', manager=manager)
+        self.squat = Exercise.objects.create(name='Back Squat')
+        self.deadlift = Exercise.objects.create(name='Deadlift')
+        self.alice = self.member('alice', self.company)
+        self.bob = self.member('bob', self.company)
+
+    def member(self, username, company):
+        user = User.objects.create_user(username=username, password='pass1234')
+        user.profile.company = company
+        user.profile.save()
+        return user
+
+    def entry(self, user, exercise):
+        return LeaderboardEntry.objects.get(user=user, exercise=exercise)
+
+    def test_keeps_only_each_members_best(self):
+        Score.objects.create(user=self.alice, exercise=self.squat, reps=5, weight=100)
+        best = Score.objects.create(user=self.alice, exercise=self.squat, reps=3, weight=120)
+        Score.objects.create(user=self.alice, exercise=self.squat, reps=8, weight=90)
+
+        self.assertEqual(LeaderboardEntry.objects.filter(user=self.alice).count(), 1)
+        self.assertEqual(self.entry(self.alice, self.squat).score, best)
+
+    def test_equal_weight_ranks_more_reps_higher(self):
+        Score.objects.create(user=self.alice, exercise=self.squat, reps=3, weight=100)
+        more_reps = Score.objects.create(user=self.alice, exercise=self.squat, reps=5, weight=100)
+        self.assertEqual(self.entry(self.alice, self.squat).score, more_reps)
+
+    def test_deleting_the_best_falls_back_to_the_next(self):
+        second = Score.objects.create(user=self.alice, exercise=self.squat, reps=5, weight=100)
+        best = Score.objects.create(user=self.alice, exercise=self.squat, reps=3, weight=120)
+
+        best.delete()
+        self.assertEqual(self.entry(self.alice, self.squat).score, second)
+        second.delete()
+        self.assertFalse(LeaderboardEntry.objects.filter(user=self.alice).exists())
+
+    def test_editing_the_best_down_or_to_another_exercise(self):
+        other = Score.objects.create(user=self.alice, exercise=self.squat, reps=5, weight=100)
+        best = Score.objects.create(user=self.alice, exercise=self.squat, reps=3, weight=120)
+
+        best.weight = 80
+        best.save()
+        self.assertEqual(self.entry(self.alice, self.squat).score, other)
+
+        other.exercise = self.deadlift
+        other.save()
+        self.assertEqual(self.entry(self.alice, self.squat).score, best)
+        self.assertEqual(self.entry(self.alice, self.deadlift).score, other)
+
+    def test_entries_follow_a_member_to_a_new_company(self):
+        Score.objects.create(user=self.alice, exercise=self.squat, reps=5, weight=100)
+
+        self.alice.profile.company = self.other_company
+        self.alice.profile.save()
+        self.assertEqual(self.entry(self.alice, self.squat).company, self.other_company)
+
+        self.alice.profile.company = None
+        self.alice.profile.save()
+        self.assertFalse(LeaderboardEntry.objects.filter(user=self.alice).exists())
+
+    @patch('logbook.leaderboard.cache_is_shared', return_value=True)
+    def test_pages_are_cached_until_a_best_changes(self, _):
+        Score.objects.create(user=self.alice, exercise=self.squat, reps=5, weight=100)
+        Score.objects.create(user=self.bob, exercise=self.squat, reps=5, weight=110)
+
+        rows = get_leaderboard(self.company)['entries']
+        self.assertEqual([row['username'] for row in rows], ['bob', 'alice'])
+        with self.assertNumQueries(0):
+            get_leaderboard(self.company)
+
+        # A lighter score doesn't change any best, so the cached page stays valid
+        Score.objects.create(user=self.alice, exercise=self.squat, reps=5, weight=60)
+        with self.assertNumQueries(0):
+            get_leaderboard(self.company)
+
+        Score.objects.create(user=self.alice, exercise=self.squat, reps=1, weight=140)
+        rows = get_leaderboard(self.company)['entries']
+        self.assertEqual([row['username'] for row in rows], ['alice', 'bob'])
+
+    def test_process_local_cache_is_skipped(self):
+        Score.objects.create(user=self.alice, exercise=self.squat, reps=5, weight=100)
+        get_leaderboard(self.company)
+
+        # Another worker's save can't bump this process's version, so every read hits the index
+        with self.assertNumQueries(1):
+            rows = get_leaderboard(self.company)['entries']
+        self.assertEqual([row['username'] for row in rows], ['alice'])
+
+    def test_filters_apply_to_best_scores(self):
+        Score.objects.create(user=self.alice, exercise=self.squat, reps=1, weight=140)
+        Score.objects.create(user=self.bob, exercise=self.squat, reps=5, weight=110)
+        Score.objects.create(user=self.bob, exercise=self.deadlift, reps=5, weight=180)
+
+        rows = get_leaderboard(self.company, exercise=self.squat, min_reps=3)['entries']
+        self.assertEqual([(row['username'], row['weight']) for row in rows], [('bob', 110)])
+        rows = get_leaderboard(self.company, min_weight=150)['entries']
+        self.assertEqual([row['exercise'] for row in rows], ['Deadlift'])
+
+    @patch('logbook.leaderboard.LEADERBOARD_PAGE_SIZE', 1)
+    def test_pages(self):
+        Score.objects.create(user=self.alice, exercise=self.squat, reps=5, weight=100)
+        Score.objects.create(user=self.bob, exercise=self.squat, reps=5, weight=110)
+
+        first = get_leaderboard(self.company, page=1)
+        second = get_leaderboard(self.company, page=2)
+
+        self.assertTrue(first['has_next'])
+        self.assertEqual(first['entries'][0]['username'], 'bob')
+        self.assertFalse(second['has_next'])
+        self.assertEqual((second['start'], second['entries'][0]['username']), (1, 'alice'))
+
+    def test_home_shows_company_leaderboard(self):
+        Score.objects.create(user=self.alice, exercise=self.squat, reps=5, weight=100)
+        Score.objects.create(user=self.bob, exercise=self.squat, reps=5, weight=110)
+        outsider = self.member('carol', self.other_company)
+        Score.objects.create(user=outsider, exercise=self.squat, reps=5, weight=200)
+
+        self.client.login(username='alice', password='pass1234')
+        response = self.client.get(reverse('home'))
+        self.assertEqual(
+            [row['username'] for row in response.context['leaderboard']['entries']], ['bob', 'alice']
+        )
+        self.assertNotContains(response, 'carol')
+
+    def test_rebuild_command_repairs_drift(self):
+        Score.objects.create(user=self.alice, exercise=self.squat, reps=5, weight=100)
+        LeaderboardEntry.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_leaderboards', stdout=out)
+        self.assertIn("1 leaderboard entries written", out.getvalue())
+        self.assertEqual(self.entry(self.alice, self.squat).weight, 100)
@@ -0,0 +1,141 @@
+import threading
+import unittest
+
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from logbook.models import Exercise, PersonalRecord, Score
+from logbook.records import estimated_1rm, rebuild_personal_records
+
+
+class EstimatedOneRepMaxTest(TestCase):
+    def test_epley(self):
+        self.assertEqual(estimated_1rm(100, 5), 116.7)
+        self.assertEqual(estimated_1rm(100, 1), 100.0)
+        self.assertEqual(estimated_1rm(100, 0), 0.0)
+
+
+class PersonalRecordTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifter', password='pass1234')
+        self.squat = Exercise.objects.create(name='Back Squat')
+        self.bench = Exercise.objects.create(name='Bench Press')
+
+    def record(self, exercise=None):
+        return PersonalRecord.objects.get(user=self.user, exercise=exercise or self.squat)
+
+    def log(self, weight, reps, exercise=None):
+        return Score.objects.create(user=self.user, exercise=exercise or self.squat, weight=weight, reps=reps)
+
+    def test_new_scores_update_bests(self):
+        self.log(100, 5)
+        self.log(120, 1)
+        self.log(120, 2)
+        self.log(90, 10)
+
+        record = self.record()
+        self.assertEqual((record.best_weight, record.best_weight_reps), (120, 2))
+        self.assertEqual(record.estimated_1rm, 128.0)  # 120 x 2 beats 90 x 10 (120.0)
+        self.assertEqual(record.score_count, 4)
+
+    def test_lighter_score_only_bumps_the_count(self):
+        self.log(100, 5)
+        with CaptureQueriesContext(connection) as queries:
+            self.log(60, 5)
+        record_queries = [q['sql'] for q in queries.captured_queries if 'logbook_personalrecord' in q['sql']]
+        self.assertEqual(len(record_queries), 2)  # read and update, no scan of the score history
+        self.assertEqual(self.record().best_weight, 100)
+        self.assertEqual(self.record().score_count, 2)
+
+    def test_editing_the_record_down_recomputes(self):
+        self.log(100, 5)
+        best = self.log(140, 1)
+
+        best.weight = 80
+        best.save()
+        record = self.record()
+        self.assertEqual((record.best_weight, record.best_weight_reps, record.estimated_1rm), (100, 5, 116.7))
+        self.assertEqual(record.score_count, 2)
+
+    def test_moving_a_score_to_another_exercise(self):
+        self.log(100, 5)
+        score = self.log(140, 1)
+
+        score.exercise = self.bench
+        score.save()
+        self.assertEqual(self.record().best_weight, 100)
+        self.assertEqual(self.record().score_count, 1)
+        self.assertEqual(self.record(self.bench).best_weight, 140)
+
+    def test_deleting_scores(self):
+        other = self.log(100, 5)
+        light = self.log(60, 5)
+        best = self.log(140, 1)
+
+        light.delete()
+        self.assertEqual(self.record().score_count, 2)
+        best.delete()
+        self.assertEqual((self.record().best_weight, self.record().score_count), (100, 1))
+        other.delete()
+        self.assertFalse(PersonalRecord.objects.exists())
+
+    def test_rebuild_matches_incremental(self):
+        for weight, reps in [(100, 5), (120, 2), (90, 10)]:
+            self.log(weight, reps)
+        self.log(70, 8, self.bench)
+        expected = list(PersonalRecord.objects.order_by('exercise').values_list(
+            'exercise', 'best_weight', 'best_weight_reps', 'estimated_1rm', 'score_count'
+        ))
+
+        self.assertEqual(rebuild_personal_records(users=[self.user]), 2)
+        self.assertEqual(list(PersonalRecord.objects.order_by('exercise').values_list(
+            'exercise', 'best_weight', 'best_weight_reps', 'estimated_1rm', 'score_count'
+        )), expected)
+
+    def test_logbook_and_home_show_records(self):
+        self.log(100, 5)
+        self.client.login(username='lifter', password='pass1234')
+
+        for url in (reverse('open_log'), reverse('home')):
+            response = self.client.get(url)
+            self.assertContains(response, 'Personal Records')
+            self.assertContains(response, '116.7kg')
+
+    def test_edit_and_delete_views_keep_records_current(self):
+        score = self.log(100, 5)
+        self.client.login(username='lifter', password='pass1234')
+
+        self.client.post(reverse('edit_score', args=[score.id]),
+                         {'exercise': self.squat.id, 'reps': 3, 'weight': 110})
+        self.assertEqual(self.record().best_weight, 110)
+        self.client.post(reverse('delete_score', args=[score.id]))
+        self.assertFalse(PersonalRecord.objects.exists())
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Row locking needs PostgreSQL")
+class ConcurrentPersonalRecordTest(TransactionTestCase):
+    def test_scores_saved_together_all_count(self):
+        user = User.objects.create_user(username='racer', password='pass1234')
+        squat = Exercise.objects.create(name='Back Squat')
+        Score.objects.create(user=user, exercise=squat, weight=100, reps=5)
+        barrier = threading.Barrier(8)
+
+        def log(weight):
+            try:
+                barrier.wait()
+                Score.objects.create(user=user, exercise=squat, weight=weight, reps=3)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=log, args=(90 + n * 5,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        record = PersonalRecord.objects.get(user=user, exercise=squat)
+        self.assertEqual(record.score_count, 9)
+        self.assertEqual((record.best_weight, record.best_weight_reps), (125, 3))
@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Exercise, Score
+from .models import Exercise, PersonalRecord, Score
 from .forms import ScoreForm
 from django.contrib import messages
 
@@ -27,6 +27,7 @@ def logbook_view(request):
         return render(request, 'logbook/logbook.html', {
             'exercises': Exercise.objects.all(),
             'scores': scores,
+            'records': PersonalRecord.objects.filter(user=user).select_related('exercise').order_by('exercise__name'),
             'scoreform': scoreform
         })
 
@@ -0,0 +1,17 @@
+"""
+Helpers for deciding whether Django's default cache can hold data that
+several workers must agree on.
+"""
+from django.conf import settings
+
+# Caches that live inside one process: a signal in one worker can't clear another
+# worker's copy, so anything invalidated on write stays stale there until it expires
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared():
+    """True when the default cache is one every worker shares (e.g. Redis or Memcached)."""
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
@@ -1,11 +1,100 @@
-from django.core.mail import send_mail
+import logging
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+MAX_EMAIL_ATTEMPTS = 5
+# Retry delay doubles with every failed attempt: 1, 2, 4, 8 minutes
+RETRY_BACKOFF = timedelta(minutes=1)
+# A claimed email becomes due again after this long, in case the worker died mid-batch
+CLAIM_LEASE = timedelta(minutes=10)
+
 
 def send_custom_email(subject, message, recipient_list):
-    send_mail(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL,
-        recipient_list,
-        fail_silently=False,
-    )
+    """
+    Queue an email in the outbox. It is sent by the send_outbox_emails
+    worker once the surrounding transaction commits.
+    """
+    from company.models import OutboxEmail
+
+    recipients = [address for address in recipient_list if address]
+    if not recipients:
+        logger.warning(f"Email '{subject}' not queued: no recipient address")
+        return None
+    return OutboxEmail.objects.create(subject=subject, body=message, recipients=recipients)
+
+
+def _claim_batch(batch_size, now):
+    from company.models import OutboxEmail
+
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        for email in batch:
+            email.attempts += 1
+            email.next_attempt_at = now + CLAIM_LEASE
+        OutboxEmail.objects.bulk_update(batch, ['attempts', 'next_attempt_at'])
+    return batch
+
+
+def _record_failure(email, error):
+    email.last_error = f"{type(error).__name__}: {error}"
+    if email.attempts >= MAX_EMAIL_ATTEMPTS:
+        email.status = 'dead'
+        logger.error(f"Outbox email {email.pk} dead-lettered after {email.attempts} attempts: {error}")
+    else:
+        email.next_attempt_at = timezone.now() + RETRY_BACKOFF * 2 ** (email.attempts - 1)
+
+
+def send_outbox_batch(batch_size=50):
+    """
+    Send up to batch_size due emails over one SMTP connection.
+    Returns a (sent, failed) tuple.
+    """
+    from company.models import OutboxEmail
+
+    now = timezone.now()
+    batch = _claim_batch(batch_size, now)
+    if not batch:
+        return 0, 0
+
+    sent = failed = 0
+    pending = list(batch)
+    connection = get_connection()
+    try:
+        connection.open()
+        while pending:
+            email = pending.pop(0)
+            message = EmailMessage(
+                email.subject, email.body, settings.DEFAULT_FROM_EMAIL,
+                email.recipients, connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as e:
+                failed += 1
+                _record_failure(email, e)
+            else:
+                sent += 1
+                email.status = 'sent'
+                email.sent_at = timezone.now()
+                email.last_error = ''
+    except Exception as e:
+        # Couldn't connect: everything not yet attempted is retried after backoff
+        logger.error(f"Outbox SMTP connection failed: {e}")
+        for email in pending:
+            failed += 1
+            _record_failure(email, e)
+    finally:
+        connection.close()
+
+    OutboxEmail.objects.bulk_update(batch, ['status', 'sent_at', 'last_error', 'next_attempt_at'])
+    return sent, failed
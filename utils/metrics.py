@@ -0,0 +1,212 @@
+"""
+In-process request metrics exposed in the Prometheus text format.
+
+MetricsMiddleware records, per URL name, request latency, SQL query count
+and time, and time spent calling Stripe, SMTP and Cloudinary. Values are
+aggregated into histograms in this process; scrape every worker's
+/metrics/ endpoint to get the full picture.
+
+Settings:
+    METRICS_ENABLED       turn recording off entirely (default True)
+    METRICS_SAMPLE_RATE   fraction of requests to record, 0.0-1.0 (default 1.0)
+"""
+import functools
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Histograms keyed by (metric name, label values), safe to update from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._help = {}
+
+    def observe(self, name, labels, value, buckets, help_text=''):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+                self._help.setdefault(name, help_text)
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        le = f'le="{bound}"'
+                        lines.append(f"{name}_bucket{{{label_text},{le}}} {cumulative}" if label_text
+                                     else f"{name}_bucket{{{le}}} {cumulative}")
+                    suffix = f"{{{label_text}}}" if label_text else ""
+                    lines.append(f"{name}_sum{suffix} {histogram.total}")
+                    lines.append(f"{name}_count{suffix} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.external = {}
+        self.active = set()
+
+    def add_external(self, dependency, seconds):
+        self.external[dependency] = self.external.get(dependency, 0.0) + seconds
+
+
+def _sql_timer(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.sql_seconds += time.perf_counter() - started
+
+
+def timed_dependency(dependency, func):
+    """Wrap func so time spent in it is charged to the current request under dependency."""
+    if getattr(func, '_metrics_dependency', None):
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        metrics = _current.get()
+        # Nested calls (send_messages opening the connection) are counted once
+        if metrics is None or dependency in metrics.active:
+            return func(*args, **kwargs)
+        metrics.active.add(dependency)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.active.discard(dependency)
+            metrics.add_external(dependency, time.perf_counter() - started)
+
+    wrapper._metrics_dependency = dependency
+    return wrapper
+
+
+_installed = False
+
+
+def install_dependency_timers():
+    """Patch the Stripe, SMTP and Cloudinary entry points once per process."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    from django.core.mail.backends import smtp
+    smtp.EmailBackend.open = timed_dependency('smtp', smtp.EmailBackend.open)
+    smtp.EmailBackend.send_messages = timed_dependency('smtp', smtp.EmailBackend.send_messages)
+
+    try:
+        from stripe import _http_client
+        _http_client.HTTPClient.request_with_retries = timed_dependency(
+            'stripe', _http_client.HTTPClient.request_with_retries
+        )
+    except (ImportError, AttributeError):
+        pass
+
+    try:
+        import cloudinary.uploader
+        from cloudinary.api_client import call_api
+        cloudinary.uploader.call_api = timed_dependency('cloudinary', cloudinary.uploader.call_api)
+        call_api.execute_request = timed_dependency('cloudinary', call_api.execute_request)
+    except (ImportError, AttributeError):
+        pass
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+        self.sample_rate = getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+        if self.enabled:
+            install_dependency_timers()
+
+    def __call__(self, request):
+        # Unsampled requests skip the SQL wrapper and all bookkeeping
+        if not self.enabled or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(_sql_timer):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        labels = {'view': match.view_name if match else '<unresolved>'}
+        registry.observe('http_request_duration_seconds', labels, elapsed, LATENCY_BUCKETS,
+                         'Time spent handling the request.')
+        registry.observe('http_request_sql_queries', labels, metrics.queries, QUERY_COUNT_BUCKETS,
+                         'SQL queries run while handling the request.')
+        registry.observe('http_request_sql_seconds', labels, metrics.sql_seconds, LATENCY_BUCKETS,
+                         'Time spent in SQL while handling the request.')
+        for dependency, seconds in metrics.external.items():
+            registry.observe('http_request_external_seconds', {**labels, 'dependency': dependency},
+                             seconds, LATENCY_BUCKETS,
+                             'Time spent calling Stripe, SMTP or Cloudinary while handling the request.')
+        return response
+
+
+def metrics_view(request):
+    # Staff only; everyone else gets a plain 404 so the endpoint isn't advertised
+    if not request.user.is_staff:
+        raise Http404()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')